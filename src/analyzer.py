@@ -1,18 +1,52 @@
-from openai import OpenAI
+from openai import OpenAI, APITimeoutError
 import re
 import math
+import time
 from config import (
     MAX_TOKENS_TOTAL, 
     MAX_TOKENS_OUTPUT, 
     MAX_TOKENS_PROMPT, 
     SYSTEM_MESSAGE_TOKENS, 
     CHARS_PER_TOKEN,
-    ANALYSIS_MODEL,
-    PROMPT_TEMPLATE_TOKENS
+    PROMPT_TEMPLATE_TOKENS,
+    ANALYSIS_CALL_TIMEOUT,
+    ANALYSIS_FALLBACK,
+    ANALYSIS_FALLBACK_MESSAGE,
+    COMPLETION_CACHE_ENABLED,
+    DEFAULT_PARTY
 )
+from scheduler import chat_scheduler, SchedulerOverloaded, PRIORITY_INTERACTIVE
+from resilience import DeadlineExceeded, call_with_retries
+from canonical import normalize_query
+from completion_cache import completion_key, get_cached_completion, store_completion
+from routing import model_router
+from corpus import party_name
+from tracing import traced
 
 # Constants now imported from config.py
 
+SYSTEM_MESSAGE = "You are an expert political analyst specializing in Canadian {party_name} policies."
+ANALYSIS_TEMPERATURE = 0.5
+
+PROMPT_TEMPLATE = """
+Analyze the following query about the {party_name} platform: "{query}"
+
+I'll provide context from the {party_name} platform document. Use ONLY this information to formulate your response.
+
+Context from {party_name} Platform:
+{context}
+
+Generate a comprehensive analysis that:
+1. Directly answers the query
+2. Highlights key policy points relevant to the question
+3. Provides specific details from the platform
+4. Uses a neutral, informative tone
+5. Uses markdown formatting with **bold** for important points
+6. Is concise but thorough (150 words or less)
+
+Your response:
+"""
+
 
 def estimate_token_count(text):
     """
@@ -32,6 +66,35 @@ def estimate_token_count(text):
     return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
 
 
+def context_token_budget(query):
+    """
+    Tokens left for document context once the query and prompt are accounted for.
+    
+    Args:
+        query (str): The user's query
+        
+    Returns:
+        int: Token budget for the context
+    """
+    query_tokens = estimate_token_count(query)
+    return MAX_TOKENS_PROMPT - SYSTEM_MESSAGE_TOKENS - query_tokens - PROMPT_TEMPLATE_TOKENS
+
+
+def citation(doc):
+    """
+    Header for a document in the prompt: its page ("Pages 4, 17" for collapsed
+    duplicates) and, when the PDF outline gives one, its section title.
+    """
+    pages = doc.get("pages") or [doc["page"]]
+    if len(pages) > 1:
+        label = "Pages " + ", ".join(str(page) for page in pages)
+    else:
+        label = f"Page {doc['page']}"
+    if doc.get("section"):
+        label += f": {doc['section']}"
+    return label
+
+
 def truncate_context(documents, max_tokens):
     """
     Truncate the document context to fit within token limits.
@@ -49,7 +112,7 @@ def truncate_context(documents, max_tokens):
     
     for i, doc in enumerate(documents):
         # Format document text
-        doc_text = f"\nDocument {i+1} (Page {doc['page']}):\n{doc['text']}\n"
+        doc_text = f"\nDocument {i+1} ({citation(doc)}):\n{doc['text']}\n"
         
         # Estimate tokens for this document
         doc_tokens = estimate_token_count(doc_text)
@@ -62,7 +125,7 @@ def truncate_context(documents, max_tokens):
                 # Calculate how many characters we can include
                 max_chars = max_tokens * CHARS_PER_TOKEN
                 truncated_text = doc['text'][:max_chars] + "..."
-                context = f"\nDocument 1 (Page {doc['page']}):\n{truncated_text}\n"
+                context = f"\nDocument 1 ({citation(doc)}):\n{truncated_text}\n"
                 used_documents = 1
             break
         
@@ -81,68 +144,137 @@ def truncate_context(documents, max_tokens):
     return context
 
 
-def generate_analysis(query, documents):
+def build_prompt(query, context, party_name):
     """
-    Generate an analysis of the Liberal Platform based on the query and retrieved documents.
+    Render the analysis prompt.
+    
+    Args:
+        query (str): The user's query
+        context (str): Document context from truncate_context
+        party_name (str): Display name of the party, e.g. "Liberal Party"
+        
+    Returns:
+        str: The prompt text
+    """
+    return PROMPT_TEMPLATE.format(query=query, context=context, party_name=party_name)
+
+
+def fallback_analysis(reason):
+    """
+    Build the response used when the request budget runs out before the analysis.
+    
+    Args:
+        reason (str): Why the analysis could not be generated
+        
+    Returns:
+        dict: Analysis response, marked as degraded
+    """
+    print(f"Analysis fallback: {reason}")
+    if ANALYSIS_FALLBACK == "documents_only":
+        # The caller still returns the retrieved documents
+        return {"response": ANALYSIS_FALLBACK_MESSAGE, "degraded": True}
+    return {"response": f"An error occurred while generating the analysis: {reason}", "degraded": True}
+
+
+@traced("analysis")
+def generate_analysis(query, documents, priority=PRIORITY_INTERACTIVE, deadline=None, party=DEFAULT_PARTY):
+    """
+    Generate an analysis of a party's platform based on the query and retrieved documents.
     
     Args:
         query (str): The user's query
         documents (list): List of retrieved documents
+        priority (int): Scheduling priority for the completion call
+        deadline (Deadline, optional): Request deadline bounding timeouts and retries
+        party (str): Party whose platform the documents come from
         
     Returns:
-        dict: Analysis response containing the generated text
+        dict: Analysis response containing the generated text and, when a model was
+            called or a cached completion used, "metadata" with the model, route,
+            token counts and latency
     """
     # Check input validity
     if not query or not documents:
         return {"response": "Invalid query or no relevant documents found."}
     
+    if deadline is not None and deadline.expired():
+        return fallback_analysis("request budget exhausted before analysis")
+    
     try:
-        # Create OpenAI client
-        client = OpenAI()
-        
-        # Calculate token budget for context
-        query_tokens = estimate_token_count(query)
-        available_context_tokens = MAX_TOKENS_PROMPT - SYSTEM_MESSAGE_TOKENS - query_tokens - PROMPT_TEMPLATE_TOKENS
+        # Create OpenAI client (retries are handled by call_with_retries so they respect the deadline)
+        client = OpenAI(max_retries=0)
         
         # Prepare context from documents with token limiting
-        context = truncate_context(documents, available_context_tokens)
+        context = truncate_context(documents, context_token_budget(query))
         
-        # Create the prompt for analysis
-        prompt = f"""
-Analyze the following query about the Liberal Party platform: "{query}"
-
-I'll provide context from the Liberal Party platform document. Use ONLY this information to formulate your response.
-
-Context from Liberal Party Platform:
-{context}
-
-Generate a comprehensive analysis that:
-1. Directly answers the query
-2. Highlights key policy points relevant to the question
-3. Provides specific details from the platform
-4. Uses a neutral, informative tone
-5. Uses markdown formatting with **bold** for important points
-6. Is concise but thorough (150 words or less)
-
-Your response:
-"""
+        name = party_name(party)
+        system_message = SYSTEM_MESSAGE.format(party_name=name)
+        
+        # Route to a model and output cap for this query type, context size and current latency
+        route = model_router.choose(query, estimate_token_count(context))
+        metadata = {"model": route["model"], "route": route["name"], "query_type": route["query_type"]}
+        
+        # Create the prompt for analysis (whitespace and Unicode forms normalized, wording kept)
+        prompt = build_prompt(normalize_query(query), context, name)
+        
+        # Identical prompts are answered from the shared completion cache; the key is
+        # the exact request sent, so only questions the model would see the same share it
+        cache_key = None
+        if COMPLETION_CACHE_ENABLED:
+            cache_key = completion_key(route["model"], system_message, prompt, ANALYSIS_TEMPERATURE, route["max_tokens"])
+            cached = get_cached_completion(cache_key)
+            if cached is not None:
+                print("Completion cache hit")
+                return {"response": cached, "metadata": dict(metadata, prompt_tokens=0, completion_tokens=0, total_tokens=0, cached=True, latency_ms=0.0)}
+        
+        # Time the upstream call alone for routing, without scheduler queueing,
+        # retry backoff or failed attempts
+        attempt = {}
+        def create(**kwargs):
+            started = time.monotonic()
+            response = client.chat.completions.create(**kwargs)
+            attempt["latency"] = time.monotonic() - started
+            return response
+        
+        # Generate completion through the shared rate-limited scheduler
+        def request(timeout):
+            return chat_scheduler.run(
+                create,
+                priority=priority,
+                wait_timeout=deadline.remaining() if deadline else None,
+                timeout=timeout,
+                model=route["model"],
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=ANALYSIS_TEMPERATURE,
+                max_tokens=route["max_tokens"]
+            )
+        
+        start = time.monotonic()
+        response = call_with_retries(request, ANALYSIS_CALL_TIMEOUT, deadline)
+        latency = time.monotonic() - start
+        content = response.choices[0].message.content
+        
+        # Account for tokens and the successful attempt's latency (feeds the routing policy)
+        tokens = model_router.record(route, attempt.get("latency", latency), getattr(response, "usage", None))
+        metadata.update(tokens, cached=False, latency_ms=round(latency * 1000, 1))
+        print(f"Analysis on {route['model']} ({route['name']}): {tokens['total_tokens']} tokens in {latency:.2f}s")
         
-        # Generate completion
-        response = client.chat.completions.create(
-            model=ANALYSIS_MODEL,
-            messages=[
-                {"role": "system", "content": "You are an expert political analyst specializing in Canadian Liberal Party policies."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.5,
-            max_tokens=MAX_TOKENS_OUTPUT
-        )
+        if cache_key is not None and content:
+            store_completion(cache_key, content)
         
-        return {"response": response.choices[0].message.content}
+        return {"response": content, "metadata": metadata}
     
+    except (DeadlineExceeded, TimeoutError, APITimeoutError) as e:
+        return fallback_analysis(str(e))
+    except SchedulerOverloaded:
+        # Let the API turn overload into a fast 429 instead of a generic error string
+        raise
     except Exception as e:
         # Return error message if analysis generation fails
-        return {"response": f"An error occurred while generating the analysis: {str(e)}"}
+        return {"response": f"An error occurred while generating the analysis: {str(e)}", "degraded": True}
 
 
 if __name__ == "__main__":
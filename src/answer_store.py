@@ -0,0 +1,221 @@
+"""
+Precomputed answers for popular questions.
+
+A batch job runs retrieval and analysis for a list of questions and writes
+the results to data/answers/<index version>.json. At query time the API
+checks this store first, so popular questions are answered with a dict
+lookup instead of an embedding call, a similarity search and a completion.
+Answers are tied to the index version they were computed against and are
+ignored as soon as a different version is being served. Each party has
+its own set of answers in the file.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from canonical import canonicalize_query
+from index_store import DATA_DIR, atomic_write_json, index_manager
+from config import PRECOMPUTE_CONCURRENCY, DEFAULT_PARTY
+
+ANSWERS_DIR = os.path.join(DATA_DIR, "answers")
+DEFAULT_QUESTIONS_FILE = os.path.join(DATA_DIR, "popular_questions.txt")
+
+
+def answers_path(version):
+    """Path of the answer store for an index version."""
+    return os.path.join(ANSWERS_DIR, f"{version}.json")
+
+
+class AnswerStore:
+    """Read-only view of the precomputed answers for the index version being served."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_key = None  # (version, mtime) of the loaded file
+        self._answers = {}
+
+    def _answers_for(self, version):
+        path = answers_path(version)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return {}
+
+        if self._loaded_key != (version, mtime):
+            with self._lock:
+                if self._loaded_key != (version, mtime):
+                    try:
+                        self._answers = read_answers(path)
+                    except Exception as e:
+                        print(f"Error loading answer store {path}: {str(e)}")
+                        self._answers = {}
+                    self._loaded_key = (version, mtime)
+        return self._answers
+
+    def lookup(self, query, party=DEFAULT_PARTY):
+        """
+        Find a precomputed answer for a query.
+
+        Args:
+            query (str): The raw user query
+            party (str): Party the query is about
+
+        Returns:
+            dict: Entry with "analysis" and "similar_documents", or None
+        """
+        version = index_manager.version
+        if version is None:
+            return None
+        return self._answers_for(version).get(party, {}).get(canonicalize_query(query))
+
+    def answers(self, party=DEFAULT_PARTY):
+        """
+        All precomputed answers of a party for the index version being served.
+
+        Returns:
+            dict: Canonical query -> entry ({"query", "analysis", "similar_documents"})
+        """
+        version = index_manager.version
+        if version is None:
+            return {}
+        return self._answers_for(version).get(party, {})
+
+    def __len__(self):
+        version = index_manager.version
+        if version is None:
+            return 0
+        return sum(len(answers) for answers in self._answers_for(version).values())
+
+
+# Shared store for the process
+answer_store = AnswerStore()
+
+
+def read_answers(path):
+    """
+    Read an answer store file.
+
+    Returns:
+        dict: Party -> {canonical query: entry}
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    if "parties" in data:
+        return data["parties"]
+    # Files written before multi-party support hold default party answers only
+    return {DEFAULT_PARTY: data.get("answers", {})}
+
+
+def load_questions(path):
+    """
+    Read a question list: a JSON array of strings, or one question per line.
+
+    Args:
+        path (str): Path to the question file
+
+    Returns:
+        list: Questions, with blank lines and # comments removed
+    """
+    with open(path, "r") as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        return [question for question in json.loads(content) if question.strip()]
+    return [line.strip() for line in content.splitlines() if line.strip() and not line.startswith("#")]
+
+
+def is_storable_answer(documents, analysis):
+    """
+    Whether an answer is good enough to be stored or cached downstream.
+
+    Failures and degraded answers (the fallback message, upstream errors,
+    no analysis or no documents) are never stored, so they get retried.
+
+    Returns:
+        bool: True if the answer may be stored
+    """
+    if not documents or not isinstance(analysis, dict) or analysis.get("degraded"):
+        return False
+    response = analysis.get("response")
+    return isinstance(response, str) and not response.startswith("An error occurred")
+
+
+def precompute_answers(questions, party=DEFAULT_PARTY, max_workers=PRECOMPUTE_CONCURRENCY):
+    """
+    Answer questions offline and add them to the store for the current index version.
+
+    Args:
+        questions (list): Questions to precompute
+        party (str): Party to answer the questions for
+        max_workers (int): Number of questions processed concurrently
+
+    Returns:
+        str: Path of the written answer store
+    """
+    # Imported here so loading the store at query time stays lightweight
+    from corpus import party_name
+    from scheduler import PRIORITY_BATCH
+    from retriever import retrieve_similar_documents
+    from analyzer import generate_analysis
+    from config import TOP_N_DOCUMENTS
+
+    index_manager.reload()
+    version = index_manager.version
+    if version is None:
+        raise RuntimeError("No index is published; run data_processing.py first")
+
+    # One entry per canonical question
+    unique_questions = {}
+    for question in questions:
+        unique_questions.setdefault(canonicalize_query(question), question)
+    print(f"Precomputing {len(unique_questions)} {party_name(party)} answers for index version {version}")
+
+    def answer(question):
+        documents = retrieve_similar_documents(question, top_n=TOP_N_DOCUMENTS, priority=PRIORITY_BATCH, party=party)
+        analysis = generate_analysis(question, documents, priority=PRIORITY_BATCH, party=party)
+        return documents, analysis
+
+    answers = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(answer, question): (key, question) for key, question in unique_questions.items()}
+        for future in as_completed(futures):
+            key, question = futures[future]
+            try:
+                documents, analysis = future.result()
+            except Exception as e:
+                print(f"Error precomputing '{question}': {str(e)}")
+                continue
+            # Never store failures or degraded answers
+            if not is_storable_answer(documents, analysis):
+                print(f"Skipping '{question}': no usable answer")
+                continue
+            answers[key] = {"query": question, "analysis": analysis, "similar_documents": documents}
+            print(f"Precomputed '{question}'")
+
+    if index_manager.version != version:
+        raise RuntimeError(f"Index changed from {version} to {index_manager.version} during precomputation; rerun the job")
+
+    # Merge with answers already stored for this version
+    path = answers_path(version)
+    existing = read_answers(path) if os.path.exists(path) else {}
+    existing.setdefault(party, {}).update(answers)
+
+    os.makedirs(ANSWERS_DIR, exist_ok=True)
+    atomic_write_json(path, {"index_version": version, "created_at": time.time(), "parties": existing})
+    print(f"Saved {len(existing[party])} precomputed {party} answers to {path}")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute answers for popular questions")
+    parser.add_argument("questions", nargs="?", default=DEFAULT_QUESTIONS_FILE,
+                        help="Question file (JSON array or one question per line)")
+    parser.add_argument("--party", default=DEFAULT_PARTY,
+                        help="Party to answer the questions for")
+    parser.add_argument("--workers", type=int, default=PRECOMPUTE_CONCURRENCY,
+                        help="Number of questions processed concurrently")
+    args = parser.parse_args()
+
+    precompute_answers(load_questions(args.questions), party=args.party, max_workers=args.workers)
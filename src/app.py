@@ -1,24 +1,51 @@
 import os
+import hmac
 import json
+import hashlib
+import math
+import asyncio
 import logging
 import traceback
 import uvicorn
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from config import API_HOST, API_PORT
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 from main import Party
+from scheduler import chat_scheduler, embedding_scheduler, SchedulerOverloaded
+from resilience import Deadline
+from answer_store import answer_store, is_storable_answer
+from pipeline import run_query_pipeline
+from retriever import embed_query
+from runtime_stats import collect_stats
+from tracing import TracingMiddleware, TraceIdFilter, timing_fields
+from fast_json import FastJSONResponse, dumps
+from snippets import build_snippet
+from data_processing import get_page_text
+from dedup import strip_boilerplate
+from assets import asset_url, bytes_response, file_digest, file_response, split_hashed_path
+from page_assets import get_page_pdf, get_page_thumbnail, ThumbnailUnavailable, THUMBNAIL_FORMATS, THUMBNAILS_AVAILABLE
+from corpus import list_parties, load_corpus, DOCUMENT_FILE_PATTERN, PARTY_ID_PATTERN
+from ingestion import ingestion_manager, staging_path
+from index_store import index_manager, read_current_version, document_path, document_boilerplate
+from canonical import canonicalize_query
+from suggest import suggestion_index
+from config import ASSET_DIGEST_LENGTH, REQUEST_BUDGET_SECONDS, DEFAULT_PARTY
+from config import INGESTION_MAX_UPLOAD_BYTES, INGESTION_TOKEN_ENV, QUERY_MAX_AGE, QUERY_STALE_WHILE_REVALIDATE
+from config import SUGGEST_LIMIT
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Set up logging, with the trace ID of the request on every line
+logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s:[%(trace_id)s] %(message)s")
+for handler in logging.getLogger().handlers:
+    handler.addFilter(TraceIdFilter())
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Add CORS middleware to allow requests from any origin (for development)
 app.add_middleware(
@@ -29,20 +56,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Trace every request: X-Trace-Id and Server-Timing headers, optional profiling
+app.add_middleware(TracingMiddleware)
+
 # Get current directory and setup data path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 data_dir = os.path.join(current_dir, 'data')
 
-# Mount the data directory for serving PDFs
-app.mount("/data", StaticFiles(directory=data_dir), name="data")
-
-# Initialize the party object
-party = Party()
+# Initialize the party objects. Every party is served from the same index;
+# a Party only restricts retrieval to its rows and sets the analysis prompt.
+party = Party(DEFAULT_PARTY)
+parties = {DEFAULT_PARTY: party}
 
 
 # Define request and response models
 class QueryInput(BaseModel):
     text: str
+    compact: bool = False  # Return snippets with highlight offsets instead of full page text
+    party: Optional[str] = None  # Party id from the corpus; defaults to DEFAULT_PARTY
+    year: Optional[int] = None  # Only search platforms from this year
+
+
+class CompareInput(BaseModel):
+    text: str
+    parties: Optional[List[str]] = None  # Party ids to compare; defaults to every party in the corpus
+    compact: bool = False
+    year: Optional[int] = None
 
 
 class ResponseItem(BaseModel):
@@ -61,49 +100,297 @@ class StatusResponse(BaseModel):
     message: str
 
 
-@app.post("/query")
-async def query(query_input: QueryInput):
+def prepare_documents(similar_docs):
+    """
+    Add frontend compatibility fields and links to lightweight page assets.
+    """
+    for doc in similar_docs:
+        # Transform page_num to page for frontend compatibility
+        if 'page_num' in doc and 'page' not in doc:
+            doc['page'] = doc['page_num']
+            logger.debug(f"Using actual PDF page number: {doc['page']} (Note: Some PDF pages may have been skipped during embedding)")
+        if 'similarity' in doc and 'score' not in doc:
+            doc['score'] = doc['similarity']
+        
+        # Link straight to the cited page instead of the whole platform PDF
+        document = doc.get('document')
+        if document and 'page_url' not in doc:
+            # The copy of the PDF this page was ranked from, even if the document was replaced since
+            pdf_path = document_path(document, doc.get('pdf_version'))
+            if os.path.isfile(pdf_path):
+                stem = os.path.splitext(document)[0]
+                version = file_digest(pdf_path)[:ASSET_DIGEST_LENGTH]
+                doc['page_url'] = f"/pages/{stem}/{doc['page']}.pdf?v={version}"
+                if THUMBNAILS_AVAILABLE:
+                    doc['thumbnail_url'] = f"/pages/{stem}/{doc['page']}.png?v={version}"
+    return similar_docs
+
+
+def compact_documents(query, similar_docs):
+    """
+    Build the lean document payload: one score and page field, a ranked
+    snippet with highlight offsets, and a URL for the full text on demand.
+    """
+    compact = []
+    for doc in similar_docs:
+        item = {
+            "page": doc["page"],
+            "score": round(doc["score"], 4),
+            **build_snippet(doc.get("text", ""), query),
+        }
+        if doc.get("document"):
+            item["document"] = doc["document"]
+            item["text_url"] = f"/pages/{os.path.splitext(doc['document'])[0]}/{doc['page']}.txt"
+            if doc.get("pdf_version"):
+                item["text_url"] += f"?v={doc['pdf_version']}"
+        if len(doc.get("pages") or ()) > 1:
+            item["pages"] = doc["pages"]  # Near-duplicate pages collapsed into this one
+        for field in ("page_url", "thumbnail_url"):
+            if field in doc:
+                item[field] = doc[field]
+        compact.append(item)
+    return compact
+
+
+def present_documents(query_input, similar_docs):
+    """
+    Prepare documents for a response in the format the client asked for.
+    """
+    prepare_documents(similar_docs)
+    return compact_documents(query_input.text, similar_docs) if query_input.compact else similar_docs
+
+
+def stream_event(payload):
+    """
+    Serialize one NDJSON stream event, with the request's timings so far.
+    """
+    timing = timing_fields()
+    if timing:
+        payload = dict(payload, timing=timing)
+    return dumps(payload) + "\n"
+
+
+def get_party(name):
+    """
+    Get the Party for a request, rejecting parties that are not in the corpus.
+    """
+    name = name or DEFAULT_PARTY
+    if name not in parties:
+        if name not in list_parties():
+            raise HTTPException(status_code=404, detail=f"Unknown party: {name}")
+        parties[name] = Party(name)
+    return parties[name]
+
+
+def lookup_precomputed(query_input):
+    """
+    Find a precomputed answer. Answers are computed without a year filter.
+    """
+    if query_input.year is not None:
+        return None
+    return answer_store.lookup(query_input.text, party=query_input.party or DEFAULT_PARTY)
+
+
+def overloaded_exception(retry_after):
+    """
+    Build a 429 telling the client when to retry.
+    """
+    return HTTPException(
+        status_code=429,
+        detail="The service is busy, please retry shortly",
+        headers={"Retry-After": str(math.ceil(retry_after))},
+    )
+
+
+def check_capacity():
+    """
+    Reject a new request up front when the upstream queues are already full.
+    """
+    for scheduler in (embedding_scheduler, chat_scheduler):
+        if scheduler.is_overloaded():
+            logger.warning(f"Rejecting request: {scheduler.name} queue is full")
+            raise overloaded_exception(scheduler.retry_after())
+
+
+def request_deadline(request: Request):
+    """
+    Start the time budget for a request. Clients may ask for a shorter budget
+    with an X-Request-Budget header (seconds), but never a longer one.
+    """
+    budget = REQUEST_BUDGET_SECONDS
+    try:
+        budget = min(budget, float(request.headers.get("x-request-budget", budget)))
+    except ValueError:
+        pass
+    return Deadline(max(0.1, budget))
+
+
+def current_index_version():
+    """
+    Version of the index queries are answered from, or None if none is published.
     """
-    Process a query about the Liberal platform and return results.
+    with index_manager.acquire() as index:
+        return index.version if index is not None else None
+
+
+def query_etag(version, query_input):
+    """
+    Validator for a GET /query response, known before the query is answered.
+
+    Answers are not byte-identical across regenerations, so the tag is weak:
+    it promises the same index version, party, year, canonical query and
+    payload format.
+    """
+    key = [version, query_input.party or DEFAULT_PARTY, query_input.year, canonicalize_query(query_input.text), query_input.compact]
+    return 'W/"' + hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header with an ETag.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+async def answer_query(query_input, request):
+    """
+    Answer a query about a party's platform, from the precomputed answers or the pipeline.
     """
+    query_party = get_party(query_input.party)
+    suggestion_index.record_query(query_input.text)
+    
+    # Popular questions are answered from the precomputed store without any upstream calls
+    precomputed = lookup_precomputed(query_input)
+    if precomputed is not None:
+        logger.info(f"Serving precomputed answer for query: {query_input.text}")
+        return {
+            "analysis": precomputed["analysis"],
+            "similar_documents": present_documents(query_input, [dict(doc) for doc in precomputed["similar_documents"]])
+        }
+    
+    check_capacity()
+    deadline = request_deadline(request)
     try:
         # Log the incoming query
         logger.info(f"Received query: {query_input.text}")
         
-        # Retrieve similar documents
-        logger.info("Retrieving similar documents")
-        similar_docs = party.retrieve(query_input.text)
-        logger.info(f"Found {len(similar_docs)} similar documents")
-        
-        # Generate analysis
-        logger.info("Generating analysis")
-        analysis = party.analyze(query_input.text, similar_docs)
-        logger.info("Analysis generation completed")
-        
-        # Transform page_num to page for frontend compatibility
-        for doc in similar_docs:
-            if 'page_num' in doc and 'page' not in doc:
-                doc['page'] = doc['page_num']
-                logger.debug(f"Using actual PDF page number: {doc['page']} (Note: Some PDF pages may have been skipped during embedding)")
-            if 'similarity' in doc and 'score' not in doc:
-                doc['score'] = doc['similarity']
+        # Retrieve documents and generate the analysis; the analysis starts as soon as
+        # the top documents are loaded (falls back to documents only if the budget runs out)
+        similar_docs, analysis = [], None
+        async for event in run_query_pipeline(query_party, query_input.text, deadline, query_input.year):
+            if event["type"] == "analysis_started":
+                logger.info("Generating analysis")
+            elif event["type"] == "documents":
+                similar_docs = event["documents"]
+                logger.info(f"Found {len(similar_docs)} similar documents")
+            elif event["type"] == "analysis":
+                analysis = event["analysis"]
+                logger.info("Analysis generation completed")
         
         # Return the results
         return {
             "analysis": analysis,
-            "similar_documents": similar_docs
+            "similar_documents": present_documents(query_input, similar_docs)
         }
+    except SchedulerOverloaded as e:
+        logger.warning(f"Upstream overloaded: {str(e)}")
+        raise overloaded_exception(e.retry_after)
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
+@app.post("/query")
+async def query(query_input: QueryInput, request: Request):
+    """
+    Process a query about a party's platform (the Liberal platform by default) and return results.
+    """
+    return await answer_query(query_input, request)
+
+
+@app.get("/query")
+async def query_get(request: Request, q: str, compact: bool = False, party: Optional[str] = None, year: Optional[int] = None):
+    """
+    Cacheable variant of POST /query for browsers, HTTP caches and CDNs.
+
+    The ETag is derived from the index version and the canonical query, so
+    a matching If-None-Match is answered with 304 before any work is done,
+    and shared caches may serve the response for QUERY_MAX_AGE seconds (and
+    a stale copy while revalidating for QUERY_STALE_WHILE_REVALIDATE more).
+    Publishing a new index version changes every ETag. Degraded or failed
+    answers are sent with no-store and no ETag.
+    """
+    query_input = QueryInput(text=q, compact=compact, party=party, year=year)
+    get_party(party)
+    version = await run_in_threadpool(current_index_version)
+    if version is None:
+        # Nothing to cache until an index is published
+        return FastJSONResponse(await answer_query(query_input, request), headers={"Cache-Control": "no-store"})
+
+    etag = query_etag(version, query_input)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={QUERY_MAX_AGE}, stale-while-revalidate={QUERY_STALE_WHILE_REVALIDATE}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    result = await answer_query(query_input, request)
+    if index_manager.version != version:
+        # The index was swapped while answering; this answer doesn't match the ETag
+        headers = {"Cache-Control": "no-store"}
+    elif not is_storable_answer(result["similar_documents"], result["analysis"]):
+        # Only promise what the answer store would keep: degraded and failed
+        # answers must be retried, never revalidated against an ETag
+        headers = {"Cache-Control": "no-store"}
+    return FastJSONResponse(result, headers=headers)
+
+
+@app.get("/suggest")
+def suggest(q: str = "", party: Optional[str] = None, limit: int = SUGGEST_LIMIT):
+    """
+    Typeahead suggestions for a partly typed question.
+
+    Answered from an in-memory prefix index of precomputed and popular
+    questions, section titles and key phrases, without any embedding or
+    model call; what users ask only ranks those higher. Suggestions marked
+    "cached" are answered from the precomputed store.
+    """
+    get_party(party)
+    return FastJSONResponse(
+        {"query": q, "suggestions": suggestion_index.suggest(q, party, limit)},
+        headers={"Cache-Control": "public, max-age=60"},
+    )
+
+
 @app.post("/query-stream")
-async def query_stream(query_input: QueryInput):
+async def query_stream(query_input: QueryInput, request: Request):
     """
     Process a query with streaming response to display results as they become available.
     """
+    query_party = get_party(query_input.party)
+    suggestion_index.record_query(query_input.text)
+    precomputed = lookup_precomputed(query_input)
+    if precomputed is None:
+        check_capacity()
+    deadline = request_deadline(request)
+    
+    async def generate_precomputed():
+        # Same event sequence as a live query, answered from the precomputed store
+        logger.info(f"Serving precomputed answer for streaming query: {query_input.text}")
+        yield stream_event({
+            "status": "partial",
+            "step": "documents_ready",
+            "similar_documents": present_documents(query_input, [dict(doc) for doc in precomputed["similar_documents"]])
+        })
+        yield stream_event({"status": "complete", "analysis": precomputed["analysis"]})
+    
     async def generate():
         try:
             # Log the incoming query
@@ -111,50 +398,56 @@ async def query_stream(query_input: QueryInput):
             
             # Yield initial state with padding to ensure immediate display (browsers sometimes buffer small responses)
             padding = " " * 2048  # Add padding to force browser to start displaying
-            yield json.dumps({"status": "processing", "step": "retrieval", "padding": padding}) + "\n"
+            yield stream_event({"status": "processing", "step": "retrieval", "padding": padding})
             
-            # Retrieve similar documents
+            # Each document is sent as soon as its text is loaded, and the analysis
+            # runs while the remaining documents are loaded and prepared
             logger.info("Retrieving similar documents")
-            similar_docs = party.retrieve(query_input.text)
-            logger.info(f"Found {len(similar_docs)} similar documents")
-            
-            # Transform page_num to page for frontend compatibility
-            for doc in similar_docs:
-                if 'page_num' in doc and 'page' not in doc:
-                    doc['page'] = doc['page_num']
-                if 'similarity' in doc and 'score' not in doc:
-                    doc['score'] = doc['similarity']
-            
-            # Send the documents immediately
-            yield json.dumps({
-                "status": "partial", 
-                "step": "documents_ready",
-                "similar_documents": similar_docs
-            }) + "\n"
-            
-            # Generate analysis
-            logger.info("Generating analysis")
-            yield json.dumps({"status": "processing", "step": "analysis"}) + "\n"
-            
-            analysis = party.analyze(query_input.text, similar_docs)
-            logger.info("Analysis generation completed")
-            
-            # Send the complete results
-            yield json.dumps({
-                "status": "complete",
-                "analysis": analysis,
-            }) + "\n"
+            async for event in run_query_pipeline(query_party, query_input.text, deadline, query_input.year):
+                if event["type"] == "document":
+                    yield stream_event({
+                        "status": "partial",
+                        "step": "document_ready",
+                        "rank": event["rank"],
+                        "document": present_documents(query_input, [dict(event["document"])])[0]
+                    })
+                elif event["type"] == "analysis_started":
+                    logger.info("Generating analysis")
+                    yield stream_event({"status": "processing", "step": "analysis"})
+                elif event["type"] == "documents":
+                    similar_docs = event["documents"]
+                    logger.info(f"Found {len(similar_docs)} similar documents")
+                    # The complete ranked list, for clients that render it at once
+                    yield stream_event({
+                        "status": "partial",
+                        "step": "documents_ready",
+                        "similar_documents": present_documents(query_input, [dict(doc) for doc in similar_docs])
+                    })
+                elif event["type"] == "analysis":
+                    logger.info("Analysis generation completed")
+                    # Send the complete results
+                    yield stream_event({
+                        "status": "complete",
+                        "analysis": event["analysis"],
+                    })
             
+        except SchedulerOverloaded as e:
+            logger.warning(f"Upstream overloaded: {str(e)}")
+            yield stream_event({
+                "status": "error",
+                "message": "The service is busy, please retry shortly",
+                "retry_after": math.ceil(e.retry_after)
+            })
         except Exception as e:
             logger.error(f"Error processing streaming query: {str(e)}")
             logger.error(traceback.format_exc())
-            yield json.dumps({
+            yield stream_event({
                 "status": "error",
                 "message": str(e)
-            }) + "\n"
+            })
     
     return StreamingResponse(
-        generate(),
+        generate_precomputed() if precomputed is not None else generate(),
         media_type="application/x-ndjson",
         headers={
             "Cache-Control": "no-cache, no-transform",
@@ -164,6 +457,280 @@ async def query_stream(query_input: QueryInput):
     )
 
 
+@app.post("/compare")
+async def compare(compare_input: CompareInput, request: Request):
+    """
+    Compare how several parties answer the same query.
+    
+    The query is embedded once, then retrieval and analysis run for every
+    party concurrently. Each party's documents and analysis are streamed as
+    NDJSON events as soon as they are ready, so the total time is close to
+    that of the slowest party.
+    """
+    selected = [get_party(name) for name in dict.fromkeys(compare_input.parties or list_parties() or [DEFAULT_PARTY])]
+    party_inputs = {
+        query_party.name: QueryInput(text=compare_input.text, compact=compare_input.compact, party=query_party.name, year=compare_input.year)
+        for query_party in selected
+    }
+    precomputed = {name: lookup_precomputed(query_input) for name, query_input in party_inputs.items()}
+    if not all(precomputed.values()):
+        check_capacity()
+    deadline = request_deadline(request)
+    
+    async def run_party(query_party, events):
+        # Forward one party's results to the shared queue, then signal completion with None
+        try:
+            answer = precomputed[query_party.name]
+            if answer is not None:
+                await events.put((query_party, {"type": "documents", "documents": [dict(doc) for doc in answer["similar_documents"]]}))
+                await events.put((query_party, {"type": "analysis", "analysis": answer["analysis"]}))
+                return
+            async for event in run_query_pipeline(query_party, compare_input.text, deadline, compare_input.year):
+                if event["type"] in ("documents", "analysis"):
+                    await events.put((query_party, event))
+        except Exception as e:
+            await events.put((query_party, {"type": "error", "error": e}))
+        finally:
+            await events.put((query_party, None))
+    
+    async def generate():
+        logger.info(f"Received comparison query for {[p.name for p in selected]}: {compare_input.text}")
+        yield stream_event({
+            "status": "processing",
+            "step": "retrieval",
+            "parties": [{"id": p.name, "name": p.display_name} for p in selected],
+            "padding": " " * 2048,
+        })
+        
+        events = asyncio.Queue()
+        tasks = []
+        try:
+            # Embed once; every party's retrieval then reuses the cached embedding
+            if not all(precomputed.values()):
+                await run_in_threadpool(embed_query, compare_input.text, deadline)
+            
+            tasks = [asyncio.ensure_future(run_party(query_party, events)) for query_party in selected]
+            remaining = len(tasks)
+            while remaining:
+                query_party, event = await events.get()
+                if event is None:
+                    remaining -= 1
+                elif event["type"] == "documents":
+                    yield stream_event({
+                        "status": "partial",
+                        "step": "documents_ready",
+                        "party": query_party.name,
+                        "similar_documents": present_documents(party_inputs[query_party.name], event["documents"]),
+                    })
+                elif event["type"] == "analysis":
+                    logger.info(f"Comparison analysis ready for {query_party.name}")
+                    yield stream_event({
+                        "status": "partial",
+                        "step": "analysis_ready",
+                        "party": query_party.name,
+                        "party_name": query_party.display_name,
+                        "analysis": event["analysis"],
+                    })
+                elif event["type"] == "error":
+                    error = event["error"]
+                    logger.error(f"Error comparing {query_party.name}: {str(error)}")
+                    message = {"status": "error", "party": query_party.name, "message": str(error)}
+                    if isinstance(error, SchedulerOverloaded):
+                        message.update(message="The service is busy, please retry shortly", retry_after=math.ceil(error.retry_after))
+                    yield stream_event(message)
+            
+            yield stream_event({"status": "complete", "parties": [p.name for p in selected]})
+        except SchedulerOverloaded as e:
+            logger.warning(f"Upstream overloaded: {str(e)}")
+            yield stream_event({
+                "status": "error",
+                "message": "The service is busy, please retry shortly",
+                "retry_after": math.ceil(e.retry_after)
+            })
+        except Exception as e:
+            logger.error(f"Error processing comparison query: {str(e)}")
+            logger.error(traceback.format_exc())
+            yield stream_event({"status": "error", "message": str(e)})
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache, no-transform",
+            "X-Accel-Buffering": "no",
+            "Content-Encoding": "identity"
+        }
+    )
+
+
+@app.get("/parties")
+async def get_parties():
+    """
+    List the parties and platform documents in the corpus.
+    """
+    corpus = load_corpus()
+    return {
+        "default": DEFAULT_PARTY,
+        "parties": [
+            {
+                "id": party_id,
+                "name": name,
+                "documents": [
+                    {key: entry.get(key) for key in ("file", "year", "title")}
+                    for entry in corpus["documents"] if entry.get("party") == party_id
+                ],
+            }
+            for party_id, name in list_parties().items()
+        ],
+    }
+
+
+def check_ingestion_access(request: Request):
+    """
+    Only administrators may add documents: clients must send the token in
+    INGESTION_TOKEN_ENV as a bearer token. Uploads are disabled when it is
+    not set; the peer address is no proof of being local behind a proxy.
+    """
+    token = os.environ.get(INGESTION_TOKEN_ENV)
+    if not token:
+        raise HTTPException(status_code=403, detail=f"Uploads are disabled; set {INGESTION_TOKEN_ENV} to enable them")
+    supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="A valid admin token is required to upload documents")
+
+
+def get_job(job_id):
+    job = ingestion_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return job
+
+
+@app.on_event("startup")
+async def build_missing_index():
+    """
+    Build the corpus index in the background on first start, so no request
+    ever has to wait for ingestion. Every worker runs this hook; the job
+    only builds in the first worker to take the publish lock (the others
+    find its version published), and publishes the legacy embeddings file
+    instead of embedding the corpus again when there is one.
+    """
+    if read_current_version() is None and not ingestion_manager.has_pending("corpus"):
+        job = ingestion_manager.submit_corpus_build(only_if_missing=True)
+        logger.info(f"No index published; building the corpus index as ingestion job {job.id}")
+
+
+@app.get("/documents")
+async def list_documents():
+    """
+    List the corpus documents and recent ingestion jobs.
+    """
+    return {
+        "documents": load_corpus()["documents"],
+        "jobs": [job.to_dict() for job in ingestion_manager.list()],
+    }
+
+
+@app.put("/documents/{file_name}", status_code=202)
+async def upload_document(
+    file_name: str,
+    request: Request,
+    party: str,
+    year: Optional[int] = None,
+    title: Optional[str] = None,
+    name: Optional[str] = None,
+):
+    """
+    Upload a platform PDF (the raw request body) and queue its ingestion.
+
+    The document is saved to the data directory and added to the corpus
+    under the given party once it has been embedded; uploading a file name
+    that already exists replaces that document. Returns the job, whose progress can be polled
+    at /documents/jobs/{id} or streamed from /documents/jobs/{id}/events.
+    """
+    check_ingestion_access(request)
+    if not DOCUMENT_FILE_PATTERN.match(file_name):
+        raise HTTPException(status_code=400, detail="Document names must be plain file names ending in .pdf")
+    if not PARTY_ID_PATTERN.match(party):
+        raise HTTPException(status_code=400, detail="Party ids may only contain lowercase letters, digits, '-' and '_'")
+
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and int(length) > INGESTION_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Documents are limited to {INGESTION_MAX_UPLOAD_BYTES} bytes")
+
+    # Stream the body to a staging file; the ingestion job moves it into place
+    # when the new index version is committed, so the served index never reads
+    # the new PDF with the old page numbers
+    staged_path = staging_path(file_name)
+    size = 0
+    try:
+        with open(staged_path, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > INGESTION_MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Documents are limited to {INGESTION_MAX_UPLOAD_BYTES} bytes")
+                f.write(chunk)
+        with open(staged_path, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                raise HTTPException(status_code=415, detail="The request body must be a PDF document")
+    except BaseException:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        raise
+
+    job = ingestion_manager.submit_document(staged_path, file_name, party, year=year, title=title, name=name)
+    logger.info(f"Queued ingestion job {job.id} for {file_name} ({size} bytes, party {party})")
+    return {
+        **job.to_dict(),
+        "status_url": f"/documents/jobs/{job.id}",
+        "events_url": f"/documents/jobs/{job.id}/events",
+    }
+
+
+@app.get("/documents/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """
+    Report the status and latest progress of an ingestion job.
+    """
+    return get_job(job_id).to_dict()
+
+
+@app.get("/documents/jobs/{job_id}/events")
+async def stream_ingestion_job(job_id: str):
+    """
+    Stream an ingestion job's progress as NDJSON events (queued, running,
+    extracted, embedded, committed or failed), ending when the job finishes.
+    """
+    job = get_job(job_id)
+
+    async def generate():
+        sent = 0
+        while True:
+            events = await run_in_threadpool(job.wait_for_events, sent, 15.0)
+            for event in events:
+                yield dumps(event) + "\n"
+            sent += len(events)
+            if job.finished and sent >= len(job.events):
+                break
+            if not events:
+                # Keep idle connections alive while a long job runs
+                yield dumps({"stage": "heartbeat", "status": job.status}) + "\n"
+        yield dumps({"stage": "complete", "status": job.status, "version": job.version, "error": job.error}) + "\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache, no-transform",
+            "X-Accel-Buffering": "no",
+            "Content-Encoding": "identity"
+        }
+    )
+
+
 @app.post("/clear-cache")
 async def clear_cache():
     """
@@ -178,49 +745,134 @@ async def clear_cache():
         raise HTTPException(status_code=500, detail=f"Error clearing cache: {str(e)}")
 
 
+@app.get("/cache-stats")
+async def cache_stats():
+    """
+    Report query cache sizes and hit ratios, including the hit ratio raw
+    (non-canonicalized) keys would have achieved.
+    """
+    return party.cache_stats()
+
+
+@app.get("/stats")
+async def stats():
+    """
+    Report this worker's index size, cache usage, upstream queues, memory,
+    open files and uptime. Cheap enough to scrape every few seconds.
+    """
+    return await run_in_threadpool(collect_stats)
+
+
+@app.get("/usage-stats")
+async def usage_stats():
+    """
+    Report analysis token usage and completion latency per model.
+    """
+    return party.usage_stats()
+
+
 @app.get("/")
 async def read_root():
     """Serve the index.html file."""
     try:
         with open(os.path.join(current_dir, "index.html"), "r") as file:
-            return HTMLResponse(content=file.read())
+            html = file.read()
+        # Point the page at the content-hashed PDF URL so browsers can cache it forever
+        html = html.replace("/data/Liberal.pdf", asset_url(data_dir, "Liberal.pdf"))
+        return HTMLResponse(content=html, headers={"Cache-Control": "no-cache"})
     except Exception as e:
         logger.error(f"Error serving index.html: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error reading index.html: {str(e)}")
 
 
-@app.get("/data/{file_path:path}")
-async def get_file(file_path: str):
+@app.get("/assets/manifest")
+async def asset_manifest():
+    """
+    Map each PDF in the data directory to its content-hashed URL.
+    """
+    return {
+        name: asset_url(data_dir, name)
+        for name in sorted(os.listdir(data_dir))
+        if name.lower().endswith(".pdf")
+    }
+
+
+@app.api_route("/data/{file_path:path}", methods=["GET", "HEAD"])
+async def get_file(file_path: str, request: Request):
     """
     Serve files from the data directory.
-    This route is a fallback in case the StaticFiles mounting doesn't work.
+    Content-hashed names (e.g. Liberal.<digest>.pdf) are cached as immutable;
+    plain names are revalidated with a strong ETag. Both support byte ranges.
     """
+    relative_path, digest = split_hashed_path(file_path)
+    full_path = os.path.realpath(os.path.join(data_dir, relative_path))
+    
+    # Never serve anything outside the data directory
+    if os.path.commonpath([full_path, os.path.realpath(data_dir)]) != os.path.realpath(data_dir) or not os.path.isfile(full_path):
+        logger.error(f"File not found: {file_path}")
+        raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
+    
     try:
-        file_path = os.path.join(data_dir, file_path)
-        logger.info(f"Serving file: {file_path}")
-        
-        if not os.path.exists(file_path):
-            logger.error(f"File not found: {file_path}")
-            raise HTTPException(status_code=404, detail=f"File not found: {file_path}")
+        if digest is not None:
+            if not file_digest(full_path).startswith(digest):
+                # Stale hashed URL: send the client to the current content
+                return RedirectResponse(asset_url(data_dir, relative_path), status_code=307)
         
-        # Special handling for PDF files to ensure proper content type
-        if file_path.lower().endswith('.pdf'):
-            return FileResponse(
-                path=file_path,
-                media_type="application/pdf",
-                headers={
-                    "Content-Disposition": "inline; filename=" + os.path.basename(file_path),
-                    "Cache-Control": "no-cache",
-                    "Content-Type": "application/pdf"
-                }
-            )
-        
-        return FileResponse(file_path)
+        media_type = "application/pdf" if full_path.lower().endswith('.pdf') else None
+        return file_response(request, full_path, immutable=digest is not None, media_type=media_type)
     except Exception as e:
         logger.error(f"Error serving file {file_path}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error serving file: {str(e)}")
 
 
+@app.get("/pages/{document}/{page_file}")
+def get_page_asset(document: str, page_file: str, request: Request, v: str = None):
+    """
+    Serve a single cited page as a one-page PDF ({page}.pdf), a thumbnail
+    ({page}.png / {page}.webp) or its plain text ({page}.txt, used by compact
+    query responses, without the headers and footers stripped at ingest time). Generated assets are kept in a disk cache. The page is
+    read from the stored copy of the document named by v, so page numbers
+    from an index version that has since been replaced still match.
+    """
+    page_text, _, extension = page_file.partition(".")
+    # A page URL names the content version its page number refers to
+    document_file = os.path.basename(document) + ".pdf"
+    pdf_path = document_path(document_file, v)
+    if not page_text.isdigit() or not os.path.isfile(pdf_path):
+        raise HTTPException(status_code=404, detail=f"Page not found: {document}/{page_file}")
+    page_num = int(page_text)
+    
+    try:
+        digest = file_digest(pdf_path)
+        if extension == "pdf":
+            content = get_page_pdf(pdf_path, page_num)
+            media_type = "application/pdf"
+        elif extension == "txt":
+            # The text prompts and snippets use: running headers and footers stripped
+            text = strip_boilerplate(get_page_text(pdf_path, page_num), document_boilerplate(document_file, pdf_path))
+            content = text.encode("utf-8")
+            media_type = "text/plain; charset=utf-8"
+        elif extension in THUMBNAIL_FORMATS:
+            content = get_page_thumbnail(pdf_path, page_num, image_format=extension)
+            media_type = f"image/{extension}"
+        else:
+            raise HTTPException(status_code=404, detail=f"Unsupported page format: {extension}")
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ThumbnailUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    return bytes_response(
+        request,
+        content,
+        etag=f"{digest[:32]}-{page_num}-{extension}",
+        media_type=media_type,
+        # Only URLs carrying the current content version, exactly as present_documents
+        # builds them, can be cached forever
+        immutable=v == digest[:ASSET_DIGEST_LENGTH],
+    )
+
+
 @app.get("/health")
 async def health_check():
     """
@@ -0,0 +1,242 @@
+"""
+Cache-friendly delivery of files from the data directory.
+
+Files are fingerprinted by content so they can be served from hashed URLs
+(e.g. /data/Liberal.3f2a9c1d0b7e.pdf) with long-lived immutable caching,
+strong ETags for revalidation, HTTP Range requests for incremental PDF
+loading, and precompressed gzip variants where compression actually helps.
+"""
+import gzip
+import hashlib
+import os
+import re
+import threading
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from config import ASSET_DIGEST_LENGTH, ASSET_MAX_AGE, PRECOMPRESS_MIN_SAVINGS
+
+CHUNK_SIZE = 64 * 1024
+
+# Matches "<name>.<digest>.<ext>" as produced by asset_url
+HASHED_NAME_PATTERN = re.compile(r"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<ext>\.[^./]+)$" % ASSET_DIGEST_LENGTH)
+
+# (path) -> (mtime_ns, size, digest); recomputed only when the file changes
+_fingerprints = {}
+# digest -> path of the gzip variant, or None if compression is not worthwhile
+_precompressed = {}
+_lock = threading.Lock()
+
+
+def file_digest(path):
+    """
+    Get the content digest of a file, hashing it only when it has changed.
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        str: Hex SHA-256 digest of the file contents
+    """
+    stat = os.stat(path)
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    _fingerprints[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def asset_url(data_dir, relative_path):
+    """
+    Build the content-hashed URL for a file in the data directory.
+
+    Args:
+        data_dir (str): The data directory
+        relative_path (str): File path relative to the data directory
+
+    Returns:
+        str: URL such as /data/Liberal.3f2a9c1d0b7e.pdf
+    """
+    digest = file_digest(os.path.join(data_dir, relative_path))[:ASSET_DIGEST_LENGTH]
+    stem, ext = os.path.splitext(relative_path)
+    return f"/data/{stem}.{digest}{ext}"
+
+
+def split_hashed_path(relative_path):
+    """
+    Split a hashed asset path into the real path and the digest.
+
+    Returns:
+        tuple: (relative_path, digest) where digest is None for unhashed paths
+    """
+    directory, name = os.path.split(relative_path)
+    match = HASHED_NAME_PATTERN.match(name)
+    if not match:
+        return relative_path, None
+    return os.path.join(directory, match.group("stem") + match.group("ext")), match.group("digest")
+
+
+def _gzip_variant(path, digest):
+    """Return the path of a gzip variant for the file, creating it once if worthwhile."""
+    if digest in _precompressed:
+        return _precompressed[digest]
+
+    with _lock:
+        if digest in _precompressed:
+            return _precompressed[digest]
+
+        variant_dir = os.path.join(os.path.dirname(path), ".precompressed")
+        variant_path = os.path.join(variant_dir, f"{digest}.gz")
+        if not os.path.exists(variant_path):
+            os.makedirs(variant_dir, exist_ok=True)
+            with open(path, "rb") as f:
+                data = gzip.compress(f.read(), compresslevel=9, mtime=0)
+            tmp_path = f"{variant_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, variant_path)
+
+        # PDFs are usually already compressed internally; only keep real wins
+        savings = 1 - os.path.getsize(variant_path) / max(1, os.path.getsize(path))
+        if savings < PRECOMPRESS_MIN_SAVINGS:
+            os.remove(variant_path)
+            variant_path = None
+        _precompressed[digest] = variant_path
+        return variant_path
+
+
+def _parse_range(range_header, size):
+    """
+    Parse a single-range "bytes=" header.
+
+    Returns:
+        tuple: (start, end) inclusive, None to ignore the header, or "invalid"
+    """
+    if not range_header.startswith("bytes="):
+        return None
+    ranges = range_header[len("bytes="):].split(",")
+    if len(ranges) != 1:
+        # Multipart ranges are rare for PDF viewers; serve the full file instead
+        return None
+
+    start_text, _, end_text = ranges[0].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                return "invalid"
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+def _read_range(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, path, immutable=False, media_type=None):
+    """
+    Serve a file with strong ETags, conditional requests and Range support.
+
+    Args:
+        request (Request): The incoming request
+        path (str): Absolute path of the file to serve
+        immutable (bool): Whether the URL is content-hashed and can be cached forever
+        media_type (str, optional): Content type of the file
+
+    Returns:
+        Response: 200, 206, 304 or 416 response
+    """
+    digest = file_digest(path)
+    size = os.path.getsize(path)
+    etag = f'"{digest[:32]}"'
+
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+        # Hashed URLs never change; plain URLs are revalidated cheaply with the ETag
+        "Cache-Control": f"public, max-age={ASSET_MAX_AGE}, immutable" if immutable else "no-cache",
+    }
+    if media_type == "application/pdf":
+        headers["Content-Disposition"] = "inline; filename=" + os.path.basename(path)
+
+    # Conditional request: the client already has this exact content
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        if etag in tags or f'"{digest[:32]}-gz"' in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+
+    # Byte ranges, unless If-Range says the client's copy is stale
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range == "invalid":
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                _read_range(path, start, end),
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+
+    # Full download: prefer a precompressed variant when the client accepts it
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        variant_path = _gzip_variant(path, digest)
+        if variant_path:
+            headers["ETag"] = f'"{digest[:32]}-gz"'
+            headers["Content-Encoding"] = "gzip"
+            return FileResponse(variant_path, media_type=media_type, headers=headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+def bytes_response(request: Request, content, etag, media_type, immutable=False):
+    """
+    Serve generated content with a strong ETag and conditional request support.
+
+    Args:
+        request (Request): The incoming request
+        content (bytes): Response body
+        etag (str): Strong validator for the content (without quotes)
+        media_type (str): Content type
+        immutable (bool): Whether the URL is versioned and can be cached forever
+
+    Returns:
+        Response: 200 or 304 response
+    """
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={ASSET_MAX_AGE}, immutable" if immutable else "no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (headers["ETag"] in {tag.strip() for tag in if_none_match.split(",")} or if_none_match.strip() == "*"):
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
@@ -0,0 +1,451 @@
+"""
+Cache backends for the query caches, from per-worker to cluster-wide.
+
+CACHE_BACKEND selects where query embeddings and retrieval results live:
+
+- "memory": a dict in each worker, as before. Nothing is shared.
+- "sqlite": one SQLite file in data/.cache, shared by the workers on a host.
+- "redis": any server speaking the Redis protocol (RESP), shared by every
+  node. The client is built in, so no extra package is needed.
+
+Keys are namespaced as <CACHE_NAMESPACE>:<generation>:<region>:<key parts>.
+Clearing the caches bumps the generation counter stored in the backend,
+so every worker sharing the backend moves to fresh keys within
+CACHE_GENERATION_CHECK_INTERVAL seconds. Retrieval results carry the index
+version as their first key part, so results computed against an old index
+are never read again and are dropped when the version is swapped out.
+
+A backend that fails (e.g. Redis is unreachable) is treated as a miss and
+never fails a request.
+"""
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote, unquote, urlparse
+
+from index_store import DATA_DIR
+from config import (
+    CACHE_BACKEND, CACHE_NAMESPACE, CACHE_TTL, CACHE_GENERATION_CHECK_INTERVAL,
+    CACHE_SQLITE_MAX_ENTRIES, CACHE_REDIS_URL, CACHE_REDIS_TIMEOUT, CACHE_REDIS_RETRY_INTERVAL,
+)
+
+CACHE_SQLITE_PATH = os.path.join(DATA_DIR, ".cache", "queries.sqlite")
+
+
+def approximate_bytes(value):
+    """Approximate memory held by a cached value (containers, strings and numbers)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_bytes(key) + approximate_bytes(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], float):
+            # Embedding vectors: one float object per element
+            size += len(value) * sys.getsizeof(0.0)
+        else:
+            size += sum(approximate_bytes(item) for item in value)
+    return size
+
+
+def _encode(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class MemoryBackend:
+    """Least-recently-used dict in this process."""
+
+    name = "memory"
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        # key -> (expires at, value, approximate bytes), oldest first; sizes are measured once, on set
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] < time.time():
+                return None
+            self._entries[key] = entry  # Most recently used goes last
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+            self._entries[key] = (time.time() + ttl if ttl else None, value, approximate_bytes(value))
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def incr(self, name):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._counters[name]
+
+    def stats(self, prefix):
+        with self._lock:
+            sizes = [entry[2] for key, entry in self._entries.items() if key.startswith(prefix)]
+        return {"entries": len(sizes), "bytes": sum(sizes)}
+
+
+class SQLiteBackend:
+    """
+    Least-recently-used table in one SQLite file, shared by the processes on a host.
+
+    Values are stored as JSON. WAL mode lets readers proceed while a worker
+    writes; each thread gets its own connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed_at REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        with self._connection() as db:
+            row = db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < time.time():
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, _encode(value), now + ttl if ttl else None, now),
+            )
+            # Trim in the same write transaction, so no worker ever leaves the table over max_entries
+            (count,) = db.execute("SELECT COUNT(*) FROM entries").fetchone()
+            if count > self.max_entries:
+                self._evict(db)
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones over max_entries."""
+        with self._connection() as db:
+            self._evict(db)
+
+    def _evict(self, db):
+        db.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+        (count,) = db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count > self.max_entries:
+            db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def delete_prefix(self, prefix):
+        with self._connection() as db:
+            db.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def counter(self, name):
+        row = self._connection().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, name):
+        with self._connection() as db:
+            db.execute(
+                "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+                (name,),
+            )
+            return db.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+
+    def stats(self, prefix):
+        row = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries WHERE substr(key, 1, ?) = ?",
+            (len(prefix), prefix),
+        ).fetchone()
+        return {"entries": row[0], "bytes": row[1]}
+
+
+class RespError(Exception):
+    """An error reply from a Redis-protocol server."""
+
+
+class RespConnection:
+    """One connection to a Redis-protocol server, speaking just enough RESP for the cache."""
+
+    def __init__(self, host, port, db=0, password=None, timeout=CACHE_REDIS_TIMEOUT):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.sock.makefile("rb")
+        if password:
+            self.execute("AUTH", password)
+        if db:
+            self.execute("SELECT", db)
+
+    def execute(self, *args):
+        """Send one command and return its reply (bytes, int, list or None)."""
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.sock.sendall(b"".join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            raise RespError(payload.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise ConnectionError(f"Unexpected reply from the cache server: {line!r}")
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend:
+    """
+    Entries on a Redis-protocol server, shared by every node.
+
+    Values are stored as JSON with a TTL; eviction is left to the server
+    (configure a maxmemory policy such as volatile-lru, which never evicts
+    the generation counter). Each thread keeps its own connection.
+    """
+
+    name = "redis"
+
+    def __init__(self, url=CACHE_REDIS_URL, timeout=CACHE_REDIS_TIMEOUT):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.timeout = timeout
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def _execute(self, *args):
+        if time.monotonic() < self._down_until:
+            raise ConnectionError(f"cache server {self.host}:{self.port} is unavailable")
+        connection = getattr(self._local, "connection", None)
+        try:
+            if connection is None:
+                connection = RespConnection(self.host, self.port, self.db, self.password, self.timeout)
+                self._local.connection = connection
+            return connection.execute(*args)
+        except (OSError, ConnectionError):
+            # Don't make every request wait on a server that is down; reconnect after a pause
+            self._down_until = time.monotonic() + CACHE_REDIS_RETRY_INTERVAL
+            if connection is not None:
+                connection.close()
+            self._local.connection = None
+            raise
+
+    def get(self, key):
+        value = self._execute("GET", key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self._execute("SET", key, _encode(value), "PX", int(ttl * 1000))
+        else:
+            self._execute("SET", key, _encode(value))
+
+    def delete_prefix(self, prefix):
+        # Keys are quoted, so the prefix holds no glob characters
+        cursor = b"0"
+        while True:
+            cursor, keys = self._execute("SCAN", cursor, "MATCH", f"{prefix}*", "COUNT", 500)
+            if keys:
+                self._execute("DEL", *keys)
+            if cursor == b"0":
+                return
+
+    def counter(self, name):
+        value = self._execute("GET", name)
+        return int(value) if value is not None else 0
+
+    def incr(self, name):
+        return self._execute("INCR", name)
+
+    def stats(self, prefix):
+        # Counting one namespace would mean scanning the whole keyspace
+        return {"entries": None, "bytes": None}
+
+
+_shared_backends = {}
+_shared_lock = threading.Lock()
+
+
+def create_backend(name=CACHE_BACKEND, max_entries=CACHE_SQLITE_MAX_ENTRIES):
+    """
+    Get a cache backend.
+
+    Args:
+        name (str): "memory", "sqlite" or "redis"
+        max_entries (int): Size of a new memory backend (each call creates
+            one); shared backends are created once per process
+
+    Returns:
+        The backend
+    """
+    if name == "memory":
+        return MemoryBackend(max_entries)
+    with _shared_lock:
+        if name not in _shared_backends:
+            if name == "sqlite":
+                _shared_backends[name] = SQLiteBackend(CACHE_SQLITE_PATH, CACHE_SQLITE_MAX_ENTRIES)
+            elif name == "redis":
+                _shared_backends[name] = RedisBackend(CACHE_REDIS_URL)
+            else:
+                raise ValueError(f"Unknown cache backend: {name}")
+        return _shared_backends[name]
+
+
+class CacheGeneration:
+    """
+    Generation counter shared through a backend.
+
+    The counter is read at most every check_interval seconds, so a clear
+    on one worker reaches the others within that interval.
+    """
+
+    def __init__(self, backend, name=f"{CACHE_NAMESPACE}:generation", check_interval=CACHE_GENERATION_CHECK_INTERVAL):
+        self.backend = backend
+        self.name = name
+        self.check_interval = check_interval
+        self._value = 0
+        self._checked_at = None
+
+    def current(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            try:
+                self._value = self.backend.counter(self.name)
+            except Exception as e:
+                print(f"Error reading cache generation from {self.backend.name}: {str(e)}")
+        return self._value
+
+    def bump(self):
+        """Move every worker sharing the backend to fresh keys."""
+        self._value = self.backend.incr(self.name)
+        self._checked_at = time.monotonic()
+        return self._value
+
+
+class SharedCache:
+    """
+    One region of cached values (e.g. query embeddings), keyed by tuples.
+
+    Lookups and stores never raise: backend errors are reported and treated
+    as misses.
+    """
+
+    def __init__(self, backend, region, generation, ttl=CACHE_TTL):
+        self.backend = backend
+        self.region = region
+        self.generation = generation
+        self.ttl = ttl
+
+    def prefix(self):
+        return f"{CACHE_NAMESPACE}:{self.generation.current()}:{self.region}:"
+
+    def _key(self, key):
+        return self.prefix() + ":".join(quote(str(part), safe="") for part in key)
+
+    def get(self, key):
+        """The cached value, or None on a miss."""
+        try:
+            return self.backend.get(self._key(key))
+        except Exception as e:
+            print(f"Error reading {self.region} cache from {self.backend.name}: {str(e)}")
+            return None
+
+    def set(self, key, value):
+        try:
+            self.backend.set(self._key(key), value, ttl=self.ttl)
+        except Exception as e:
+            print(f"Error writing {self.region} cache to {self.backend.name}: {str(e)}")
+
+    def drop(self, *leading):
+        """Remove the entries whose keys start with these parts, e.g. the results of one index version."""
+        try:
+            self.backend.delete_prefix(self._key(leading) + ":")
+        except Exception as e:
+            print(f"Error invalidating {self.region} cache in {self.backend.name}: {str(e)}")
+
+    def clear(self):
+        """Clear the region for every worker sharing the backend."""
+        clear_regions([self])
+
+    def stats(self):
+        """Entries and bytes in the region (None where the backend can't count them cheaply)."""
+        try:
+            return {"backend": self.backend.name, **self.backend.stats(self.prefix())}
+        except Exception as e:
+            print(f"Error reading {self.region} cache stats from {self.backend.name}: {str(e)}")
+            return {"backend": self.backend.name, "entries": None, "bytes": None}
+
+
+def clear_regions(caches):
+    """
+    Clear regions that share one generation counter, for every worker.
+
+    The generation is bumped once, so all workers move to fresh keys, and
+    the entries of the old generation are deleted to free the space.
+
+    Args:
+        caches (list): SharedCache regions using the same generation
+    """
+    stale = [(cache, cache.prefix()) for cache in caches]
+    try:
+        caches[0].generation.bump()
+        for cache, prefix in stale:
+            cache.backend.delete_prefix(prefix)
+    except Exception as e:
+        print(f"Error clearing caches in {caches[0].backend.name}: {str(e)}")
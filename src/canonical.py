@@ -0,0 +1,80 @@
+"""
+Query canonicalization for cache keys.
+
+Questions that differ only in case, spacing, punctuation or conversational
+filler ("tell me about", "please") should share one cache entry, so every
+cache lookup goes through canonicalize_query first. The canonical form is
+only ever a key: what gets embedded or sent to the model is the query
+itself (normalize_query), so the filler rules never change what a
+question means.
+"""
+import re
+import unicodedata
+
+from config import QUERY_STOP_PHRASES, QUERY_TRAILING_STOP_PHRASES
+
+_WHITESPACE = re.compile(r"\s+")
+# Punctuation that never changes the meaning of a search (keeps hyphens, apostrophes
+# and dots inside words, so "U.S." and "2.5" stay whole)
+_PUNCTUATION = re.compile(r"[^\w\s'\-.]|(?<!\w)['\-.]|['\-.](?!\w)", re.UNICODE)
+
+
+def normalize_query(text):
+    """
+    Lightly normalize a query for embedding: Unicode NFKC and collapsed whitespace.
+
+    Args:
+        text (str): The raw user query
+
+    Returns:
+        str: The query with its wording, case and punctuation intact
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKC", text).casefold()
+    # Curly quotes become straight so "party’s" and "party's" match
+    text = text.replace("’", "'").replace("‘", "'")
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+# Phrases are normalized the same way as queries, longest first so the most specific one wins
+_LEADING_PHRASES = sorted({_normalize(phrase) for phrase in QUERY_STOP_PHRASES}, key=len, reverse=True)
+_TRAILING_PHRASES = sorted({_normalize(phrase) for phrase in QUERY_TRAILING_STOP_PHRASES}, key=len, reverse=True)
+
+
+def canonicalize_query(text):
+    """
+    Reduce a query to its canonical form for cache lookups.
+
+    Applies Unicode NFKC normalization, casefolding, punctuation removal and
+    whitespace collapsing, then strips configured filler phrases from the
+    start and end of the query. If stripping would leave nothing, the
+    normalized query is returned instead.
+
+    Args:
+        text (str): The raw user query
+
+    Returns:
+        str: The canonical query
+    """
+    normalized = _normalize(text or "")
+    canonical = normalized
+
+    stripped = True
+    while stripped:
+        stripped = False
+        for phrase in _LEADING_PHRASES:
+            if canonical == phrase or canonical.startswith(phrase + " "):
+                canonical = canonical[len(phrase):].strip()
+                stripped = True
+                break
+        for phrase in _TRAILING_PHRASES:
+            if canonical == phrase or canonical.endswith(" " + phrase):
+                canonical = canonical[:len(canonical) - len(phrase)].strip()
+                stripped = True
+                break
+
+    return canonical or normalized
@@ -0,0 +1,66 @@
+"""
+Shared on-disk cache of LLM completions.
+
+Completions are keyed by a hash of everything that determines the output:
+model, system message, rendered prompt, temperature and max tokens. The
+cache lives in one directory shared by all workers on the host, so an
+identical prompt is sent to the API at most once per TTL.
+"""
+import hashlib
+import json
+import os
+
+from disk_cache import DiskCache
+from index_store import DATA_DIR
+from config import COMPLETION_CACHE_MAX_BYTES, COMPLETION_CACHE_TTL
+
+completion_cache = DiskCache(
+    os.path.join(DATA_DIR, ".cache", "completions"),
+    COMPLETION_CACHE_MAX_BYTES,
+    ttl=COMPLETION_CACHE_TTL,
+)
+
+
+def completion_key(model, system_message, prompt, temperature, max_tokens):
+    """
+    Hash the inputs of a completion request.
+
+    Returns:
+        str: Hex SHA-256 digest identifying the request
+    """
+    payload = json.dumps([model, system_message, prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_cached_completion(key):
+    """
+    Look up a completion.
+
+    Args:
+        key (str): Key from completion_key
+
+    Returns:
+        str: The cached completion text, or None on a miss
+    """
+    value = completion_cache.get(key)
+    if value is None:
+        return None
+    try:
+        return json.loads(value)["content"]
+    except (ValueError, KeyError):
+        return None
+
+
+def store_completion(key, content):
+    """
+    Save a completion for later identical requests.
+
+    Args:
+        key (str): Key from completion_key
+        content (str): The completion text
+    """
+    try:
+        completion_cache.set(key, json.dumps({"content": content}).encode("utf-8"))
+    except OSError as e:
+        # A full or read-only disk must never fail the request
+        print(f"Error storing completion: {str(e)}")
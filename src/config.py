@@ -9,12 +9,75 @@ API_URL = "http://localhost:8000"  # Base URL for the API
 API_HOST = "0.0.0.0"  # Host address for the API server
 API_PORT = 8000  # Port for the API server
 
+# Corpus
+DEFAULT_PARTY = "liberal"  # Party queried when a request does not name one
+
 # Retrieval parameters
 TOP_N_DOCUMENTS = 3  # Number of documents to retrieve and analyze
 SIMILARITY_THRESHOLD = 0.5  # Minimum similarity score to include a document
+SEARCH_SHARDS = 0  # Shards scored in parallel for large indexes (0 = one per CPU core)
+SEARCH_SHARD_MIN_ROWS = 50000  # Minimum rows per shard; smaller indexes are scored in one pass
+SECTION_ROUTING_ENABLED = True  # Route large searches to the outline sections whose centroids best match the query
+SECTION_ROUTING_MIN_ROWS = 5000  # Smaller searches score every page (exact results)
+SECTION_ROUTING_TOP_SECTIONS = 8  # Sections whose pages are scored
+MMR_ENABLED = False  # Re-rank candidates by maximal marginal relevance so near-identical pages don't fill the top-n
+MMR_LAMBDA = 0.5  # Relevance vs diversity trade-off (1.0 = plain similarity ranking)
+MMR_CANDIDATE_POOL = 20  # Top candidates by similarity that MMR chooses from
+
+# Query canonicalization (cache keys only; the query text itself is what gets embedded)
+QUERY_STOP_PHRASES = [  # Filler stripped from the start of a query, repeatedly (never content words)
+    "what is", "what are", "what's", "tell me about", "can you tell me about", "could you tell me about",
+    "i want to know about", "i'd like to know about", "explain", "describe", "what about", "how about",
+    "please",
+]
+QUERY_TRAILING_STOP_PHRASES = ["please", "thanks", "thank you"]  # Filler stripped from the end
+
+# Completion cache (shared on disk by all workers)
+COMPLETION_CACHE_ENABLED = True  # Reuse completions for byte-identical prompts
+COMPLETION_CACHE_MAX_BYTES = 50 * 1024 * 1024  # Disk budget for cached completions
+COMPLETION_CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached completion expires
+
+# Precomputed answers
+PRECOMPUTE_CONCURRENCY = 4  # Questions answered concurrently by the precomputation job
+
+# Response payloads
+SNIPPET_MAX_CHARS = 320  # Length of the snippet returned per document in compact responses
+
+# Typeahead suggestions (/suggest)
+SUGGEST_LIMIT = 8  # Most suggestions returned per request
+SUGGEST_MIN_QUERY_COUNT = 3  # Times a question must be asked before it ranks the matching curated suggestion higher
+SUGGEST_MAX_TRACKED_QUERIES = 10000  # Distinct asked questions counted per worker
+KEY_PHRASES_PER_PAGE = 5  # Key phrases extracted from each page at ingest time
+
+# HTTP caching of GET /query answers (keyed by index version and canonical query)
+QUERY_MAX_AGE = 300  # Seconds browsers and CDNs may reuse an answer without revalidating
+QUERY_STALE_WHILE_REVALIDATE = 86400  # Seconds a stale answer may be served while it is revalidated
 
 # Cache settings
 MAX_CACHE_SIZE = 100  # Maximum size for query and embedding caches
+PAGE_TEXT_CACHE_SIZE = 256  # Pages whose extracted text is kept in memory
+CACHE_BACKEND = "memory"  # Query caches: "memory" (per worker), "sqlite" (shared on one host) or "redis" (shared by all nodes)
+CACHE_NAMESPACE = "smartvote"  # Prefix of every shared cache key
+CACHE_TTL = 24 * 60 * 60  # Seconds a cached query embedding or result is kept
+CACHE_GENERATION_CHECK_INTERVAL = 2.0  # Seconds between checks for a cache clear by another worker
+CACHE_SQLITE_MAX_ENTRIES = 10000  # Entries kept in the SQLite cache (all regions together)
+CACHE_REDIS_URL = "redis://localhost:6379/0"  # Any server speaking the Redis protocol
+CACHE_REDIS_TIMEOUT = 0.5  # Seconds before a cache server call is given up (and treated as a miss)
+CACHE_REDIS_RETRY_INTERVAL = 5.0  # Seconds the cache server is skipped after a connection failure
+
+# Request pipelining
+HYDRATION_WORKERS = 8  # Threads loading page text for retrieved documents
+
+# Index versioning
+INDEX_RELOAD_CHECK_INTERVAL = 2.0  # Seconds between checks for a newly published index version
+INDEX_VERSIONS_TO_KEEP = 3  # Number of published index versions kept on disk
+
+# Static asset delivery
+ASSET_DIGEST_LENGTH = 12  # Hex characters of the content hash used in asset URLs
+ASSET_MAX_AGE = 31536000  # Cache lifetime in seconds for content-hashed URLs (one year)
+PRECOMPRESS_MIN_SAVINGS = 0.1  # Only serve a gzip variant if it is at least 10% smaller
+PAGE_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Disk budget for rendered page slices and thumbnails
+THUMBNAIL_WIDTH = 240  # Width in pixels of page thumbnails
 
 # Token limits for analyzer
 MAX_TOKENS_TOTAL = 4000  # Maximum tokens for the model's context
@@ -27,9 +90,83 @@ CHARS_PER_TOKEN = 4  # Rough estimate: 1 token is about 4 characters in English
 # Token limits for embedding
 EMBEDDING_MAX_TOKENS = 8000  # Approximate limit for text-embedding-ada-002
 
+# Embedding providers
+EMBEDDING_PROVIDER = "openai"  # Provider used to build new indexes: "openai" or "hashing" (local, offline)
+EMBEDDING_BATCH_SIZE = 64  # Pages embedded per provider call during ingestion
+LOCAL_EMBEDDING_DIMENSION = 512  # Vector size of the local hashing provider
+LOCAL_EMBEDDING_SIMILARITY_THRESHOLD = 0.1  # Hashing scores run lower than OpenAI's, so use a lower threshold
+
 # PDF processing parameters
 MIN_TEXT_LENGTH = 50  # Minimum length of text to consider a page worth processing
+DEDUP_ENABLED = True  # Strip repeated boilerplate lines and collapse near-duplicate pages at ingest time
+BOILERPLATE_MIN_FRACTION = 0.3  # A header or footer repeated on this fraction of a document's pages is boilerplate
+BOILERPLATE_MIN_PAGES = 3  # ...and on at least this many pages
+BOILERPLATE_EDGE_LINES = 2  # Only the first and last lines of a page can be headers or footers
+BOILERPLATE_MIN_WORDS = 2  # Shortest header or footer, in words (single words start too many sentences)
+BOILERPLATE_MAX_WORDS = 12  # Longest header or footer, in words
+SIMHASH_SHINGLE_SIZE = 3  # Words per shingle in page fingerprints
+SIMHASH_MAX_DISTANCE = 3  # Pages whose 64-bit fingerprints differ in at most this many bits are near-duplicates
+
+# Document ingestion (uploads are embedded by background workers, never inline in a request)
+INGESTION_WORKERS = 2  # Documents embedded concurrently; publishing a new index version is serialized
+INGESTION_MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # Largest accepted PDF upload
+INGESTION_JOB_HISTORY = 100  # Finished jobs kept for status queries
+INGESTION_TOKEN_ENV = "SMARTVOTE_ADMIN_TOKEN"  # Uploads need this token; they are disabled when it is not set
+
+# Command-line client and warm daemon (smartvote.py)
+DAEMON_SOCKET_NAME = ".smartvote.sock"  # Unix socket of the daemon, in the data directory
+DAEMON_SOCKET_ENV = "SMARTVOTE_SOCKET"  # Overrides the socket path when set
+DAEMON_CONNECT_TIMEOUT = 0.5  # Seconds to wait for the daemon before running in-process
+BENCH_REPEAT = 3  # Times `smartvote.py bench` asks each question
+
+# Upstream concurrency and rate limits (match the provider quotas for your account)
+LLM_MAX_CONCURRENCY = 8  # Maximum analysis completions in flight per worker
+LLM_REQUESTS_PER_MINUTE = 500  # Token bucket rate for analysis completions
+LLM_MAX_QUEUE_DEPTH = 32  # Waiting analysis calls before new requests get a 429
+EMBEDDING_MAX_CONCURRENCY = 16  # Maximum embedding calls in flight per worker
+EMBEDDING_REQUESTS_PER_MINUTE = 3000  # Token bucket rate for embedding calls
+EMBEDDING_MAX_QUEUE_DEPTH = 64  # Waiting embedding calls before new requests get a 429
+
+# Deadlines, retries and hedging for upstream calls
+REQUEST_BUDGET_SECONDS = 20.0  # Total time budget for answering one query
+EMBEDDING_CALL_TIMEOUT = 5.0  # Maximum seconds for a single embedding attempt
+ANALYSIS_CALL_TIMEOUT = 15.0  # Maximum seconds for a single analysis attempt
+RETRY_MAX_ATTEMPTS = 3  # Attempts per upstream call for transient errors
+RETRY_BASE_DELAY = 0.25  # Base backoff in seconds (grows exponentially, with full jitter)
+RETRY_MAX_DELAY = 4.0  # Cap on a single backoff
+EMBEDDING_HEDGING_ENABLED = True  # Race a second embedding request when the first is slower than p95
+HEDGE_MIN_DELAY = 0.2  # Minimum seconds before hedging, used until latencies are observed
+ANALYSIS_FALLBACK = "documents_only"  # "documents_only" returns documents without analysis, "error" returns an error message
+ANALYSIS_FALLBACK_MESSAGE = "The analysis is taking longer than expected. Here are the most relevant sections of the platform."
+
+# Tracing and profiling
+PROFILE_SAMPLE_RATE = 0.0  # Fraction of requests profiled automatically
+PROFILE_HEADER_ENABLED = False  # Let clients request a profile with an "X-Profile: 1" header
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples while profiling
 
 # AI Models
 ANALYSIS_MODEL = "gpt-4o-mini"  # Model for analysis generation
-EMBEDDING_MODEL = "text-embedding-ada-002"  # Model for embedding generation 
\ No newline at end of file
+EMBEDDING_MODEL = "text-embedding-ada-002"  # Model for embedding generation
+
+# Analysis model routing (routes in order of preference; the last one must accept every request).
+# Both default routes use ANALYSIS_MODEL and differ only in their output cap, so the latency-aware
+# fallback below has no effect until a route names a different model (e.g. a smaller, faster model
+# for "lookup"); it compares the p95 upstream latency of the routes' models.
+ANALYSIS_ROUTES = [
+    {
+        "name": "lookup",  # Short factual questions with little context get a tight output cap
+        "model": ANALYSIS_MODEL,
+        "max_tokens": 300,
+        "query_types": ["lookup"],
+        "max_context_tokens": 1500,
+    },
+    {
+        "name": "standard",
+        "model": ANALYSIS_MODEL,
+        "max_tokens": MAX_TOKENS_OUTPUT,
+        "query_types": ["lookup", "analysis"],
+        "max_context_tokens": None,
+    },
+]
+ROUTING_LATENCY_THRESHOLD = 6.0  # p95 seconds above which the fastest eligible route is preferred
+ROUTING_LATENCY_WINDOW = 50  # Recent completions per model used for routing latency (successful attempt only) 
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+The corpus of party platforms served by one index.
+
+data/corpus.json lists the parties and the documents to index:
+
+    {
+      "parties": {"liberal": {"name": "Liberal Party"}},
+      "documents": [{"file": "Liberal.pdf", "party": "liberal", "year": 2021, "title": "..."}]
+    }
+
+Document files are relative to the data directory. Every indexed page
+carries the party, document, year and section of its document, and the
+index keeps each party's pages in one contiguous block of rows so a query
+restricted to a party only scans that block.
+"""
+import json
+import os
+import re
+
+from index_store import DATA_DIR, atomic_write_json
+from config import DEFAULT_PARTY
+
+CORPUS_FILE = os.path.join(DATA_DIR, "corpus.json")
+
+# Names accepted for added documents and parties
+DOCUMENT_FILE_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*\.pdf$")
+PARTY_ID_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+def load_corpus(path=CORPUS_FILE):
+    """
+    Read the corpus manifest.
+
+    Returns:
+        dict: {"parties": {...}, "documents": [...]}; empty if there is no manifest
+    """
+    try:
+        with open(path, "r") as f:
+            corpus = json.load(f)
+    except FileNotFoundError:
+        return {"parties": {}, "documents": []}
+    corpus.setdefault("parties", {})
+    corpus.setdefault("documents", [])
+    return corpus
+
+
+def list_parties():
+    """
+    Parties known to the corpus.
+
+    Returns:
+        dict: Party id -> display name
+    """
+    parties = load_corpus()["parties"]
+    return {party: info.get("name", party.title()) for party, info in parties.items()}
+
+
+def party_name(party):
+    """Display name of a party, e.g. "Liberal Party" for "liberal"."""
+    return list_parties().get(party, f"{party.title()} Party")
+
+
+def document_metadata(file):
+    """
+    Metadata for a document file, matched by file name.
+
+    Args:
+        file (str): Path or file name of the document
+
+    Returns:
+        dict: {"document", "party", "year", "title"}; unknown documents belong to DEFAULT_PARTY
+    """
+    name = os.path.basename(file)
+    for entry in load_corpus()["documents"]:
+        if os.path.basename(entry["file"]) == name:
+            return {
+                "document": name,
+                "party": entry.get("party", DEFAULT_PARTY),
+                "year": entry.get("year"),
+                "title": entry.get("title"),
+            }
+    return {"document": name, "party": DEFAULT_PARTY, "year": None, "title": None}
+
+
+def corpus_documents():
+    """
+    Absolute paths of the corpus documents that exist on disk.
+
+    Returns:
+        list: PDF paths, in manifest order
+    """
+    paths = []
+    for entry in load_corpus()["documents"]:
+        path = os.path.join(DATA_DIR, entry["file"])
+        if os.path.exists(path):
+            paths.append(path)
+        else:
+            print(f"Warning: corpus document not found: {path}")
+    return paths
+
+
+def register_document(file, party, year=None, title=None, name=None, path=CORPUS_FILE):
+    """
+    Add a document to the corpus manifest, or update its entry if it is already listed.
+
+    Args:
+        file (str): Document file name, relative to the data directory
+        party (str): Party id
+        year (int, optional): Platform year
+        title (str, optional): Platform title
+        name (str, optional): Display name of the party, if it is new to the corpus
+        path (str): Manifest path
+
+    Returns:
+        dict: The document's manifest entry
+    """
+    corpus = load_corpus(path)
+    if party not in corpus["parties"] or name:
+        corpus["parties"].setdefault(party, {})["name"] = name or f"{party.title()} Party"
+
+    entry = {"file": file, "party": party, "year": year, "title": title}
+    corpus["documents"] = [
+        existing for existing in corpus["documents"]
+        if os.path.basename(existing["file"]) != os.path.basename(file)
+    ] + [entry]
+    save_corpus(corpus, path)
+    return entry
+
+
+def save_corpus(corpus, path=CORPUS_FILE):
+    """Write the corpus manifest atomically, e.g. to restore one read with load_corpus."""
+    atomic_write_json(path, corpus)
@@ -1,89 +1,242 @@
 from pypdf import PdfReader
 import os
 import json
-from embedding import get_embedding
+from embedding import get_embedding, get_embeddings
+from scheduler import PRIORITY_BATCH
+from index_store import atomic_write_json, publish_index, read_current_version, read_index_data, PDF_INFO_FILE
+from corpus import corpus_documents, document_metadata
+from tracing import traced
+from dedup import find_boilerplate, strip_boilerplate, collapse_near_duplicates
+from suggest import extract_key_phrases
 import PyPDF2
-from config import MIN_TEXT_LENGTH
+from config import MIN_TEXT_LENGTH, EMBEDDING_BATCH_SIZE, EMBEDDING_PROVIDER, DEDUP_ENABLED
 
 
-def process_pdf_and_create_embeddings(pdf_path, output_json_path=None, limit_pages=None):
+def page_sections(pdf_reader):
     """
-    Process a PDF file and create embeddings for each page
+    Map each page to the top-level outline (bookmark) entry it falls under.
+    
+    Args:
+        pdf_reader (PyPDF2.PdfReader): Open PDF
+        
+    Returns:
+        dict: Page number (1-indexed) -> section title; empty if the PDF has no outline
+    """
+    try:
+        starts = []
+        for item in pdf_reader.outline:
+            # Nested lists hold sub-sections; only chapters are used here
+            if isinstance(item, list):
+                continue
+            starts.append((pdf_reader.get_destination_page_number(item) + 1, str(item.title).strip()))
+    except Exception as e:
+        print(f"Could not read PDF outline: {str(e)}")
+        return {}
+    
+    starts.sort(key=lambda start: start[0])
+    sections = {}
+    for i, (first_page, title) in enumerate(starts):
+        last_page = starts[i + 1][0] - 1 if i + 1 < len(starts) else len(pdf_reader.pages)
+        for page_num in range(first_page, last_page + 1):
+            sections[page_num] = title
+    return sections
+
+
+def page_labels(pdf_path):
+    """
+    Map each page to its printed label (e.g. "iv" or "12"), from the PDF's page label ranges.
+    
+    Args:
+        pdf_path (str): Path to the PDF file
+        
+    Returns:
+        dict: Page number (1-indexed) -> label; empty if the labels can't be read
+    """
+    try:
+        return {page_num + 1: label for page_num, label in enumerate(PdfReader(pdf_path).page_labels)}
+    except Exception as e:
+        print(f"Could not read PDF page labels: {str(e)}")
+        return {}
+
+
+def merge_into_current_index(entries, documents, provider):
+    """
+    Combine new page entries with the pages of other documents in the current index.
+    
+    Args:
+        entries (list): New page entries
+        documents (set): Document names the new entries replace
+        provider (str): Embedding provider of the new entries
+        
+    Returns:
+        list: Entries for the next index version
+    """
+    version = read_current_version()
+    if version is None:
+        return entries
+    manifest, current_entries = read_index_data(version)
+    if manifest.get("embedding_provider") != provider:
+        print(f"Current index {version} uses {manifest.get('embedding_provider')} embeddings; publishing only the new documents")
+        return entries
+    boilerplate = manifest.get("boilerplate", {})
+    kept = []
+    for entry in current_entries:
+        metadata = document_metadata(entry.get("document") or entry.get("file", ""))
+        if metadata["document"] in documents:
+            continue
+        # publish_index moves it back into the manifest
+        if boilerplate.get(metadata["document"]):
+            entry.setdefault("boilerplate", boilerplate[metadata["document"]])
+        # Pages indexed before the corpus existed get their document's metadata
+        for key in ("document", "party", "year"):
+            entry.setdefault(key, metadata[key])
+        kept.append(entry)
+    return kept + entries
+
+
+def embed_document(pdf_path, limit_pages=None, provider=EMBEDDING_PROVIDER, progress=None, metadata=None, indexed_path=None):
+    """
+    Extract and embed the pages of one PDF
     
     Args:
         pdf_path (str): Path to the PDF file
-        output_json_path (str, optional): Path to save the JSON output. Defaults to 'document_embeddings.json'.
         limit_pages (int, optional): Limit processing to first N pages. Defaults to None (all pages).
+        provider (str, optional): Embedding provider name. Defaults to EMBEDDING_PROVIDER from config.
+        progress (callable, optional): Called as progress(stage, done, total) after each page is
+            extracted ("extracted"), once near-duplicates are collapsed ("deduplicated": entries
+            out of pages) and after each batch is embedded ("embedded")
+        metadata (dict, optional): Corpus metadata of the document ("document", "party", "year"),
+            for a staged upload that is not in the manifest yet. Defaults to the manifest entry.
+        indexed_path (str, optional): Path the index entries should reference, when pdf_path is a
+            staging copy that is moved into place later. Defaults to pdf_path.
         
     Returns:
-        list: List of dictionaries with page number and embeddings
+        list: Page entries with page number, corpus metadata and embedding. With DEDUP_ENABLED,
+            near-duplicate pages share one entry listing all of them in "pages", and every
+            entry refers to the document's boilerplate lines, which were stripped before
+            embedding (publish_index stores them once per document in the manifest).
     """
-    if output_json_path is None:
-        output_json_path = os.path.join("data", "document_embeddings.json")
+    metadata = metadata or document_metadata(pdf_path)
+    labels = page_labels(pdf_path)
+    embeddings_data = []
+    
+    # Open PDF file
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        num_pages = len(pdf_reader.pages)
+        sections = page_sections(pdf_reader)
         
-    pdf_info_path = os.path.join("data", "pdf_info.json")
+        # Limit pages if specified
+        if limit_pages is not None:
+            num_pages = min(num_pages, limit_pages)
+            
+        print(f"Processing {num_pages} pages from {pdf_path}")
+        
+        # Extract the text of each page
+        pages = []
+        for page_num in range(num_pages):
+            try:
+                # Extract text from page
+                text = pdf_reader.pages[page_num].extract_text()
+                
+                # Skip pages with very little text
+                # Note: We skip pages with insufficient text but preserve the actual PDF page number.
+                # This means page_num values in the embeddings_data may not be consecutive,
+                # but they will correctly reference the actual PDF page.
+                if len(text.strip()) < MIN_TEXT_LENGTH:
+                    print(f"Skipping page {page_num + 1} due to insufficient text (less than {MIN_TEXT_LENGTH} characters)")
+                    continue
+                
+                pages.append((page_num + 1, text))  # 1-indexed for human readability
+            except Exception as e:
+                print(f"Error processing page {page_num + 1}: {str(e)}")
+            finally:
+                if progress is not None:
+                    progress("extracted", page_num + 1, num_pages)
     
+    # Strip repeated headers and footers, and embed each set of near-duplicate pages once
+    boilerplate = []
+    if DEDUP_ENABLED and pages:
+        boilerplate = find_boilerplate([text for _, text in pages])
+        stripped = [(page_num, strip_boilerplate(text, boilerplate)) for page_num, text in pages]
+        groups = collapse_near_duplicates([
+            (page_num, text) for page_num, text in stripped if len(text.strip()) >= MIN_TEXT_LENGTH
+        ])
+        print(f"Stripped {len(boilerplate)} boilerplate lines; {len(pages)} pages collapsed into {len(groups)} entries")
+    else:
+        groups = [(page_num, text, [page_num]) for page_num, text in pages]
+    if progress is not None:
+        progress("deduplicated", len(groups), len(pages))
+    
+    # Embed the pages in batches, one provider call per batch
+    for start in range(0, len(groups), EMBEDDING_BATCH_SIZE):
+        batch = groups[start:start + EMBEDDING_BATCH_SIZE]
+        embeddings = get_embeddings([text for _, text, _ in batch], priority=PRIORITY_BATCH, provider=provider)
+        if embeddings is None:
+            # Retry page by page so one bad page doesn't drop the whole batch
+            embeddings = [get_embedding(text, priority=PRIORITY_BATCH, provider=provider) for _, text, _ in batch]
+        
+        for (page_num, text, page_nums), embedding in zip(batch, embeddings):
+            if not embedding:
+                print(f"Warning: Failed to generate embedding for page {page_num}, skipping.")
+                continue
+            
+            # Save only page reference, metadata and embedding, not full text
+            embeddings_data.append({
+                "page_num": page_num,
+                "file": indexed_path or pdf_path,
+                "document": metadata["document"],
+                "party": metadata["party"],
+                "year": metadata["year"],
+                "section": sections.get(page_num),
+                "page_label": labels.get(page_num, str(page_num)),
+                "pages": page_nums,
+                "key_phrases": extract_key_phrases(text),  # Typeahead suggestions
+                "boilerplate": boilerplate,
+                "embedding": embedding
+            })
+        print(f"Processed and stored embeddings for {min(start + len(batch), len(groups))} of {len(groups)} pages")
+        if progress is not None:
+            progress("embedded", min(start + len(batch), len(groups)), len(groups))
+    
+    return embeddings_data
+
+
+def process_pdf_and_create_embeddings(pdf_path, output_json_path=None, limit_pages=None, provider=EMBEDDING_PROVIDER):
+    """
+    Process a PDF file and create embeddings for each page
+    
+    Args:
+        pdf_path (str): Path to the PDF file
+        output_json_path (str, optional): Path to save the JSON output. Defaults to publishing
+            a new index version under data/index/, in which the PDF replaces its previous
+            pages and the other corpus documents are kept.
+        limit_pages (int, optional): Limit processing to first N pages. Defaults to None (all pages).
+        provider (str, optional): Embedding provider name. Defaults to EMBEDDING_PROVIDER from config.
+        
+    Returns:
+        list: List of dictionaries with page number and embeddings
+    """
     # Check if PDF file exists
     if not os.path.exists(pdf_path):
         raise FileNotFoundError(f"PDF file not found: {pdf_path}")
     
     try:
         # Save PDF path info to separate JSON file
-        with open(pdf_info_path, 'w') as f:
-            json.dump({"pdf_path": pdf_path}, f)
-        
-        embeddings_data = []
-        
-        # Open PDF file
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            num_pages = len(pdf_reader.pages)
-            
-            # Limit pages if specified
-            if limit_pages is not None:
-                num_pages = min(num_pages, limit_pages)
-                
-            print(f"Processing {num_pages} pages from {pdf_path}")
-            
-            # Process each page
-            for page_num in range(num_pages):
-                try:
-                    # Extract text from page
-                    text = pdf_reader.pages[page_num].extract_text()
-                    
-                    # Skip pages with very little text
-                    # Note: We skip pages with insufficient text but preserve the actual PDF page number.
-                    # This means page_num values in the embeddings_data may not be consecutive,
-                    # but they will correctly reference the actual PDF page.
-                    if len(text.strip()) < MIN_TEXT_LENGTH:
-                        print(f"Skipping page {page_num + 1} due to insufficient text (less than {MIN_TEXT_LENGTH} characters)")
-                        continue
-                    
-                    # Get embedding for the text
-                    embedding = get_embedding(text)
-                    if not embedding:
-                        print(f"Warning: Failed to generate embedding for page {page_num + 1}, skipping.")
-                        continue
-                    
-                    # Save only page reference and embedding, not full text
-                    document_ref = {
-                        "page_num": page_num + 1,  # 1-indexed for human readability
-                        "file": pdf_path,
-                        "embedding": embedding
-                    }
-                    
-                    embeddings_data.append(document_ref)
-                    print(f"Processed and stored embeddings for page {page_num + 1} of {num_pages}")
-                except Exception as e:
-                    print(f"Error processing page {page_num + 1}: {str(e)}")
-
-        # Save all document references to JSON file
-        os.makedirs(os.path.dirname(output_json_path), exist_ok=True)
+        atomic_write_json(PDF_INFO_FILE, {"pdf_path": pdf_path})
         
+        embeddings_data = embed_document(pdf_path, limit_pages=limit_pages, provider=provider)
+
+        # Save all document references, never overwriting a file readers may be using
         try:
-            with open(output_json_path, "w") as f:
-                json.dump(embeddings_data, f)
-            print(f"Saved {len(embeddings_data)} document embeddings to {output_json_path} (Some PDF pages may have been skipped)")
+            if output_json_path is None:
+                entries = merge_into_current_index(embeddings_data, {os.path.basename(pdf_path)}, provider)
+                version = publish_index(entries, pdf_path, provider=provider)
+                print(f"Saved {len(embeddings_data)} document embeddings as index version {version} (Some PDF pages may have been skipped)")
+            else:
+                os.makedirs(os.path.dirname(output_json_path) or ".", exist_ok=True)
+                atomic_write_json(output_json_path, embeddings_data)
+                print(f"Saved {len(embeddings_data)} document embeddings to {output_json_path} (Some PDF pages may have been skipped)")
             
             return embeddings_data
         except Exception as e:
@@ -94,6 +247,34 @@ def process_pdf_and_create_embeddings(pdf_path, output_json_path=None, limit_pag
         return []
 
 
+def build_corpus_index(limit_pages=None, provider=EMBEDDING_PROVIDER):
+    """
+    Embed every document listed in data/corpus.json and publish them as one index version
+    
+    Args:
+        limit_pages (int, optional): Limit processing to the first N pages of each document
+        provider (str, optional): Embedding provider name. Defaults to EMBEDDING_PROVIDER from config.
+        
+    Returns:
+        str: The published version, or None if no document could be embedded
+    """
+    pdf_paths = corpus_documents()
+    embeddings_data = []
+    for pdf_path in pdf_paths:
+        try:
+            embeddings_data.extend(embed_document(pdf_path, limit_pages=limit_pages, provider=provider))
+        except Exception as e:
+            print(f"Error processing PDF file {pdf_path}: {str(e)}")
+    
+    if not embeddings_data:
+        print("No corpus documents could be embedded")
+        return None
+    version = publish_index(embeddings_data, pdf_paths[0], provider=provider)
+    print(f"Saved {len(embeddings_data)} page embeddings from {len(pdf_paths)} documents as index version {version}")
+    return version
+
+
+@traced("page_text")
 def get_page_text(pdf_path, page_num):
     """
     Extract text from a specific page of a PDF file
@@ -136,9 +317,9 @@ def get_page_text(pdf_path, page_num):
 
 if __name__ == "__main__":
     try:
-        pdf_path = os.path.join("data", "Liberal.pdf")
-        embeddings_data = process_pdf_and_create_embeddings(pdf_path)
-        print(f"Successfully created embeddings for {len(embeddings_data)} pages")
-        print("Embeddings have been stored in the JSON file: data/document_embeddings.json")
+        # Index every document listed in data/corpus.json
+        version = build_corpus_index()
+        if version:
+            print(f"Embeddings have been published as index version {version} under data/index/")
     except Exception as e:
         print(f"Error: {str(e)}")
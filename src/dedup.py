@@ -0,0 +1,246 @@
+"""
+Boilerplate and near-duplicate page detection for ingestion.
+
+Platform PDFs repeat running headers, footers, page numbers and pull
+quotes on many pages, and sometimes whole pages (a summary repeated in
+each chapter, a closing page per section). Without cleanup every copy gets
+its own embedding, near-identical pages crowd each other out of the top-n
+results, and the repeated lines take up context tokens.
+
+At ingest time:
+
+- Header and footer lines that start the same way on many pages of a
+  document (after masking digits, so "Page 12" and "Page 13" match) are
+  boilerplate. They are stripped before embedding, and recorded in the
+  index so hydrated page text is stripped the same way before it reaches
+  a prompt.
+- Each remaining page gets a 64-bit SimHash of its word shingles. Pages
+  whose fingerprints differ in at most SIMHASH_MAX_DISTANCE bits are
+  near-duplicates and are collapsed into one index entry that lists all
+  of their page numbers.
+"""
+import hashlib
+import re
+from collections import Counter
+
+import numpy as np
+
+from config import (
+    BOILERPLATE_MIN_FRACTION, BOILERPLATE_MIN_PAGES, BOILERPLATE_EDGE_LINES, BOILERPLATE_MIN_WORDS, BOILERPLATE_MAX_WORDS,
+    SIMHASH_MAX_DISTANCE, SIMHASH_SHINGLE_SIZE,
+)
+
+SIMHASH_BITS = 64
+# Fraction of a header's pages on which a longer prefix must repeat to extend it
+BOILERPLATE_EXTENSION_FRACTION = 0.8
+
+_WORD_PATTERN = re.compile(r"\w+")
+_DIGITS_PATTERN = re.compile(r"\d+")
+_SPACE_PATTERN = re.compile(r"\s+")
+_FILLER_PATTERN = re.compile(r"[^\w\s#]")
+
+# Words that start ordinary sentences; a header made only of them is no header
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its more new of on or our
+than that the their there these they this to was we were what when which will with you your
+""".split())
+
+
+def normalize_line(line):
+    """Comparison form of a line: lowercase, single spaces, digits masked as "#"."""
+    return _DIGITS_PATTERN.sub("#", _SPACE_PATTERN.sub(" ", line.strip().lower()))
+
+
+def _edge_lines(lines):
+    """Indexes of the first and last BOILERPLATE_EDGE_LINES non-empty lines, where headers and footers sit."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return set(filled[:BOILERPLATE_EDGE_LINES]) | set(filled[-BOILERPLATE_EDGE_LINES:])
+
+
+def _edge_positions(lines):
+    """Edge position of each header or footer line: 0, 1, ... from the top and -1, -2, ... from the bottom."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    positions = {i: position for position, i in enumerate(filled[:BOILERPLATE_EDGE_LINES])}
+    for position, i in enumerate(reversed(filled[-BOILERPLATE_EDGE_LINES:])):
+        positions.setdefault(i, -1 - position)
+    return positions
+
+
+def _line_prefixes(line):
+    """Word prefixes of a line that could be a header or footer, in normalized form."""
+    words = normalize_line(line).split(" ")
+    return {" ".join(words[:n]) for n in range(BOILERPLATE_MIN_WORDS, min(len(words), BOILERPLATE_MAX_WORDS) + 1)}
+
+
+def _is_filler(prefix):
+    """Prefixes made only of stopwords and page numbers ("we will", "the #") start ordinary sentences."""
+    return all(not word or word == "#" or word in _STOPWORDS for word in _FILLER_PATTERN.sub("", prefix).split(" "))
+
+
+def find_boilerplate(texts, min_fraction=BOILERPLATE_MIN_FRACTION, min_pages=BOILERPLATE_MIN_PAGES):
+    """
+    Find the headers and footers repeated across the pages of one document.
+
+    Text extraction often glues a running header to the first line of the
+    page ("Forward. For Everyone. 26 Helping Teachers..."), so repeated
+    word prefixes of the edge lines are counted rather than whole lines,
+    and the longest prefixes common to enough pages are kept. To tell them
+    apart from sentences that merely start the same way, a prefix must:
+
+    - be at least BOILERPLATE_MIN_WORDS words long, and not only stopwords
+      and page numbers
+    - repeat at the same edge position (e.g. the first line) of the pages,
+      and extend a shorter header only where nearly all its pages agree
+    - not also start lines inside min_pages or more pages, as prose would
+
+    Args:
+        texts (list): Text of each page
+        min_fraction (float): Fraction of pages a header or footer must appear on
+        min_pages (int): Minimum number of pages it must appear on
+
+    Returns:
+        list: Normalized boilerplate lines (or line prefixes), sorted
+    """
+    edge_counts = Counter()  # (edge position, prefix) -> pages
+    body_counts = Counter()  # prefix -> pages where it starts a line inside the page
+    for text in texts:
+        lines = text.splitlines()
+        positions = _edge_positions(lines)
+        edge, body = set(), set()
+        for i, line in enumerate(lines):
+            if not line.strip():
+                continue
+            if i in positions:
+                edge.update((positions[i], prefix) for prefix in _line_prefixes(line))
+            else:
+                body.update(_line_prefixes(line))
+        edge_counts.update(edge)
+        body_counts.update(body)
+
+    needed = max(min_pages, min_fraction * len(texts))
+    counts = {}
+    for (_, prefix), count in edge_counts.items():
+        if count >= needed and body_counts[prefix] < min_pages and not _is_filler(prefix):
+            counts[prefix] = max(count, counts.get(prefix, 0))
+
+    # A header only extends to the next word if nearly every page carrying it continues
+    # the same way: "forward. for everyone. #" is followed by whatever the page says
+    # ("the", "we will", ...), and those words are not part of it
+    repeated = set()
+    for prefix in sorted(counts, key=len):
+        parent = prefix.rsplit(" ", 1)[0]
+        if parent not in counts or (parent in repeated and counts[prefix] >= BOILERPLATE_EXTENSION_FRACTION * counts[parent]):
+            repeated.add(prefix)
+    # Keep only the longest repeated prefixes ("forward. for everyone. #", not "forward. for")
+    extended = {prefix.rsplit(" ", 1)[0] for prefix in repeated}
+    return sorted(repeated - extended)
+
+
+def strip_boilerplate(text, boilerplate):
+    """
+    Remove boilerplate headers and footers from a page's text.
+
+    Args:
+        text (str): Page text
+        boilerplate (iterable): Normalized lines or line prefixes from find_boilerplate
+
+    Returns:
+        str: The text without them
+    """
+    if not boilerplate:
+        return text
+    boilerplate = boilerplate if isinstance(boilerplate, (set, frozenset)) else frozenset(boilerplate)
+    lines = text.splitlines()
+    kept = []
+    edges = _edge_lines(lines)
+    for i, line in enumerate(lines):
+        if i in edges:
+            words = normalize_line(line).split(" ")
+            for n in range(min(len(words), BOILERPLATE_MAX_WORDS), 0, -1):
+                if " ".join(words[:n]) in boilerplate:
+                    # Normalizing keeps the words, so drop as many from the original line
+                    line = " ".join(line.split()[n:])
+                    break
+            if not line.strip():
+                continue
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def simhash(text, shingle_size=SIMHASH_SHINGLE_SIZE):
+    """
+    64-bit SimHash of a text's word shingles.
+
+    Similar texts get fingerprints that differ in few bits, so the Hamming
+    distance between two fingerprints estimates how different the texts are.
+
+    Returns:
+        int: The fingerprint (0 for a text without words)
+    """
+    words = _WORD_PATTERN.findall(text.lower())
+    shingles = Counter(
+        " ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))
+    ) if words else Counter()
+    if not shingles:
+        return 0
+
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles),
+        dtype=">u8",
+    )
+    weights = np.fromiter(shingles.values(), dtype=np.int64, count=len(shingles))
+    # One row of 64 bits per shingle, most significant first
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1).astype(np.int64)
+    votes = weights @ (2 * bits - 1)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two fingerprints."""
+    return bin(a ^ b).count("1")
+
+
+def collapse_near_duplicates(pages, max_distance=SIMHASH_MAX_DISTANCE):
+    """
+    Collapse near-duplicate pages into the first page of each group.
+
+    Candidate pairs are found by splitting fingerprints into max_distance + 1
+    bands: two fingerprints within max_distance bits of each other must
+    agree exactly on at least one band, so only pages sharing a band are
+    compared.
+
+    Args:
+        pages (list): (page_num, text) tuples, in page order
+        max_distance (int): Largest Hamming distance between near-duplicates
+
+    Returns:
+        list: (page_num, text, page_nums) tuples for the pages kept, where
+            page_nums lists the page itself followed by its duplicates
+    """
+    bands = max_distance + 1
+    band_bits = SIMHASH_BITS // bands
+    band_mask = (1 << band_bits) - 1
+    buckets = {}  # (band, band value) -> indexes of kept pages
+    kept = []  # [page_num, text, fingerprint, page_nums]
+
+    for page_num, text in pages:
+        fingerprint = simhash(text)
+        keys = [(band, (fingerprint >> (band * band_bits)) & band_mask) for band in range(bands)]
+        original = None
+        if fingerprint:
+            for key in keys:
+                for index in buckets.get(key, ()):
+                    if hamming_distance(fingerprint, kept[index][2]) <= max_distance:
+                        original = index
+                        break
+                if original is not None:
+                    break
+
+        if original is not None:
+            kept[original][3].append(page_num)
+            continue
+        for key in keys:
+            buckets.setdefault(key, []).append(len(kept))
+        kept.append([page_num, text, fingerprint, [page_num]])
+
+    return [(page_num, text, page_nums) for page_num, text, _, page_nums in kept]
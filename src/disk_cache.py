@@ -0,0 +1,174 @@
+"""
+Size-bounded cache of byte blobs on disk.
+
+Entries are written to a temporary file and moved into place with
+os.replace, so several worker processes can share one cache directory
+without ever reading a partial entry. When the directory grows past its
+byte budget the least recently used entries are removed.
+
+The entry count and size are kept as running totals, so reporting them
+never walks the directory. Other workers sharing the directory change it
+too, so the totals are this worker's estimate, corrected whenever it
+evicts (which scans the directory anyway).
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+
+class DiskCache:
+    """A least-recently-used blob cache stored in a directory."""
+
+    def __init__(self, directory, max_bytes, ttl=None):
+        """
+        Args:
+            directory (str): Directory holding the cache entries
+            max_bytes (int): Total size budget for all entries
+            ttl (float, optional): Maximum entry age in seconds. Defaults to no expiry.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._approx_bytes = None  # Running totals, None until the first scan
+        self._approx_entries = None
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key):
+        """
+        Look up an entry.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            bytes: The cached value, or None on a miss
+        """
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if self.ttl is not None and time.time() - stat.st_mtime > self.ttl:
+                if self._remove(path):
+                    self._count(-1, -stat.st_size)
+                self.misses += 1
+                return None
+            with open(path, "rb") as f:
+                value = f.read()
+            # Record the access for LRU eviction but keep the write time for the TTL
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:
+            # Missing, or evicted by another worker
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """
+        Store an entry, evicting old entries if the cache is over budget.
+
+        Args:
+            key (str): Cache key
+            value (bytes): Value to store
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = None
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+        if replaced is None:
+            self._count(1, len(value))
+        else:
+            self._count(0, len(value) - replaced)
+        with self._lock:
+            over_budget = self._approx_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _count(self, entries, size):
+        """Update the running totals, scanning the directory once to start them."""
+        with self._lock:
+            if self._approx_bytes is None:
+                self._sync(self._entries())
+            else:
+                self._approx_entries += entries
+                self._approx_bytes += size
+
+    def _sync(self, entries):
+        self._approx_entries = len(entries)
+        self._approx_bytes = sum(size for _, size, _ in entries)
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+        return entries
+
+    @staticmethod
+    def _remove(path):
+        """Remove an entry; False if another worker already did."""
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def evict(self):
+        """Remove least recently used entries until the cache is at 90% of its budget."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+            removed += 1
+        with self._lock:
+            self._sync(entries[removed:])
+
+    def clear(self):
+        """Remove every entry."""
+        for _, _, path in self._entries():
+            self._remove(path)
+        with self._lock:
+            self._approx_entries = 0
+            self._approx_bytes = 0
+
+    def stats(self):
+        """Return entry count, size and hit ratio for monitoring (from the running totals)."""
+        with self._lock:
+            if self._approx_bytes is None:
+                self._sync(self._entries())
+            entries, size = self._approx_entries, self._approx_bytes
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,51 +1,243 @@
 import os
+import re
+import hashlib
+import math
+import numpy as np
 from openai import OpenAI
 from dotenv import load_dotenv
-from config import EMBEDDING_MAX_TOKENS, EMBEDDING_MODEL
+from config import (
+    EMBEDDING_MAX_TOKENS,
+    EMBEDDING_MODEL,
+    EMBEDDING_CALL_TIMEOUT,
+    EMBEDDING_HEDGING_ENABLED,
+    EMBEDDING_PROVIDER,
+    LOCAL_EMBEDDING_DIMENSION,
+    LOCAL_EMBEDDING_SIMILARITY_THRESHOLD,
+)
+from scheduler import embedding_scheduler, SchedulerOverloaded, PRIORITY_INTERACTIVE
+from resilience import LatencyTracker, call_with_retries, hedged_call, hedge_delay_for
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Observed embedding latencies, used to decide when to hedge
+embedding_latency = LatencyTracker()
 
-def get_embedding(text):
+# Output dimensions of the OpenAI embedding models we know about
+OPENAI_MODEL_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+
+class EmbeddingProvider:
+    """
+    Interface for embedding backends.
+
+    Subclasses set `name` and `dimension` and implement embed_batch. Register
+    them with @register_provider so they can be selected by name in config.
+    """
+
+    name = None
+    dimension = None
+    similarity_threshold = None  # Overrides SIMILARITY_THRESHOLD for this provider's score scale
+
+    def embed_batch(self, texts, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """
+        Embed several texts at once.
+
+        Args:
+            texts (list): Input texts
+            priority (int): Scheduling priority for remote backends
+            deadline (Deadline, optional): Request deadline for remote backends
+
+        Returns:
+            list: One embedding vector (list of floats) per input text
+        """
+        raise NotImplementedError
+
+    def embed(self, text, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """Embed a single text."""
+        return self.embed_batch([text], priority=priority, deadline=deadline)[0]
+
+
+# Provider name -> provider class
+EMBEDDING_PROVIDERS = {}
+_provider_instances = {}
+
+
+def register_provider(cls):
+    """Class decorator adding an EmbeddingProvider to the registry."""
+    EMBEDDING_PROVIDERS[cls.name] = cls
+    return cls
+
+
+def get_provider(name=None):
+    """
+    Get the shared instance of an embedding provider.
+
+    Args:
+        name (str, optional): Provider name. Defaults to EMBEDDING_PROVIDER from config.
+
+    Returns:
+        EmbeddingProvider: The provider instance
+    """
+    name = name or EMBEDDING_PROVIDER
+    if name not in _provider_instances:
+        if name not in EMBEDDING_PROVIDERS:
+            raise ValueError(f"Unknown embedding provider: {name}. Available: {sorted(EMBEDDING_PROVIDERS)}")
+        _provider_instances[name] = EMBEDDING_PROVIDERS[name]()
+    return _provider_instances[name]
+
+
+@register_provider
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI API, rate limited, retried and hedged."""
+
+    name = "openai"
+
+    def __init__(self, model=EMBEDDING_MODEL):
+        self.model = model
+        self.dimension = OPENAI_MODEL_DIMENSIONS.get(model)
+
+    def embed_batch(self, texts, priority=PRIORITY_INTERACTIVE, deadline=None):
+        # Initialize OpenAI client with API key from environment
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY not found in environment variables")
+
+        # Retries are handled by call_with_retries so they respect the deadline
+        client = OpenAI(api_key=api_key, max_retries=0)
+
+        # Request embeddings from OpenAI through the shared rate-limited scheduler
+        def request(timeout):
+            return embedding_scheduler.run(
+                client.embeddings.create,
+                model=self.model,
+                input=texts,
+                timeout=timeout,
+                priority=priority,
+                wait_timeout=deadline.remaining() if deadline else None
+            )
+
+        def request_with_retries():
+            return call_with_retries(request, EMBEDDING_CALL_TIMEOUT, deadline, latency=embedding_latency)
+
+        # Interactive queries race a second request if the first one is slower than usual
+        if EMBEDDING_HEDGING_ENABLED and priority == PRIORITY_INTERACTIVE and len(texts) == 1:
+            response = hedged_call(request_with_retries, hedge_delay_for(embedding_latency), deadline)
+        else:
+            response = request_with_retries()
+
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+@register_provider
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic local embeddings using the signed feature hashing trick.
+
+    Words and word bigrams are hashed into a fixed number of buckets with
+    sublinear term-frequency weighting. No network, no model download, and
+    identical output on every machine, which makes it suitable for offline
+    tests, reproducible benchmarks and latency-critical deployments.
+    """
+
+    name = "hashing"
+    similarity_threshold = LOCAL_EMBEDDING_SIMILARITY_THRESHOLD
+    token_pattern = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(self, dimension=LOCAL_EMBEDDING_DIMENSION):
+        self.dimension = dimension
+
+    def _features(self, text):
+        words = self.token_pattern.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def _embed_one(self, text):
+        counts = {}
+        for feature in self._features(text):
+            counts[feature] = counts.get(feature, 0) + 1
+
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature, count in counts.items():
+            # blake2b is stable across processes, unlike the built-in hash()
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            sign = 1.0 if digest & 1 else -1.0
+            vector[(digest >> 1) % self.dimension] += sign * (1.0 + math.log(count))
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_batch(self, texts, priority=PRIORITY_INTERACTIVE, deadline=None):
+        return [self._embed_one(text) for text in texts]
+
+
+def _prepare_text(text):
+    # Truncate extremely long texts to avoid token limits
+    if len(text) > EMBEDDING_MAX_TOKENS * 4:  # Rough character to token ratio
+        print(f"Warning: Truncating text from {len(text)} characters to ~{EMBEDDING_MAX_TOKENS} tokens")
+        text = text[:EMBEDDING_MAX_TOKENS * 4]
+    return text
+
+
+def get_embedding(text, priority=PRIORITY_INTERACTIVE, deadline=None, provider=None):
     """
-    Get embedding vector for input text using OpenAI's embedding model.
+    Get embedding vector for input text using the configured embedding provider.
 
     Args:
         text (str): Input text to get embedding for
+        priority (int): Scheduling priority; batch ingestion yields to user queries
+        deadline (Deadline, optional): Request deadline bounding timeouts and retries
+        provider (str, optional): Provider name. Defaults to EMBEDDING_PROVIDER from config.
 
     Returns:
-        list: Embedding vector from OpenAI model, or None if an error occurs
+        list: Embedding vector, or None if an error occurs
     """
     # Input validation
     if not text or not isinstance(text, str):
         print("Error: Invalid input text for embedding")
         return None
-        
-    # Truncate extremely long texts to avoid token limits
-    if len(text) > EMBEDDING_MAX_TOKENS * 4:  # Rough character to token ratio
-        print(f"Warning: Truncating text from {len(text)} characters to ~{EMBEDDING_MAX_TOKENS} tokens")
-        text = text[:EMBEDDING_MAX_TOKENS * 4]
-    
+
     try:
-        # Initialize OpenAI client with API key from environment
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment variables")
-            
-        client = OpenAI(api_key=api_key)
+        return get_provider(provider).embed(_prepare_text(text), priority=priority, deadline=deadline)
 
-        # Request embedding from OpenAI
-        response = client.embeddings.create(
-            model=EMBEDDING_MODEL, 
-            input=text
-        )
+    except SchedulerOverloaded:
+        # Let the API turn overload into a fast 429 instead of a silent failure
+        raise
+    except Exception as e:
+        print(f"Error getting embedding: {str(e)}")
+        return None
+
+
+def get_embeddings(texts, priority=PRIORITY_INTERACTIVE, deadline=None, provider=None):
+    """
+    Get embedding vectors for several texts in one provider call.
 
-        # Return the embedding vector
-        return response.data[0].embedding
+    Args:
+        texts (list): Input texts (must be non-empty strings)
+        priority (int): Scheduling priority; batch ingestion yields to user queries
+        deadline (Deadline, optional): Request deadline bounding timeouts and retries
+        provider (str, optional): Provider name. Defaults to EMBEDDING_PROVIDER from config.
+
+    Returns:
+        list: Embedding vectors in input order, or None if the batch failed
+    """
+    if not texts:
+        return []
+
+    try:
+        return get_provider(provider).embed_batch(
+            [_prepare_text(text) for text in texts], priority=priority, deadline=deadline
+        )
 
+    except SchedulerOverloaded:
+        raise
     except Exception as e:
-        print(f"Error getting embedding: {str(e)}")
+        print(f"Error getting embeddings: {str(e)}")
         return None
 
 
@@ -53,9 +245,13 @@ if __name__ == "__main__":
     # Test the embedding function
     sample_text = "This is sample text for embedding"
     embedding = get_embedding(sample_text)
-    
+
     if embedding:
         print(f"Generated embedding vector of length {len(embedding)} for sample text")
         print(f"First 5 values: {embedding[:5]}")
     else:
         print("Failed to generate embedding")
+
+    # The local backend works offline
+    local_embedding = get_embedding(sample_text, provider="hashing")
+    print(f"Local hashing embedding has length {len(local_embedding)}")
@@ -0,0 +1,43 @@
+"""
+Fast JSON encoding for API responses.
+
+Uses orjson when it is installed and falls back to the standard library
+(with compact separators) otherwise, so the output is always valid JSON.
+"""
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data):
+    """
+    Serialize data to a compact JSON string.
+
+    Args:
+        data: JSON-serializable data (numpy floats must already be converted)
+
+    Returns:
+        str: The encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def dumps_bytes(data):
+    """Serialize data to compact UTF-8 encoded JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that renders with the fast encoder."""
+
+    def render(self, content):
+        return dumps_bytes(content)
@@ -0,0 +1,747 @@
+"""
+Versioned storage and hot reloading for the document embeddings index.
+
+Every published index lives in its own directory under data/index/<version>/
+and the data/index/CURRENT file names the version that should be served.
+Publishing writes the whole version directory first and only then swaps
+CURRENT with os.replace, so readers never see a half-written index.
+
+The PDFs an index version reads are stored by content under
+data/.documents/<digest>/<file name>, and its pages reference those
+copies. Replacing a document therefore never changes the pages a version
+that is still being served reads; copies no version on disk references
+any more are removed when old versions are pruned.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl  # POSIX only; elsewhere publishing is only serialized within a process
+except ImportError:
+    fcntl = None
+from config import INDEX_RELOAD_CHECK_INTERVAL, INDEX_VERSIONS_TO_KEEP, DEFAULT_PARTY, ASSET_DIGEST_LENGTH
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(current_dir, "data")
+INDEX_ROOT = os.path.join(DATA_DIR, "index")
+CURRENT_FILE = os.path.join(INDEX_ROOT, "CURRENT")
+PUBLISH_LOCK_FILE = os.path.join(INDEX_ROOT, ".publish.lock")
+DOCUMENT_STORE_DIR = os.path.join(DATA_DIR, ".documents")
+EMBEDDINGS_FILENAME = "document_embeddings.json"
+MANIFEST_FILENAME = "manifest.json"
+
+# Pre-versioning layout, still honoured when no CURRENT pointer exists
+LEGACY_EMBEDDINGS_FILE = os.path.join(DATA_DIR, EMBEDDINGS_FILENAME)
+PDF_INFO_FILE = os.path.join(DATA_DIR, "pdf_info.json")
+DEFAULT_PDF_PATH = os.path.join(DATA_DIR, "Liberal.pdf")
+LEGACY_VERSION = "legacy"
+DEFAULT_PROVIDER = "openai"  # Indexes built before providers were recorded used OpenAI
+
+
+def atomic_write_json(path, data):
+    """
+    Write JSON to a file so that readers see either the old or the new content.
+
+    Args:
+        path (str): Destination file path
+        data: JSON-serializable data
+    """
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def atomic_write_text(path, text):
+    """Write a small text file atomically (used for the CURRENT pointer)."""
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def resolve_pdf_path(pdf_path):
+    """
+    Resolve a stored PDF path, falling back to the data directory.
+
+    Index files may have been built on another machine, so if the stored
+    absolute path does not exist we look for the same file name in data/.
+    """
+    if pdf_path and os.path.exists(pdf_path):
+        return pdf_path
+    if pdf_path:
+        stored_path = os.path.join(DOCUMENT_STORE_DIR, os.path.basename(os.path.dirname(pdf_path)), os.path.basename(pdf_path))
+        if os.path.exists(stored_path):
+            return stored_path
+        local_path = os.path.join(DATA_DIR, os.path.basename(pdf_path))
+        if os.path.exists(local_path):
+            return local_path
+    return DEFAULT_PDF_PATH
+
+
+def stored_document_path(path, name=None):
+    """
+    Where the content of a document is (or would be) stored for index versions to read.
+
+    Args:
+        path (str): The document
+        name (str, optional): File name to store it under. Defaults to the name of path.
+
+    Returns:
+        str: data/.documents/<digest>/<name>
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            sha.update(chunk)
+    return os.path.join(DOCUMENT_STORE_DIR, sha.hexdigest()[:ASSET_DIGEST_LENGTH], name or os.path.basename(path))
+
+
+def store_document(path, name=None, move=False):
+    """
+    Keep an immutable copy of a document for index versions to read.
+
+    Args:
+        path (str): The document
+        name (str, optional): File name to store it under. Defaults to the name of path.
+        move (bool): Move the file into the store instead of copying it
+
+    Returns:
+        str: Path of the stored copy
+    """
+    stored_path = stored_document_path(path, name)
+    if os.path.exists(stored_path):
+        if move:
+            os.remove(path)
+        return stored_path
+    os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+    if move:
+        os.replace(path, stored_path)
+    else:
+        # A copy, not a link: the original may later be rewritten in place
+        tmp_path = f"{stored_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, stored_path)
+    return stored_path
+
+
+def is_stored_document(path):
+    """Whether a path is a copy in the document store."""
+    return os.path.dirname(os.path.dirname(os.path.abspath(path))) == DOCUMENT_STORE_DIR
+
+
+def document_path(document, version=None):
+    """
+    PDF to read the pages of a document from.
+
+    Args:
+        document (str): Document file name, e.g. "Liberal.pdf"
+        version (str, optional): Content version (digest prefix) of a stored copy, e.g.
+            from a page URL; ignored if no such copy exists
+
+    Returns:
+        str: The stored copy of that version, else the copy the served index reads,
+            else the file in the data directory
+    """
+    document = os.path.basename(document)
+    if version and len(version) == ASSET_DIGEST_LENGTH and all(c in "0123456789abcdef" for c in version):
+        stored_path = os.path.join(DOCUMENT_STORE_DIR, version, document)
+        if os.path.isfile(stored_path):
+            return stored_path
+    return index_manager.document_path(document) or os.path.join(DATA_DIR, document)
+
+
+def document_version(path):
+    """Content version of a stored copy (the digest prefix in its path), or None for other files."""
+    return os.path.basename(os.path.dirname(path)) if is_stored_document(path) else None
+
+
+def new_version():
+    """Create a sortable, unique version identifier."""
+    return time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+
+
+@contextmanager
+def publish_lock():
+    """
+    Serialize building and publishing index versions across the worker
+    processes sharing the data directory, e.g. so only one of them builds
+    the first index on startup.
+    """
+    os.makedirs(INDEX_ROOT, exist_ok=True)
+    with open(PUBLISH_LOCK_FILE, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        # Closing the file releases the lock
+        yield
+
+
+def read_current_version():
+    """
+    Read the version named by the CURRENT pointer.
+
+    Returns:
+        str: The current version, or None if no versioned index is published
+    """
+    try:
+        with open(CURRENT_FILE, "r") as f:
+            version = f.read().strip()
+            return version or None
+    except FileNotFoundError:
+        return None
+
+
+def publish_index(embeddings_data, pdf_path, version=None, provider=DEFAULT_PROVIDER):
+    """
+    Publish a new index version and atomically make it current.
+
+    Args:
+        embeddings_data (list): Page references with embeddings and metadata
+        pdf_path (str): Path of the (first) PDF the index was built from
+        version (str, optional): Version identifier. Defaults to a new timestamped id.
+        provider (str): Name of the embedding provider that built the index
+
+    Returns:
+        str: The published version
+    """
+    version = version or new_version()
+    os.makedirs(INDEX_ROOT, exist_ok=True)
+
+    # Boilerplate is per document, so it goes in the manifest rather than every page
+    boilerplate = {}
+    for doc in embeddings_data:
+        lines = doc.pop("boilerplate", None)
+        if lines:
+            boilerplate.setdefault(doc.get("document") or os.path.basename(doc.get("file") or pdf_path), sorted(lines))
+
+    # Pages read stored copies of their PDFs, which later uploads never replace
+    stored = {}
+    pdf_path = resolve_pdf_path(pdf_path)
+    for doc in embeddings_data:
+        path = resolve_pdf_path(doc.get("file") or pdf_path)
+        if not is_stored_document(path) and os.path.isfile(path):
+            if path not in stored:
+                stored[path] = store_document(path)
+            path = stored[path]
+        doc["file"] = path
+    pdf_path = stored.get(pdf_path, pdf_path)
+
+    # Keep each party's pages (and each of its years) in one contiguous block of rows
+    embeddings_data = sorted(embeddings_data, key=lambda doc: (
+        doc.get("party", DEFAULT_PARTY), doc.get("year") or 0, doc.get("document", ""), doc["page_num"]
+    ))
+
+    # Build the version in a staging directory so a partial write is never visible
+    staging_dir = os.path.join(INDEX_ROOT, f".staging-{version}")
+    os.makedirs(staging_dir)
+    atomic_write_json(os.path.join(staging_dir, EMBEDDINGS_FILENAME), embeddings_data)
+    atomic_write_json(os.path.join(staging_dir, MANIFEST_FILENAME), {
+        "version": version,
+        "pdf_path": pdf_path,
+        # Queries must be embedded by the same provider, with the same dimension
+        "embedding_provider": provider,
+        "embedding_dimension": len(embeddings_data[0]["embedding"]) if embeddings_data else None,
+        "document_count": len(embeddings_data),
+        "documents": sorted({doc["document"] for doc in embeddings_data if "document" in doc}),
+        "files": sorted({doc["file"] for doc in embeddings_data}),
+        # Document -> normalized header and footer lines stripped from its pages before embedding
+        "boilerplate": boilerplate,
+        "created_at": time.time(),
+    })
+    os.rename(staging_dir, os.path.join(INDEX_ROOT, version))
+
+    # Flip the pointer last
+    atomic_write_text(CURRENT_FILE, version)
+    print(f"Published index version {version} with {len(embeddings_data)} documents")
+
+    prune_old_versions()
+    return version
+
+
+def prune_old_versions(keep=INDEX_VERSIONS_TO_KEEP):
+    """Remove all but the newest `keep` versions, never touching the current one."""
+    current = read_current_version()
+    versions = sorted(
+        name for name in os.listdir(INDEX_ROOT)
+        if not name.startswith(".") and os.path.isdir(os.path.join(INDEX_ROOT, name))
+    )
+    for name in versions[:-keep] if keep > 0 else versions:
+        if name == current:
+            continue
+        shutil.rmtree(os.path.join(INDEX_ROOT, name), ignore_errors=True)
+    prune_stored_documents()
+
+
+def prune_stored_documents():
+    """Remove the stored PDFs that no version left on disk reads."""
+    if not os.path.isdir(DOCUMENT_STORE_DIR):
+        return
+    referenced = set()
+    for name in os.listdir(INDEX_ROOT):
+        manifest_path = os.path.join(INDEX_ROOT, name, MANIFEST_FILENAME)
+        if name.startswith(".") or not os.path.isfile(manifest_path):
+            continue
+        try:
+            with open(manifest_path, "r") as f:
+                files = json.load(f).get("files", [])
+        except Exception as e:
+            print(f"Error reading manifest of index version {name}, keeping stored documents: {str(e)}")
+            return
+        # Match on <digest>/<name>, in case the data directory has moved
+        referenced.update((os.path.basename(os.path.dirname(path)), os.path.basename(path)) for path in files)
+
+    for digest in os.listdir(DOCUMENT_STORE_DIR):
+        digest_dir = os.path.join(DOCUMENT_STORE_DIR, digest)
+        for name in os.listdir(digest_dir):
+            if (digest, name) not in referenced and not name.endswith(".tmp"):
+                os.remove(os.path.join(digest_dir, name))
+        if not os.listdir(digest_dir):
+            os.rmdir(digest_dir)
+
+
+class DocumentIndex:
+    """
+    A fully loaded, immutable index version shared by concurrent requests.
+
+    Pages carry party, document, year and section metadata, and the pages
+    of any near-duplicates collapsed into them. Rows of one party are
+    expected to be contiguous (publish_index sorts them), so a party filter
+    becomes a row range; year filters use precomputed masks. Each outline
+    section of a document is also a contiguous run of rows, which the
+    section index (one centroid per section) uses to route large searches
+    to the most relevant sections.
+    """
+
+    def __init__(self, version, document_embeddings, pdf_path, provider=DEFAULT_PROVIDER, boilerplate=None):
+        self.version = version
+        self.pdf_path = resolve_pdf_path(pdf_path)
+        self.provider = provider
+
+        # Keep the page references without their embeddings; vectors live in the matrix.
+        # Indexes built before the corpus existed hold one Liberal document.
+        self.documents = []
+        # document -> normalized lines stripped from its pages at ingest time
+        self.boilerplate = {document: frozenset(lines) for document, lines in (boilerplate or {}).items()}
+        self.document_files = {}  # document -> PDF its pages are read from
+        for doc in document_embeddings:
+            ref = {key: value for key, value in doc.items() if key not in ("embedding", "boilerplate")}
+            ref.setdefault("document", os.path.basename(ref.get("file") or self.pdf_path))
+            ref.setdefault("party", DEFAULT_PARTY)
+            ref.setdefault("year", None)
+            ref.setdefault("section", None)
+            ref.setdefault("page_label", str(ref["page_num"]))
+            ref.setdefault("pages", [ref["page_num"]])
+            self.document_files.setdefault(ref["document"], resolve_pdf_path(ref.get("file") or self.pdf_path))
+            # Versions published before the manifest held it kept boilerplate on every page
+            if doc.get("boilerplate") and ref["document"] not in self.boilerplate:
+                self.boilerplate[ref["document"]] = frozenset(doc["boilerplate"])
+            self.documents.append(ref)
+
+        # Pre-normalize once so scoring a query is a single matrix-vector product
+        if document_embeddings:
+            matrix = np.asarray([doc["embedding"] for doc in document_embeddings], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.matrix = matrix / norms
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+
+        self.dimension = self.matrix.shape[1]
+        self.refcount = 0
+        self.retired = False
+
+        # Row ranges per party, and masks for parties whose rows are not contiguous
+        self.party_ranges = {}
+        self.party_masks = {}
+        parties = np.asarray([doc["party"] for doc in self.documents], dtype=object)
+        for party in dict.fromkeys(parties.tolist()):
+            rows = np.flatnonzero(parties == party)
+            if rows[-1] - rows[0] + 1 == len(rows):
+                self.party_ranges[party] = (int(rows[0]), int(rows[-1]) + 1)
+            else:
+                self.party_masks[party] = parties == party
+
+        # One mask per year (years span parties, so they are rarely contiguous)
+        years = np.asarray([doc["year"] for doc in self.documents], dtype=object)
+        self.year_masks = {
+            year: years == year for year in dict.fromkeys(years.tolist()) if year is not None
+        }
+
+        self._build_section_index()
+
+    def _build_section_index(self):
+        """
+        Table of contents: one entry per run of rows from one outline section
+        of one document (pages outside any section form runs of their own),
+        with the normalized centroid of its page vectors.
+        """
+        self.sections = []
+        for row, doc in enumerate(self.documents):
+            current = self.sections[-1] if self.sections else None
+            if current is None or (current["document"], current["title"]) != (doc["document"], doc["section"]):
+                self.sections.append({
+                    "document": doc["document"],
+                    "party": doc["party"],
+                    "year": doc["year"],
+                    "title": doc["section"],
+                    "first_page": doc["page_num"],
+                    "start": row,
+                })
+            self.sections[-1].update(last_page=doc["page_num"], end=row + 1)
+
+        if self.sections:
+            starts = np.asarray([section["start"] for section in self.sections])
+            centroids = np.add.reduceat(self.matrix, starts, axis=0)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.section_matrix = centroids / norms
+            self.section_bounds = np.stack([starts, [section["end"] for section in self.sections]], axis=1)
+        else:
+            self.section_matrix = np.zeros((0, self.dimension), dtype=np.float32)
+            self.section_bounds = np.zeros((0, 2), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def parties(self):
+        """Parties with at least one page in this index."""
+        return sorted(set(self.party_ranges) | set(self.party_masks))
+
+    def rows_for(self, party=None, year=None):
+        """
+        Rows to scan for a filtered query.
+
+        Args:
+            party (str, optional): Only this party's pages
+            year (int, optional): Only pages from documents of this year
+
+        Returns:
+            tuple: (start, end, mask). Only rows in [start, end) are scanned;
+                mask (boolean array over all rows, or None) further restricts them.
+                Returns (0, 0, None) if nothing matches.
+        """
+        start, end, mask = 0, len(self), None
+        if party is not None:
+            if party in self.party_ranges:
+                start, end = self.party_ranges[party]
+            elif party in self.party_masks:
+                mask = self.party_masks[party]
+            else:
+                return 0, 0, None
+        if year is not None:
+            if year not in self.year_masks:
+                return 0, 0, None
+            mask = self.year_masks[year] if mask is None else mask & self.year_masks[year]
+        return start, end, mask
+
+    def route_sections(self, query_vector, top_sections, start=0, end=None, mask=None):
+        """
+        Pick the sections whose centroids are most similar to a query.
+
+        Args:
+            query_vector (np.ndarray): Normalized query vector
+            top_sections (int): Number of sections to return
+            start, end, mask: Row filter from rows_for; only sections inside it are considered
+
+        Returns:
+            list: (start, end) row ranges of the chosen sections, most similar first
+        """
+        end = len(self) if end is None else end
+        bounds = self.section_bounds
+        # A section belongs to one document, so one row decides whether the filter keeps it
+        eligible = (bounds[:, 0] >= start) & (bounds[:, 1] <= end)
+        if mask is not None:
+            eligible &= mask[np.minimum(bounds[:, 0], len(self) - 1)]
+        candidates = np.flatnonzero(eligible)
+        if len(candidates) == 0:
+            return []
+        scores = self.section_matrix[candidates] @ query_vector
+        best = candidates[np.argsort(-scores, kind="stable")[:top_sections]]
+        return [(int(bounds[i, 0]), int(bounds[i, 1])) for i in best]
+
+    def table_of_contents(self):
+        """Sections in index order, without their row bounds."""
+        return [
+            {key: value for key, value in section.items() if key not in ("start", "end")}
+            for section in self.sections
+        ]
+
+
+def read_index_data(version):
+    """
+    Read the manifest and page entries (with embeddings) of a published version.
+
+    Args:
+        version (str): Version to read
+
+    Returns:
+        tuple: (manifest dict, list of page entries)
+    """
+    version_dir = os.path.join(INDEX_ROOT, version)
+    with open(os.path.join(version_dir, MANIFEST_FILENAME), "r") as f:
+        manifest = json.load(f)
+    with open(os.path.join(version_dir, EMBEDDINGS_FILENAME), "r") as f:
+        document_embeddings = json.load(f)
+    return manifest, document_embeddings
+
+
+def load_index(version):
+    """
+    Load a published index version from disk.
+
+    Args:
+        version (str): Version to load
+
+    Returns:
+        DocumentIndex: The loaded index
+    """
+    manifest, document_embeddings = read_index_data(version)
+    return DocumentIndex(
+        version,
+        document_embeddings,
+        manifest.get("pdf_path"),
+        provider=manifest.get("embedding_provider", DEFAULT_PROVIDER),
+        boilerplate=manifest.get("boilerplate"),
+    )
+
+
+def document_boilerplate(document, pdf_path):
+    """
+    Boilerplate stripped at ingest time from the pages of a document's PDF.
+
+    Args:
+        document (str): Document file name
+        pdf_path (str): The copy of the PDF being read, e.g. from document_path
+
+    Returns:
+        frozenset: Normalized lines, from the served index or else from a version on disk
+            that reads the same copy; None if none is known
+    """
+    boilerplate = index_manager.document_boilerplate(document, pdf_path)
+    if boilerplate is not None or not is_stored_document(pdf_path):
+        return boilerplate
+    for name in sorted(os.listdir(INDEX_ROOT), reverse=True) if os.path.isdir(INDEX_ROOT) else []:
+        try:
+            with open(os.path.join(INDEX_ROOT, name, MANIFEST_FILENAME), "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if pdf_path in manifest.get("files", ()):
+            return frozenset(manifest.get("boilerplate", {}).get(document, ()))
+    return None
+
+
+def read_legacy_index_data():
+    """
+    Read the unversioned data/document_embeddings.json file, if present.
+
+    Returns:
+        tuple: (PDF path, list of page entries), or None if there is no usable legacy file
+    """
+    if not os.path.exists(LEGACY_EMBEDDINGS_FILE) or os.path.getsize(LEGACY_EMBEDDINGS_FILE) == 0:
+        return None
+
+    pdf_path = DEFAULT_PDF_PATH
+    try:
+        with open(PDF_INFO_FILE, "r") as f:
+            pdf_path = json.load(f).get("pdf_path", DEFAULT_PDF_PATH)
+    except Exception as e:
+        print(f"Error loading PDF info: {str(e)}")
+
+    with open(LEGACY_EMBEDDINGS_FILE, "r") as f:
+        document_embeddings = json.load(f)
+    return pdf_path, document_embeddings
+
+
+def load_legacy_index():
+    """
+    Load the unversioned data/document_embeddings.json file, if present.
+
+    Returns:
+        DocumentIndex: The loaded index, or None if there is no usable legacy file
+    """
+    legacy = read_legacy_index_data()
+    if legacy is None:
+        return None
+    pdf_path, document_embeddings = legacy
+    return DocumentIndex(LEGACY_VERSION, document_embeddings, pdf_path)
+
+
+def import_legacy_index():
+    """
+    Publish the unversioned embeddings file as an index version, so a
+    deployment upgraded from the single-file layout keeps its embeddings
+    instead of embedding the corpus again.
+
+    Returns:
+        str: The published version, or None if there is no usable legacy file
+    """
+    legacy = read_legacy_index_data()
+    if legacy is None or not legacy[1]:
+        return None
+    pdf_path, document_embeddings = legacy
+    return publish_index(document_embeddings, resolve_pdf_path(pdf_path), provider=DEFAULT_PROVIDER)
+
+
+def load_current_index():
+    """Load the version named by CURRENT, falling back to the legacy file."""
+    version = read_current_version()
+    if version is not None:
+        return load_index(version)
+    return load_legacy_index()
+
+
+class IndexManager:
+    """
+    Serve the current index and hot-swap in new versions without downtime.
+
+    Requests hold the index through acquire(), which counts references. When
+    a new version appears it is loaded on a background thread while the old
+    one keeps serving; after the swap the old version is released as soon as
+    its last in-flight request finishes.
+    """
+
+    def __init__(self, check_interval=INDEX_RELOAD_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._active = None
+        self._loading_version = None
+        self._last_check = 0.0
+        self._swap_listeners = []
+
+    def add_swap_listener(self, callback):
+        """Register callback(old_version, new_version), called after each swap."""
+        self._swap_listeners.append(callback)
+
+    @property
+    def version(self):
+        """Version of the index currently being served, or None."""
+        active = self._active
+        return active.version if active is not None else None
+
+    def document_path(self, document):
+        """PDF the served index reads a document's pages from, or None."""
+        active = self._active
+        return active.document_files.get(document) if active is not None else None
+
+    def document_boilerplate(self, document, pdf_path):
+        """Boilerplate of a document, if the served index reads its pages from pdf_path."""
+        active = self._active
+        if active is not None and active.document_files.get(document) == pdf_path:
+            return active.boilerplate.get(document, frozenset())
+        return None
+
+    @contextmanager
+    def acquire(self):
+        """
+        Hold the current index for the duration of a request.
+
+        Yields:
+            DocumentIndex: The active index, or None if nothing is published yet
+        """
+        if self._active is None:
+            self.reload()
+        else:
+            self.check_for_update()
+
+        with self._lock:
+            index = self._active
+            if index is not None:
+                index.refcount += 1
+        try:
+            yield index
+        finally:
+            if index is not None:
+                self._release(index)
+
+    def reload(self):
+        """Synchronously load the current version (used on first use and after ingestion)."""
+        with self._load_lock:
+            try:
+                index = load_current_index()
+            except Exception as e:
+                print(f"Error loading embeddings: {str(e)}")
+                return
+            if index is not None and (self._active is None or index.version != self._active.version):
+                self._install(index)
+
+    def check_for_update(self):
+        """Start a background load if CURRENT points at a version we are not serving."""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        version = read_current_version()
+        if version is None or version == self.version:
+            return
+
+        with self._lock:
+            if self._loading_version == version:
+                return
+            self._loading_version = version
+
+        thread = threading.Thread(target=self._load_in_background, args=(version,), daemon=True)
+        thread.start()
+
+    def _load_in_background(self, version):
+        try:
+            with self._load_lock:
+                if version != self.version:
+                    self._install(load_index(version))
+        except Exception as e:
+            print(f"Error loading index version {version}: {str(e)}")
+        finally:
+            with self._lock:
+                if self._loading_version == version:
+                    self._loading_version = None
+
+    def _install(self, index):
+        release_now = False
+        with self._lock:
+            old = self._active
+            self._active = index
+            if old is not None:
+                old.retired = True
+                release_now = old.refcount == 0
+        print(f"Serving index version {index.version} ({len(index)} documents)")
+
+        if old is not None:
+            if release_now:
+                self._retire(old)
+            for callback in self._swap_listeners:
+                try:
+                    callback(old.version, index.version)
+                except Exception as e:
+                    print(f"Error in index swap listener: {str(e)}")
+
+    def _release(self, index):
+        with self._lock:
+            index.refcount -= 1
+            release_now = index.retired and index.refcount == 0
+        if release_now:
+            self._retire(index)
+
+    @staticmethod
+    def _retire(index):
+        # Drop the large arrays as soon as the last reader is gone
+        index.matrix = None
+        index.section_matrix = None
+        index.documents = []
+
+
+# Shared manager for the process
+index_manager = IndexManager()
@@ -0,0 +1,297 @@
+"""
+Background ingestion of platform documents.
+
+Uploading a document queues a job on a small worker pool; the request that
+uploaded it returns immediately with the job's ID. A job extracts the
+document's pages, embeds them and commits them as a new index version,
+which this worker swaps in at once and other workers pick up on their next
+index check. Requests never ingest inline: until an index is published,
+queries simply find no documents.
+
+Commits hold a lock file under data/index/, so the worker processes of one
+host never publish at the same time, and the first-start build runs in
+only one of them.
+
+Uploads are staged under a temporary name next to the corpus documents.
+A commit moves the upload into the document store, where the new
+version's pages read it, adds it to data/corpus.json and publishes; only
+then is the plain copy in the data directory (used for downloads and full
+rebuilds) replaced. Versions still being served keep reading their own
+stored copy, and a failed ingestion leaves the PDFs and the manifest as
+they were.
+
+Each job keeps a list of progress events, e.g.
+
+    {"stage": "extracted", "done": 12, "total": 40}
+    {"stage": "embedded", "done": 32, "total": 38}
+    {"stage": "committed", "version": "20250101T120000Z-ab12cd34"}
+
+that clients can poll or stream. Jobs live in the memory of the worker
+that ran them, so status requests must reach the same worker.
+"""
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from data_processing import embed_document, merge_into_current_index, build_corpus_index
+from index_store import (
+    DATA_DIR, index_manager, publish_index, publish_lock, read_current_version, import_legacy_index,
+    store_document, stored_document_path,
+)
+from corpus import load_corpus, register_document, save_corpus
+from config import INGESTION_WORKERS, INGESTION_JOB_HISTORY, EMBEDDING_PROVIDER
+
+# Job states; the last two are final
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+def staging_path(file):
+    """
+    A new temporary path for a document being uploaded, in the data directory
+    so moving it into place is atomic.
+
+    Args:
+        file (str): File name of the document
+    """
+    return os.path.join(DATA_DIR, f".{file}.{uuid.uuid4().hex}.upload")
+
+
+class IngestionJob:
+    """One queued or running ingestion, with its progress events."""
+
+    def __init__(self, kind, document=None, party=None):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind  # "document" or "corpus"
+        self.document = document
+        self.party = party
+        self.status = QUEUED
+        self.version = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (SUCCEEDED, FAILED)
+
+    def report(self, stage, **fields):
+        """Append a progress event and wake up anyone streaming this job."""
+        with self._changed:
+            self.events.append({"stage": stage, "time": round(time.time() - self.created_at, 3), **fields})
+            self._changed.notify_all()
+
+    def finish(self, status, version=None, error=None):
+        with self._changed:
+            self.status = status
+            self.version = version
+            self.error = error
+            self.finished_at = time.time()
+            self._changed.notify_all()
+
+    def wait_for_events(self, after, timeout=None):
+        """
+        Wait until there are events past the first `after`, or the job finishes.
+
+        Returns:
+            list: The new events (empty on timeout or if the job finished without new ones)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.events) > after or self.finished, timeout=timeout)
+            return list(self.events[after:])
+
+    def to_dict(self):
+        with self._changed:
+            latest = {}
+            for event in self.events:
+                latest[event["stage"]] = event
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "document": self.document,
+                "party": self.party,
+                "status": self.status,
+                "version": self.version,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "progress": {stage: {key: value for key, value in event.items() if key != "stage"}
+                             for stage, event in latest.items()},
+            }
+
+
+class IngestionManager:
+    """
+    Run ingestion jobs on a background worker pool.
+
+    Documents are extracted and embedded concurrently, but commits are
+    serialized: each one merges into the then-current index, so two
+    documents finishing together can't drop each other's pages.
+    """
+
+    def __init__(self, max_workers=INGESTION_WORKERS, history=INGESTION_JOB_HISTORY):
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()  # job id -> job, oldest first
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        """All remembered jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def has_pending(self, kind=None):
+        with self._lock:
+            return any(not job.finished and (kind is None or job.kind == kind) for job in self._jobs.values())
+
+    def _add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            # Forget the oldest finished jobs
+            finished = [job_id for job_id, old in self._jobs.items() if old.finished]
+            for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+                del self._jobs[job_id]
+        job.report(QUEUED)
+
+    def submit_document(self, staged_path, file, party, year=None, title=None, name=None, provider=EMBEDDING_PROVIDER):
+        """
+        Queue a document for ingestion.
+
+        Args:
+            staged_path (str): Path of the uploaded PDF, from staging_path; the job owns it
+                and moves it to the document store when the document is committed
+            file (str): File name of the document in the data directory and the corpus manifest
+            party (str): Party id
+            year (int, optional): Platform year
+            title (str, optional): Platform title
+            name (str, optional): Display name of the party, if it is new
+            provider (str, optional): Embedding provider name
+
+        Returns:
+            IngestionJob: The queued job
+        """
+        job = IngestionJob("document", document=file, party=party)
+        self._add(job)
+        self._executor.submit(self._run_document, job, staged_path, file, party, year, title, name, provider)
+        return job
+
+    def submit_corpus_build(self, provider=EMBEDDING_PROVIDER, only_if_missing=False):
+        """
+        Queue a build of the whole corpus.
+
+        Args:
+            provider (str, optional): Embedding provider name
+            only_if_missing (bool): First-start build: skip it if any worker has published
+                an index by the time this one runs, and publish the legacy embeddings file
+                instead of embedding the corpus if there is one
+
+        Returns:
+            IngestionJob: The queued job
+        """
+        job = IngestionJob("corpus")
+        self._add(job)
+        self._executor.submit(self._run_corpus_build, job, provider, only_if_missing)
+        return job
+
+    def _run_document(self, job, staged_path, file, party, year, title, name, provider):
+        job.status = RUNNING
+        job.report(RUNNING)
+        try:
+            # The document is embedded from the staged copy, as it will be referenced once committed
+            stored_path = stored_document_path(staged_path, file)
+            entries = embed_document(
+                staged_path, provider=provider, indexed_path=stored_path,
+                metadata={"document": file, "party": party, "year": year, "title": title},
+                progress=lambda stage, done, total: job.report(stage, done=done, total=total),
+            )
+            if not entries:
+                raise ValueError("No pages with enough text could be embedded")
+
+            with self._commit_lock, publish_lock():
+                version = self._commit_document(entries, staged_path, stored_path, file, party, year, title, name, provider)
+            index_manager.reload()
+            job.report("committed", version=version, pages=len(entries))
+            job.finish(SUCCEEDED, version=version)
+        except Exception as e:
+            print(f"Error ingesting {file}: {str(e)}")
+            job.report(FAILED, error=str(e))
+            job.finish(FAILED, error=str(e))
+        finally:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+
+    @staticmethod
+    def _commit_document(entries, staged_path, stored_path, file, party, year, title, name, provider):
+        """
+        Register the document, move its PDF into the document store and publish the
+        merged index, restoring the previous manifest if any step fails; then replace
+        the plain copy in the data directory. Runs under the commit lock.
+
+        Returns:
+            str: The published version
+        """
+        previous_corpus = load_corpus()
+        new_copy = not os.path.exists(stored_path)
+        try:
+            register_document(file, party, year=year, title=title, name=name)
+            merged = merge_into_current_index(entries, {file}, provider)
+            store_document(staged_path, file, move=True)
+            version = publish_index(merged, stored_path, provider=provider)
+        except Exception:
+            save_corpus(previous_corpus)
+            if new_copy and os.path.exists(stored_path):
+                os.remove(stored_path)
+                if not os.listdir(os.path.dirname(stored_path)):
+                    os.rmdir(os.path.dirname(stored_path))
+            raise
+
+        # No index reads the plain copy, so it can change once the version is published
+        pdf_path = os.path.join(DATA_DIR, file)
+        tmp_path = f"{pdf_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            shutil.copyfile(stored_path, tmp_path)
+            os.replace(tmp_path, pdf_path)
+        except OSError as e:
+            print(f"Error replacing {pdf_path} with the committed document: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return version
+
+    def _run_corpus_build(self, job, provider, only_if_missing):
+        job.status = RUNNING
+        job.report(RUNNING)
+        try:
+            with self._commit_lock, publish_lock():
+                # Every worker queues the first-start build; the first to get the lock does it
+                published = read_current_version() if only_if_missing else None
+                if published is None:
+                    version = import_legacy_index() if only_if_missing else None
+                    if version is None:
+                        version = build_corpus_index(provider=provider)
+            if published is not None:
+                job.report("skipped", version=published)
+                job.finish(SUCCEEDED, version=published)
+                return
+            if version is None:
+                raise ValueError("No corpus documents could be embedded")
+            index_manager.reload()
+            job.report("committed", version=version)
+            job.finish(SUCCEEDED, version=version)
+        except Exception as e:
+            print(f"Error building corpus index: {str(e)}")
+            job.report(FAILED, error=str(e))
+            job.finish(FAILED, error=str(e))
+
+
+# Shared manager for the process
+ingestion_manager = IngestionManager()
@@ -1,53 +1,157 @@
-from retriever import retrieve_similar_documents, clear_cache
+from retriever import retrieve_similar_documents, rank_documents, embed_query, hydrate_document, cache_results, clear_cache, get_cache_stats
 from analyzer import generate_analysis
+from completion_cache import completion_cache
+from routing import model_router
+from corpus import party_name
+from tracing import traced
 import json
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from config import TOP_N_DOCUMENTS
+from config import TOP_N_DOCUMENTS, DEFAULT_PARTY
 
 load_dotenv()
 
 
 class Party:
-    def __init__(self):
-        """Initialize the Party object."""
+    def __init__(self, name=DEFAULT_PARTY):
+        """
+        Initialize the Party object.
+        
+        Args:
+            name (str): Party id in the corpus, e.g. "liberal".
+        """
+        self.name = name
+        self.display_name = party_name(name)
         self._cache_enabled = True
     
-    def retrieve(self, query):
+    @traced("retrieve")
+    def retrieve(self, query, deadline=None, year=None):
         """
-        Retrieve similar documents based on the query.
+        Retrieve similar documents from this party's platforms based on the query.
         
         Args:
             query (str): The query to search for.
+            deadline (Deadline, optional): Request deadline for upstream calls.
+            year (int, optional): Only search platforms from this year.
             
         Returns:
             list: A list of similar documents.
         """
-        return retrieve_similar_documents(query, top_n=TOP_N_DOCUMENTS)
+        return retrieve_similar_documents(query, top_n=TOP_N_DOCUMENTS, deadline=deadline, party=self.name, year=year)
+    
+    @traced("retrieve")
+    def rank(self, query, deadline=None, year=None):
+        """
+        Rank this party's documents for the query without loading their text.
+        
+        Args:
+            query (str): The query to search for.
+            deadline (Deadline, optional): Request deadline for upstream calls.
+            year (int, optional): Only search platforms from this year.
+            
+        Returns:
+            tuple: (index version, ranked hits).
+        """
+        return rank_documents(query, top_n=TOP_N_DOCUMENTS, deadline=deadline, party=self.name, year=year)
+    
+    def hydrate(self, hit):
+        """
+        Load the text of a ranked hit.
+        
+        Args:
+            hit (dict): A hit returned by rank.
+            
+        Returns:
+            dict: The document with its text.
+        """
+        return hydrate_document(hit)
+    
+    def cache_results(self, version, query, documents, year=None):
+        """
+        Cache the hydrated documents for a query.
+        
+        Args:
+            version (str): Index version the documents were ranked against.
+            query (str): The query.
+            documents (list): The hydrated documents.
+            year (int, optional): Year filter the documents were ranked with.
+        """
+        cache_results(version, query, documents, party=self.name, year=year, top_n=TOP_N_DOCUMENTS)
     
-    def analyze(self, query, similar_docs):
+    def analyze(self, query, similar_docs, deadline=None):
         """
         Generate analysis based on the query and similar documents.
         
         Args:
             query (str): The query to analyze.
             similar_docs (list): A list of similar documents.
+            deadline (Deadline, optional): Request deadline for upstream calls.
             
         Returns:
             dict: The analysis result.
         """
-        return generate_analysis(query, similar_docs)
+        return generate_analysis(query, similar_docs, deadline=deadline, party=self.name)
+    
+    def compare(self, query, others, deadline=None, year=None):
+        """
+        Answer the same query for this party and others, concurrently.
+        
+        The query is embedded once; retrieval and analysis then run for all
+        parties in parallel, so the total time is close to the slowest party.
+        
+        Args:
+            query (str): The query to compare the parties on.
+            others (list): Other Party objects.
+            deadline (Deadline, optional): Request deadline for upstream calls.
+            year (int, optional): Only search platforms from this year.
+            
+        Returns:
+            dict: Party id -> {"party_name", "similar_documents", "analysis"}.
+        """
+        parties = [self] + [party for party in others if party.name != self.name]
+        embed_query(query, deadline=deadline)
+        
+        def answer(party):
+            similar_docs = party.retrieve(query, deadline=deadline, year=year)
+            return party.name, {
+                "party_name": party.display_name,
+                "similar_documents": similar_docs,
+                "analysis": party.analyze(query, similar_docs, deadline=deadline),
+            }
+        
+        with ThreadPoolExecutor(max_workers=len(parties)) as executor:
+            return dict(executor.map(answer, parties))
     
     def clear_cache(self):
         """
-        Clear the query and embedding cache.
+        Clear the query, embedding and completion caches.
         """
         clear_cache()
+        completion_cache.clear()
         return {"status": "Cache cleared successfully"}
+    
+    def cache_stats(self):
+        """
+        Get entry counts and hit ratios for the query caches.
+        
+        Returns:
+            dict: Per-cache statistics.
+        """
+        return get_cache_stats()
+    
+    def usage_stats(self):
+        """
+        Get token usage and latency of analysis completions per model.
+        
+        Returns:
+            dict: Per-model statistics.
+        """
+        return model_router.stats()
 
 
 if __name__ == "__main__":
     # Simple test case
-    liberal = Party()
+    liberal = Party("liberal")
     
     # First query
     test_query = "what are your plans for growing population crisis"
@@ -0,0 +1,106 @@
+"""
+Single-page PDF slices and thumbnails for cited pages.
+
+Slicing uses pypdf and the results are kept in a size-bounded disk cache,
+so each (document, page) is generated once and then served as a small file
+instead of the whole platform PDF. Thumbnails need a rasterizer, which pypdf
+does not provide; they are rendered with PyMuPDF when it is installed.
+"""
+import io
+import os
+
+from pypdf import PdfReader, PdfWriter
+from assets import file_digest
+from disk_cache import DiskCache
+from index_store import DATA_DIR
+from config import PAGE_CACHE_MAX_BYTES, THUMBNAIL_WIDTH
+
+try:
+    import fitz  # PyMuPDF, optional: only needed for thumbnails
+except ImportError:
+    fitz = None
+
+try:
+    from PIL import Image  # Pillow, optional: only needed for WebP thumbnails
+except ImportError:
+    Image = None
+
+THUMBNAIL_FORMATS = ("png", "webp")
+THUMBNAILS_AVAILABLE = fitz is not None
+
+page_cache = DiskCache(os.path.join(DATA_DIR, ".cache", "pages"), PAGE_CACHE_MAX_BYTES)
+
+
+class ThumbnailUnavailable(Exception):
+    """Raised when no rasterizer is installed for the requested thumbnail format."""
+
+
+def get_page_pdf(pdf_path, page_num):
+    """
+    Get a single page of a PDF as a standalone PDF document.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        page_num (int): Page number (1-indexed)
+
+    Returns:
+        bytes: The single-page PDF
+    """
+    cache_key = f"{file_digest(pdf_path)}:{page_num}:pdf"
+    cached = page_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    reader = PdfReader(pdf_path)
+    if page_num < 1 or page_num > len(reader.pages):
+        raise ValueError(f"Invalid page number: {page_num}. PDF has {len(reader.pages)} pages.")
+
+    writer = PdfWriter()
+    writer.add_page(reader.pages[page_num - 1])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+
+    data = buffer.getvalue()
+    page_cache.set(cache_key, data)
+    return data
+
+
+def get_page_thumbnail(pdf_path, page_num, image_format="png", width=THUMBNAIL_WIDTH):
+    """
+    Render a small image of a PDF page.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        page_num (int): Page number (1-indexed)
+        image_format (str): "png" or "webp"
+        width (int): Width of the thumbnail in pixels
+
+    Returns:
+        bytes: The encoded image
+    """
+    if image_format not in THUMBNAIL_FORMATS:
+        raise ValueError(f"Unsupported thumbnail format: {image_format}")
+    if fitz is None:
+        raise ThumbnailUnavailable("Thumbnails require PyMuPDF (pip install pymupdf)")
+    if image_format == "webp" and Image is None:
+        raise ThumbnailUnavailable("WebP thumbnails require Pillow (pip install pillow)")
+
+    cache_key = f"{file_digest(pdf_path)}:{page_num}:{width}:{image_format}"
+    cached = page_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Render from the cached single-page slice rather than reopening the full document
+    with fitz.open(stream=get_page_pdf(pdf_path, page_num), filetype="pdf") as document:
+        page = document[0]
+        zoom = width / page.rect.width
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        data = pixmap.tobytes("png")
+
+    if image_format == "webp":
+        buffer = io.BytesIO()
+        Image.open(io.BytesIO(data)).save(buffer, format="WEBP", quality=80)
+        data = buffer.getvalue()
+
+    page_cache.set(cache_key, data)
+    return data
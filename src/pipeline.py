@@ -0,0 +1,97 @@
+"""
+Pipelined execution of a query.
+
+Instead of running embed, score, load every page and then call the model
+strictly one after another, the pipeline ranks the hits, loads their page
+text in parallel and reports each document as soon as it is ready. The
+analysis is started as soon as the highest ranked documents fill the
+context budget, so generation overlaps with loading and presenting the
+remaining documents.
+"""
+import asyncio
+
+from starlette.concurrency import run_in_threadpool
+
+from analyzer import context_token_budget, estimate_token_count
+from retriever import hydration_executor
+from tracing import run_in_context
+
+
+def packed_context(ready, budget):
+    """
+    Decide whether enough documents are loaded to start the analysis.
+
+    The context is packed in rank order, like truncate_context, so the
+    analysis can start once every document that could fit ahead of the
+    budget is loaded.
+
+    Args:
+        ready (list): Documents by rank, None for those still loading
+        budget (int): Context token budget
+
+    Returns:
+        list: Documents for the analysis, or None if a needed one is still loading
+    """
+    tokens = 0
+    for rank, doc in enumerate(ready):
+        if doc is None:
+            return None
+        tokens += estimate_token_count(doc.get("text", ""))
+        if tokens >= budget:
+            return ready[:rank + 1]
+    return list(ready)
+
+
+async def run_query_pipeline(party, query, deadline=None, year=None):
+    """
+    Run a query, yielding events as each stage produces results.
+
+    Events are dicts with a "type":
+        "document": {"rank", "document"} as soon as a hit's text is loaded
+        "analysis_started": the model call has been issued
+        "documents": {"documents"} all hits, in rank order
+        "analysis": {"analysis"} the generated analysis
+
+    Args:
+        party (Party): Party whose platform is queried
+        query (str): The user query
+        deadline (Deadline, optional): Request deadline for upstream calls
+        year (int, optional): Only search platforms from this year
+    """
+    version, hits = await run_in_threadpool(party.rank, query, deadline, year)
+    budget = context_token_budget(query)
+
+    futures = [asyncio.wrap_future(run_in_context(hydration_executor, party.hydrate, hit)) for hit in hits]
+    rank_of = {future: rank for rank, future in enumerate(futures)}
+    ready = [None] * len(hits)
+    analysis_task = None
+
+    try:
+        pending = set(futures)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in sorted(done, key=rank_of.get):
+                rank = rank_of[future]
+                ready[rank] = future.result()
+                yield {"type": "document", "rank": rank, "document": ready[rank]}
+
+            if analysis_task is None:
+                context = packed_context(ready, budget)
+                if context is not None:
+                    analysis_task = asyncio.ensure_future(run_in_threadpool(party.analyze, query, context, deadline))
+                    yield {"type": "analysis_started"}
+
+        party.cache_results(version, query, ready, year)
+        yield {"type": "documents", "documents": ready}
+
+        if analysis_task is None:
+            # No hits: the analyzer answers without calling the model
+            analysis_task = asyncio.ensure_future(run_in_threadpool(party.analyze, query, ready, deadline))
+            yield {"type": "analysis_started"}
+        yield {"type": "analysis", "analysis": await analysis_task}
+    finally:
+        # The client went away or a stage failed; stop waiting on the rest
+        if analysis_task is not None and not analysis_task.done():
+            analysis_task.cancel()
+        for future in futures:
+            future.cancel()
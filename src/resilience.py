@@ -0,0 +1,164 @@
+"""
+Tail-latency controls for upstream calls: deadlines, retries and hedging.
+
+A Deadline is created from the HTTP request budget and passed down to every
+OpenAI call, which then gets a per-call timeout that never outlives the
+request. Transient failures are retried with full-jitter exponential
+backoff, and embedding calls can be hedged: if the first attempt has not
+answered after the observed p95 latency, a second one is fired and the
+first response wins.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import openai
+from config import RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY, HEDGE_MIN_DELAY
+
+# Errors worth retrying; anything else (bad request, auth) fails immediately
+TRANSIENT_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request budget runs out before an upstream call can finish."""
+
+
+class Deadline:
+    """A point in time by which a request must be answered."""
+
+    def __init__(self, budget_seconds):
+        self.budget = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self):
+        """Seconds left in the budget (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, cap):
+        """
+        Timeout for the next upstream call: the per-call cap, bounded by the budget.
+
+        Raises:
+            DeadlineExceeded: If there is no budget left
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request budget of {self.budget:.1f}s exhausted")
+        return min(cap, remaining)
+
+
+class LatencyTracker:
+    """Rolling window of call latencies used to pick the hedging delay."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent, default=None):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return default
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+
+def _retry_after_seconds(error):
+    """Read a Retry-After hint from a rate limit response, if the provider sent one."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retries(func, call_timeout, deadline=None, max_attempts=RETRY_MAX_ATTEMPTS, latency=None):
+    """
+    Call func(timeout) and retry transient failures with jittered backoff.
+
+    Args:
+        func (callable): Upstream call taking the per-attempt timeout in seconds
+        call_timeout (float): Maximum seconds for a single attempt
+        deadline (Deadline, optional): Overall request deadline
+        max_attempts (int): Maximum number of attempts
+        latency (LatencyTracker, optional): Records the duration of successful attempts
+
+    Returns:
+        The return value of func
+
+    Raises:
+        DeadlineExceeded: If the budget runs out before a successful attempt
+    """
+    for attempt in range(max_attempts):
+        timeout = deadline.timeout(call_timeout) if deadline else call_timeout
+        start = time.monotonic()
+        try:
+            result = func(timeout)
+            if latency is not None:
+                latency.record(time.monotonic() - start)
+            return result
+        except TRANSIENT_ERRORS as e:
+            if attempt == max_attempts - 1:
+                raise
+            # Full jitter spreads retries from many workers apart
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            delay = max(delay, _retry_after_seconds(e) or 0)
+            if deadline and deadline.remaining() <= delay:
+                raise DeadlineExceeded(f"No budget left to retry after: {str(e)}")
+            print(f"Transient upstream error ({type(e).__name__}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def hedged_call(func, hedge_delay, deadline=None):
+    """
+    Run func() and, if it is still pending after hedge_delay, race a second copy.
+
+    Args:
+        func (callable): Idempotent upstream call
+        hedge_delay (float): Seconds to wait before firing the hedge
+        deadline (Deadline, optional): Overall request deadline
+
+    Returns:
+        The first successful result
+    """
+    first = _hedge_executor.submit(func)
+    done, _ = wait([first], timeout=hedge_delay)
+    if done:
+        return first.result()
+
+    pending = {first, _hedge_executor.submit(func)}
+    error = None
+    while pending:
+        timeout = deadline.remaining() if deadline else None
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            raise DeadlineExceeded("Request budget exhausted while waiting for hedged call")
+        for future in done:
+            if future.exception() is None:
+                # The loser keeps running in the background; its result is discarded
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def hedge_delay_for(latency):
+    """Hedge after the observed p95 latency, with a floor until we have samples."""
+    return max(HEDGE_MIN_DELAY, latency.percentile(95, default=HEDGE_MIN_DELAY))
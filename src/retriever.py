@@ -1,137 +1,322 @@
-from embedding import get_embedding
+from embedding import get_embedding, get_provider
 from cosine import cosine_similarity
-from data_processing import get_page_text, process_pdf_and_create_embeddings
+from data_processing import get_page_text
+from dedup import strip_boilerplate
+from index_store import index_manager, resolve_pdf_path, document_version
+from canonical import canonicalize_query, normalize_query
+from search import search, search_ranges, mmr
+from cache_backends import create_backend, clear_regions, CacheGeneration, SharedCache, approximate_bytes
+from tracing import span, traced, run_in_context
+from scheduler import PRIORITY_INTERACTIVE
 import json
 import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Optional
 import numpy as np
-from config import MAX_CACHE_SIZE, TOP_N_DOCUMENTS, SIMILARITY_THRESHOLD
+from config import MAX_CACHE_SIZE, TOP_N_DOCUMENTS, SIMILARITY_THRESHOLD, PAGE_TEXT_CACHE_SIZE, HYDRATION_WORKERS
+from config import MMR_ENABLED, MMR_LAMBDA, MMR_CANDIDATE_POOL
+from config import SECTION_ROUTING_ENABLED, SECTION_ROUTING_MIN_ROWS, SECTION_ROUTING_TOP_SECTIONS
 
-# In-memory cache for query embeddings and results
-query_embedding_cache = {}  # Cache for query embeddings
-query_cache = {}  # Cache for query results
+# Page text is loaded for several hits at once, off the request thread
+hydration_executor = ThreadPoolExecutor(max_workers=HYDRATION_WORKERS, thread_name_prefix="hydrate")
 
-def get_cached_embedding(query):
-    """Get embedding for a query, using cache if available"""
-    if query in query_embedding_cache:
-        return query_embedding_cache[query]
+# Caches for query embeddings and results, per worker or shared (CACHE_BACKEND)
+# Both are keyed by the canonical query so rephrasings share entries
+cache_generation = CacheGeneration(create_backend(max_entries=1))
+query_embedding_cache = SharedCache(create_backend(max_entries=MAX_CACHE_SIZE), "embedding", cache_generation)  # Keyed by (provider, canonical query)
+query_cache = SharedCache(create_backend(max_entries=MAX_CACHE_SIZE), "results", cache_generation)  # Keyed by (index version, party, year, top_n, canonical query)
+page_text_cache = {}  # Extracted page text, keyed by (pdf path, modification time, page), oldest first
+page_text_bytes = 0  # Approximate size of page_text_cache, kept as entries come and go
+_page_text_lock = threading.Lock()
+
+# Lookup counters per cache (per worker). "canonical_hits" counts hits that only happened
+# because canonicalization mapped a phrasing this worker had not seen onto an existing entry.
+cache_stats = {
+    "embedding": {"lookups": 0, "hits": 0, "canonical_hits": 0},
+    "results": {"lookups": 0, "hits": 0, "canonical_hits": 0},
+    "page_text": {"lookups": 0, "hits": 0},
+}
+_seen_phrasings = {"embedding": {}, "results": {}}  # cache key -> raw queries seen for it
+
+def _record_lookup(cache_name, cache_key, raw_query, hit):
+    """Update hit counters, tracking hits gained by canonicalization"""
+    stats = cache_stats[cache_name]
+    seen = _seen_phrasings[cache_name]
+    stats["lookups"] += 1
+    if hit:
+        stats["hits"] += 1
+        if raw_query not in seen.get(cache_key, ()):
+            stats["canonical_hits"] += 1
+    seen.setdefault(cache_key, set()).add(raw_query)
+    
+    # Forget the phrasings of the oldest keys
+    if len(seen) > 2 * MAX_CACHE_SIZE:
+        for key in list(seen)[:MAX_CACHE_SIZE]:
+            del seen[key]
+
+def get_cache_stats():
+    """
+    Report entries, approximate bytes and hit ratios for the query and page text caches.
     
-    # Generate and cache embedding
-    embedding = get_embedding(query)
-    if len(query_embedding_cache) >= MAX_CACHE_SIZE:
-        # Simple cache eviction - remove oldest item
-        query_embedding_cache.pop(next(iter(query_embedding_cache)))
+    Returns:
+        dict: Per-cache stats, including for the query caches the hit ratio raw
+            query keys would have achieved, to show the improvement from canonicalization.
+            Entries and bytes of shared caches are totals for all workers (None for redis);
+            lookups and hits are this worker's.
+    """
+    report = {}
+    for name, cache in (("embedding", query_embedding_cache), ("results", query_cache)):
+        report[name] = cache.stats()
+    with _page_text_lock:
+        report["page_text"] = {"entries": len(page_text_cache), "bytes": page_text_bytes}
     
-    query_embedding_cache[query] = embedding
+    for name in report:
+        stats = cache_stats[name]
+        lookups = stats["lookups"]
+        report[name] = {
+            **report[name],
+            **stats,
+            "hit_ratio": stats["hits"] / lookups if lookups else 0.0,
+        }
+        if "canonical_hits" in stats:
+            report[name]["raw_key_hit_ratio"] = (stats["hits"] - stats["canonical_hits"]) / lookups if lookups else 0.0
+    return report
+
+@traced("embedding")
+def get_cached_embedding(query, deadline=None, provider=None, priority=PRIORITY_INTERACTIVE):
+    """Get embedding for a query, using cache if available"""
+    canonical_query = canonicalize_query(query)
+    cache_key = (provider, canonical_query)
+    embedding = query_embedding_cache.get(cache_key)
+    _record_lookup("embedding", cache_key, query, embedding is not None)
+    if embedding is not None:
+        return embedding
+    
+    # Embed the query as asked; the canonical form is only the cache key, so
+    # phrasings differing in filler share the vector of the first one asked
+    embedding = get_embedding(normalize_query(query), priority=priority, deadline=deadline, provider=provider)
+    if embedding is None:
+        # Don't cache failures
+        return None
+    query_embedding_cache.set(cache_key, embedding)
     return embedding
 
 def clear_cache():
-    """Clear all caches"""
-    global query_embedding_cache, query_cache
-    query_embedding_cache.clear()
-    query_cache.clear()
+    """Clear all caches (the query caches for every worker sharing them)"""
+    global page_text_bytes
+    clear_regions([query_embedding_cache, query_cache])
+    for seen in _seen_phrasings.values():
+        seen.clear()
+    with _page_text_lock:
+        page_text_cache.clear()
+        page_text_bytes = 0
     print("Query cache cleared")
 
-def retrieve_similar_documents(query, top_n=TOP_N_DOCUMENTS):
+def _invalidate_results_for_version(old_version, new_version):
+    """Drop cached results computed against an index version that is no longer served"""
+    query_cache.drop(old_version)
+    print(f"Index swapped from {old_version} to {new_version}, invalidated cached results")
+
+index_manager.add_swap_listener(_invalidate_results_for_version)
+
+def get_cached_page_text(pdf_path, page_num):
+    """Get the text of a PDF page, using cache if available"""
+    try:
+        mtime = os.path.getmtime(pdf_path)
+    except OSError:
+        return get_page_text(pdf_path, page_num)
+    
+    # The modification time is part of the key so a replaced PDF is re-read
+    cache_key = (pdf_path, mtime, page_num)
+    with _page_text_lock:
+        cache_stats["page_text"]["lookups"] += 1
+        text = page_text_cache.pop(cache_key, None)
+        if text is not None:
+            cache_stats["page_text"]["hits"] += 1
+            page_text_cache[cache_key] = text  # Most recently used goes last
+            return text
+    
+    global page_text_bytes
+    text = get_page_text(pdf_path, page_num)
+    with _page_text_lock:
+        # Another thread may have loaded the same page meanwhile
+        replaced = page_text_cache.pop(cache_key, None)
+        if replaced is not None:
+            page_text_bytes -= approximate_bytes(replaced)
+        elif len(page_text_cache) >= PAGE_TEXT_CACHE_SIZE:
+            # Evict the least recently used page
+            page_text_bytes -= approximate_bytes(page_text_cache.pop(next(iter(page_text_cache))))
+        page_text_cache[cache_key] = text
+        page_text_bytes += approximate_bytes(text)
+    return text
+
+def _ensure_index():
     """
-    Retrieve documents similar to the query using vector similarity.
+    Load the published index if none is being served yet.
+
+    Requests never build an index themselves; documents are ingested by the
+    background jobs of ingestion.py (or data_processing.py), and until one
+    has been published queries find no documents.
+    """
+    if index_manager.version is None:
+        index_manager.reload()
+    if index_manager.version is None:
+        print("No index has been published yet; upload documents via /documents or run data_processing.py")
+
+def embed_query(query, deadline=None, priority=PRIORITY_INTERACTIVE):
+    """
+    Embed a query with the provider of the current index and cache the result,
+    so ranking the same query for several parties embeds it only once.
+    
+    Returns:
+        list: The query embedding, or None if it could not be generated
+    """
+    _ensure_index()
+    with index_manager.acquire() as index:
+        if index is None:
+            return None
+        return get_cached_embedding(query, deadline=deadline, provider=index.provider, priority=priority)
+
+def rank_documents(query, top_n=TOP_N_DOCUMENTS, deadline=None, priority=PRIORITY_INTERACTIVE, party=None, year=None):
+    """
+    Find the documents most similar to the query without loading their text.
     
     Args:
         query (str): The user query
         top_n (int): Number of top results to return
+        deadline (Deadline, optional): Request deadline for the embedding call
+        priority (int): Scheduling priority for the embedding call
+        party (str, optional): Only search this party's documents
+        year (int, optional): Only search documents from this year
         
     Returns:
-        list: List of dictionaries containing similar documents
+        tuple: (index version, hits). Hits are ranked, highest similarity first.
+            Each hit still needs hydrate_document unless the results came
+            from the query cache, in which case they already carry their text.
     """
-    # Check query cache first
-    if query in query_cache:
-        print(f"Cache hit! Using cached results for query: {query}")
-        return query_cache[query]
-    
-    # Get query embedding (check cache first)
-    query_embedding = get_cached_embedding(query)
+    _ensure_index()
     
-    # Load document embeddings from file or create if it doesn't exist
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(current_dir, "data")
-    embeddings_file = os.path.join(data_dir, "document_embeddings.json")
-    pdf_info_file = os.path.join(data_dir, "pdf_info.json")
-    
-    # Default PDF path
-    pdf_path = os.path.join(data_dir, "Liberal.pdf")
-    
-    if not os.path.exists(embeddings_file) or os.path.getsize(embeddings_file) == 0:
-        print("Embeddings file not found, generating embeddings...")
+    # Hold the current index version while scoring so a hot swap
+    # never changes the data underneath us
+    with index_manager.acquire() as index:
+        if index is None or len(index) == 0:
+            print("Error loading embeddings: no index available")
+            return None, []
         
-        # Check if PDF info exists, default to Liberal.pdf
-        if os.path.exists(pdf_info_file):
-            with open(pdf_info_file, 'r') as f:
-                pdf_info = json.load(f)
-                pdf_path = pdf_info.get("pdf_path", os.path.join(data_dir, "Liberal.pdf"))
-        else:
-            pdf_path = os.path.join(data_dir, "Liberal.pdf")
-            
-        process_pdf_and_create_embeddings(pdf_path)
-    
-    # Load embeddings data
-    try:
-        with open(embeddings_file, "r") as f:
-            document_embeddings = json.load(f)
-    except Exception as e:
-        print(f"Error loading embeddings: {str(e)}")
-        document_embeddings = []
+        # Check query cache first (results are only valid for one index version)
+        # A shorter list cached for the same query must not answer a request for more hits
+        cache_key = (index.version, party, year, top_n, canonicalize_query(query))
+        cached = query_cache.get(cache_key)
+        _record_lookup("results", cache_key, query, cached is not None)
+        if cached is not None:
+            print(f"Cache hit! Using cached results for query: {query}")
+            return index.version, [dict(doc) for doc in cached]
         
-    # Also load PDF info
-    try:
-        with open(pdf_info_file, 'r') as f:
-            pdf_info = json.load(f)
-            pdf_path = pdf_info.get("pdf_path", os.path.join(data_dir, "Liberal.pdf"))
-    except Exception as e:
-        print(f"Error loading PDF info: {str(e)}")
-        pdf_path = os.path.join(data_dir, "Liberal.pdf")
-    
-    # Calculate similarity scores
-    results = []
-    for doc_ref in document_embeddings:
-        doc_embedding = doc_ref["embedding"]
+        # Get query embedding (check cache first), using the provider that built the index
+        query_embedding = get_cached_embedding(query, deadline=deadline, provider=index.provider, priority=priority)
+        if query_embedding is None:
+            return index.version, []
+        if len(query_embedding) != index.dimension:
+            print(f"Error: query embedding has dimension {len(query_embedding)} but index {index.version} has {index.dimension}")
+            return index.version, []
         
-        # Calculate cosine similarity
-        similarity = np.dot(query_embedding, doc_embedding) / (
-            np.linalg.norm(query_embedding) * np.linalg.norm(doc_embedding)
-        )
+        # Calculate cosine similarity against every document
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query_vector)
+        if query_norm == 0:
+            return index.version, []
         
-        # Only include if similarity is above threshold
-        if similarity > SIMILARITY_THRESHOLD:
+        # Only include documents above the threshold, highest first
+        # (large indexes are scored in parallel shards)
+        threshold = get_provider(index.provider).similarity_threshold
+        if threshold is None:
+            threshold = SIMILARITY_THRESHOLD
+        # A party or year filter only scans that subset of rows
+        start, end, mask = index.rows_for(party=party, year=year)
+        query_vector = query_vector / query_norm
+        # MMR picks a diverse top-n out of a larger pool of candidates
+        candidates = max(top_n, MMR_CANDIDATE_POOL) if MMR_ENABLED else top_n
+        with span("search"):
+            if SECTION_ROUTING_ENABLED and end - start >= SECTION_ROUTING_MIN_ROWS:
+                # Coarse to fine: only score the pages of the best matching sections
+                ranges = index.route_sections(query_vector, SECTION_ROUTING_TOP_SECTIONS, start, end, mask)
+                ranked, similarities = search_ranges(index.matrix, query_vector, candidates, threshold, ranges, mask)
+            else:
+                ranked, similarities = search(index.matrix, query_vector, candidates, threshold, start, end, mask)
+            if MMR_ENABLED:
+                ranked, similarities = mmr(index.matrix, ranked, similarities, top_n, MMR_LAMBDA)
+        
+        hits = []
+        for row, similarity in zip(ranked, similarities):
+            doc_ref = index.documents[row]
             page_num = doc_ref["page_num"]
-            file = doc_ref.get("file", "Liberal.pdf")
+            similarity = float(similarity)  # Convert numpy float to native Python float
             
             # Use full path for PDF if just filename is stored
-            pdf_file_path = file if os.path.exists(file) else pdf_path
-            
-            # Get text content directly from PDF
-            text = get_page_text(pdf_file_path, page_num)
+            pdf_file_path = resolve_pdf_path(doc_ref.get("file") or doc_ref["document"])
             
-            results.append({
+            hits.append({
+                "document": os.path.basename(pdf_file_path),
+                "party": doc_ref["party"],
+                "year": doc_ref["year"],
+                "section": doc_ref["section"],
                 "page_num": page_num,
+                "page_label": doc_ref["page_label"],  # Printed page number, e.g. "iv"
                 "page": page_num,  # Add page field for frontend compatibility
-                "similarity": float(similarity),  # Convert numpy float to native Python float
-                "score": float(similarity),  # Add score field for frontend compatibility
-                "text": text,
+                "pages": list(doc_ref["pages"]),  # This page and its near-duplicates
+                "pdf_version": document_version(pdf_file_path),  # Content of the PDF the page numbers refer to
+                "similarity": similarity,
+                "score": similarity,  # Add score field for frontend compatibility
+                "_pdf_path": pdf_file_path,  # Removed by hydrate_document
+                "_boilerplate": index.boilerplate.get(doc_ref["document"]),  # Removed by hydrate_document
             })
+        return index.version, hits
+
+def hydrate_document(hit):
+    """
+    Load the page text of a ranked hit.
     
-    # Sort by similarity (highest first)
-    results.sort(key=lambda x: x["similarity"], reverse=True)
-    
-    # Limit to top_n results
-    top_results = results[:top_n]
-    
-    # Cache the results if we have space
-    if len(query_cache) >= MAX_CACHE_SIZE:
-        # Simple cache eviction - remove oldest item
-        query_cache.pop(next(iter(query_cache)))
+    Args:
+        hit (dict): Hit from rank_documents (updated in place)
+        
+    Returns:
+        dict: The hit with its "text" field
+    """
+    pdf_path = hit.pop("_pdf_path", None)
+    boilerplate = hit.pop("_boilerplate", None)
+    if "text" not in hit:
+        # Get text content directly from PDF, without the headers and footers stripped at ingest time
+        hit["text"] = strip_boilerplate(get_cached_page_text(pdf_path, hit["page_num"]), boilerplate)
+    return hit
+
+def cache_results(version, query, documents, party=None, year=None, top_n=TOP_N_DOCUMENTS):
+    """Store hydrated results in the query cache, for requests with the same filters and top_n"""
+    if version is None or any("text" not in doc for doc in documents):
+        return
+    query_cache.set((version, party, year, top_n, canonicalize_query(query)), [dict(doc) for doc in documents])
+
+def retrieve_similar_documents(query, top_n=TOP_N_DOCUMENTS, deadline=None, priority=PRIORITY_INTERACTIVE, party=None, year=None):
+    """
+    Retrieve documents similar to the query using vector similarity.
     
-    query_cache[query] = top_results
+    Args:
+        query (str): The user query
+        top_n (int): Number of top results to return
+        deadline (Deadline, optional): Request deadline for the embedding call
+        priority (int): Scheduling priority for the embedding call
+        party (str, optional): Only search this party's documents
+        year (int, optional): Only search documents from this year
+        
+    Returns:
+        list: List of dictionaries containing similar documents
+    """
+    version, hits = rank_documents(query, top_n=top_n, deadline=deadline, priority=priority, party=party, year=year)
     
+    # Load page text for all hits in parallel
+    top_results = [future.result() for future in [run_in_context(hydration_executor, hydrate_document, hit) for hit in hits]]
+    cache_results(version, query, top_results, party=party, year=year, top_n=top_n)
     return top_results
 
 if __name__ == "__main__":
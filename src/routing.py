@@ -0,0 +1,143 @@
+"""
+Model routing and token accounting for analysis completions.
+
+Each request is routed to one of the configured ANALYSIS_ROUTES. A route
+names a model and an output cap, plus the query types and context sizes it
+is suitable for. Routes are listed in order of preference; the first one
+that fits the request is used unless its model is currently slow, in which
+case the fastest eligible route is taken instead. Every completion records
+the latency of its successful upstream attempt (not queueing, backoff or
+failed attempts, which would penalize a route for one transient error) and
+its token usage, so the policy follows upstream conditions and the totals
+can be reported.
+
+Latency only changes the route between routes with different models. The
+default ANALYSIS_ROUTES share one model and differ only in output cap, so
+out of the box routing picks the cap by query type and context size.
+"""
+import re
+import threading
+
+from resilience import LatencyTracker
+from config import ANALYSIS_ROUTES, ROUTING_LATENCY_THRESHOLD, ROUTING_LATENCY_WINDOW
+
+# Queries asking for reasoning rather than a fact from the platform
+_ANALYTICAL = re.compile(
+    r"\b(why|compare|comparison|versus|vs|impact|effect|affect|explain|analy[sz]e|evaluate|pros|cons|"
+    r"trade-?offs?|differ|difference|better|worse|should|would|consequences?|implications?)\b"
+)
+LOOKUP_MAX_WORDS = 8  # Longer questions are treated as analytical
+
+
+def classify_query(query):
+    """
+    Classify a query as a simple "lookup" or an "analysis" request.
+
+    Args:
+        query (str): The user's query
+
+    Returns:
+        str: "lookup" or "analysis"
+    """
+    text = query.lower()
+    if _ANALYTICAL.search(text) or len(text.split()) > LOOKUP_MAX_WORDS:
+        return "analysis"
+    return "lookup"
+
+
+class ModelRouter:
+    """Chooses a route per request and keeps per-model latency and token totals."""
+
+    def __init__(self, routes=ANALYSIS_ROUTES):
+        self.routes = routes
+        self._latency = {}
+        self._usage = {}
+        self._lock = threading.Lock()
+
+    def _tracker(self, model):
+        with self._lock:
+            if model not in self._latency:
+                self._latency[model] = LatencyTracker(window=ROUTING_LATENCY_WINDOW)
+            return self._latency[model]
+
+    def latency(self, model):
+        """Recent p95 completion latency of a model in seconds, or None before any samples."""
+        return self._tracker(model).percentile(95)
+
+    def choose(self, query, context_tokens):
+        """
+        Pick the route for a request.
+
+        Args:
+            query (str): The user's query
+            context_tokens (int): Estimated tokens of document context in the prompt
+
+        Returns:
+            dict: The chosen route, with "query_type" added
+        """
+        query_type = classify_query(query)
+        eligible = [
+            route for route in self.routes
+            if query_type in route.get("query_types", ("lookup", "analysis"))
+            and (route.get("max_context_tokens") is None or context_tokens <= route["max_context_tokens"])
+        ]
+        if not eligible:
+            # The last route is the catch-all
+            eligible = [self.routes[-1]]
+
+        route = eligible[0]
+        preferred_latency = self.latency(route["model"])
+        if preferred_latency is not None and preferred_latency > ROUTING_LATENCY_THRESHOLD:
+            # Models without samples yet count as fast so they get tried
+            route = min(eligible, key=lambda candidate: self.latency(candidate["model"]) or 0.0)
+            if route is not eligible[0]:
+                print(f"Routing to {route['name']}: {eligible[0]['model']} p95 is {preferred_latency:.2f}s")
+
+        return dict(route, query_type=query_type)
+
+    def record(self, route, latency, usage=None):
+        """
+        Record a completed upstream call.
+
+        Args:
+            route (dict): Route the call was made on
+            latency (float): Duration of the successful upstream attempt in seconds
+            usage: The response's usage object (may be None)
+
+        Returns:
+            dict: Token counts for the call
+        """
+        self._tracker(route["model"]).record(latency)
+        tokens = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+        }
+        with self._lock:
+            totals = self._usage.setdefault(route["model"], {
+                "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0,
+            })
+            totals["requests"] += 1
+            for key, value in tokens.items():
+                totals[key] += value
+        return tokens
+
+    def stats(self):
+        """Per-model request counts, token totals and latency percentiles."""
+        with self._lock:
+            usage = {model: dict(totals) for model, totals in self._usage.items()}
+            models = list(self._latency)
+        for model in models:
+            tracker = self._tracker(model)
+            entry = usage.setdefault(model, {"requests": 0})
+            entry["latency_p50_ms"] = _ms(tracker.percentile(50))
+            entry["latency_p95_ms"] = _ms(tracker.percentile(95))
+        return {"models": usage, "routes": [route["name"] for route in self.routes]}
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+# Shared router for the process
+model_router = ModelRouter()
@@ -0,0 +1,89 @@
+"""
+Runtime introspection for operators: what this worker has loaded and what it costs.
+
+collect_stats() reports the index being served, every cache, the upstream
+schedulers and the process itself. Everything is read from counters or
+/proc, so it is cheap enough to scrape every few seconds.
+"""
+import os
+import threading
+import time
+
+from index_store import index_manager
+from retriever import get_cache_stats
+from completion_cache import completion_cache
+from page_assets import page_cache
+from scheduler import chat_scheduler, embedding_scheduler
+
+STARTED_AT = time.time()
+
+
+def index_stats():
+    """Version, size and shape of the index being served."""
+    with index_manager.acquire() as index:
+        if index is None:
+            return {"version": None, "vectors": 0, "dimension": 0, "bytes": 0}
+        return {
+            "version": index.version,
+            "provider": index.provider,
+            "vectors": len(index),
+            "dimension": index.dimension,
+            "sections": len(index.sections),
+            "bytes": int(index.matrix.nbytes),
+            "parties": {
+                **{party: int(end - start) for party, (start, end) in index.party_ranges.items()},
+                **{party: int(mask.sum()) for party, mask in index.party_masks.items()},
+            },
+        }
+
+
+def memory_stats():
+    """
+    Resident and virtual memory of this process in bytes.
+
+    Reads /proc/self/statm where available (Linux); elsewhere only the peak
+    resident size from getrusage is known.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            virtual_pages, resident_pages = (int(value) for value in f.read().split()[:2])
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        return {"rss_bytes": resident_pages * page_size, "virtual_bytes": virtual_pages * page_size}
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS; report it as the peak
+        return {"max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def open_file_count():
+    """Number of open file descriptors, or None where /proc is not available."""
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def collect_stats():
+    """
+    Snapshot of this worker's index, caches, schedulers and process.
+
+    Returns:
+        dict: JSON-serializable stats
+    """
+    caches = get_cache_stats()
+    caches["completions"] = completion_cache.stats()
+    caches["pages"] = page_cache.stats()
+    return {
+        "index": index_stats(),
+        "caches": caches,
+        "schedulers": {
+            scheduler.name: scheduler.stats() for scheduler in (chat_scheduler, embedding_scheduler)
+        },
+        "process": {
+            "pid": os.getpid(),
+            **memory_stats(),
+            "open_files": open_file_count(),
+            "threads": threading.active_count(),
+            "uptime_seconds": round(time.time() - STARTED_AT, 1),
+        },
+    }
@@ -0,0 +1,181 @@
+"""
+Concurrency scheduling for upstream OpenAI calls.
+
+Each scheduler bounds how many calls run at once, paces them with a token
+bucket matching the provider quota, and serves waiting callers in priority
+order (interactive before batch). When the wait queue is too deep, new
+callers are rejected immediately with SchedulerOverloaded so the API can
+answer 429 with a Retry-After hint instead of piling up.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from config import (
+    LLM_MAX_CONCURRENCY,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_MAX_QUEUE_DEPTH,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_REQUESTS_PER_MINUTE,
+    EMBEDDING_MAX_QUEUE_DEPTH,
+)
+
+# Lower numbers are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a call is rejected because the scheduler queue is full."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is overloaded, retry after {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket rate limiter refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self):
+        """
+        Take one token if available.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one is available
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class LLMScheduler:
+    """Bounded, rate-limited, priority-ordered gate in front of an upstream API."""
+
+    def __init__(self, name, max_concurrency, requests_per_minute, max_queue_depth):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.bucket = TokenBucket(requests_per_minute / 60.0, capacity=max(1, max_concurrency))
+        self._condition = threading.Condition()
+        self._queue = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._running = 0
+        self._average_call_seconds = 1.0
+        self.completed = 0
+        self.rejected = 0
+
+    def queue_depth(self, priority=PRIORITY_INTERACTIVE):
+        """Number of waiting calls that would be served before one at this priority."""
+        return sum(1 for queued_priority, _ in self._queue if queued_priority <= priority)
+
+    def is_overloaded(self, priority=PRIORITY_INTERACTIVE):
+        """Whether a new call at this priority would be rejected right now."""
+        return priority < PRIORITY_BATCH and self.queue_depth(priority) >= self.max_queue_depth
+
+    def retry_after(self, priority=PRIORITY_INTERACTIVE):
+        """Estimate how long until a newly queued call would start."""
+        waves = (self.queue_depth(priority) + 1) / max(1, self.max_concurrency)
+        return max(1.0, waves * self._average_call_seconds)
+
+    def _acquire(self, priority, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            # Batch work waits its turn; interactive callers fail fast when the
+            # queue ahead of them is too deep
+            if priority < PRIORITY_BATCH and self.queue_depth(priority) >= self.max_queue_depth:
+                self.rejected += 1
+                raise SchedulerOverloaded(self.name, self.retry_after(priority))
+
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    wait = None
+                    # Only the highest-priority waiter may take a slot
+                    if self._queue[0] == ticket and self._running < self.max_concurrency:
+                        wait = self.bucket.try_take()
+                        if wait == 0:
+                            heapq.heappop(self._queue)
+                            self._running += 1
+                            # Let the next waiter check for a free slot too
+                            self._condition.notify_all()
+                            return
+
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError(f"Timed out waiting for {self.name}")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._condition.wait(wait)
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._condition.notify_all()
+                raise
+
+    def _release(self, elapsed):
+        with self._condition:
+            self._running -= 1
+            self.completed += 1
+            # Smoothed call duration feeds the Retry-After estimate
+            self._average_call_seconds = 0.8 * self._average_call_seconds + 0.2 * elapsed
+            self._condition.notify_all()
+
+    def run(self, func, *args, priority=PRIORITY_INTERACTIVE, wait_timeout=None, **kwargs):
+        """
+        Run func(*args, **kwargs) once a slot and a rate-limit token are available.
+
+        Args:
+            func (callable): The upstream call
+            priority (int): PRIORITY_INTERACTIVE or PRIORITY_BATCH
+            wait_timeout (float, optional): Maximum seconds to wait for a slot
+
+        Returns:
+            The return value of func
+
+        Raises:
+            SchedulerOverloaded: If an interactive call finds the wait queue full
+            TimeoutError: If no slot became available within wait_timeout
+        """
+        self._acquire(priority, wait_timeout)
+        start = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._release(time.monotonic() - start)
+
+    def stats(self):
+        """Return queue and throughput counters for monitoring."""
+        with self._condition:
+            return {
+                "running": self._running,
+                "queued": len(self._queue),
+                "max_concurrency": self.max_concurrency,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "average_call_seconds": round(self._average_call_seconds, 3),
+            }
+
+
+# Shared schedulers for the process, one per provider quota
+chat_scheduler = LLMScheduler(
+    "analysis", LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_MAX_QUEUE_DEPTH
+)
+embedding_scheduler = LLMScheduler(
+    "embedding", EMBEDDING_MAX_CONCURRENCY, EMBEDDING_REQUESTS_PER_MINUTE, EMBEDDING_MAX_QUEUE_DEPTH
+)
@@ -0,0 +1,154 @@
+"""
+Exact nearest-neighbour search over the document matrix.
+
+Small indexes are scored with one matrix-vector product. Large ones are
+split into contiguous row shards that are scored concurrently in a thread
+pool (numpy releases the GIL during the product), and the per-shard top-k
+lists are merged. Results are identical to scoring the whole matrix at
+once, including the order of ties. Filtered queries only scan the row
+range (and mask) of the requested subset.
+
+search_ranges scores several row ranges, such as the sections a query was
+routed to, and merges their hits the same way.
+
+The hits can then be re-ranked by maximal marginal relevance (mmr), which
+trades a little similarity for diversity so adjacent pages saying the same
+thing don't take every slot.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config import SEARCH_SHARDS, SEARCH_SHARD_MIN_ROWS
+
+
+def shard_count():
+    """Configured number of shards (SEARCH_SHARDS, or one per CPU core when 0)."""
+    return SEARCH_SHARDS or os.cpu_count() or 1
+
+
+_search_executor = ThreadPoolExecutor(max_workers=shard_count(), thread_name_prefix="search")
+
+
+def _top_k(scores, offset, top_n, threshold):
+    """Top-k rows of one block of scores above the threshold, as (rows, scores)."""
+    candidates = np.flatnonzero(scores > threshold)
+    if len(candidates) > top_n:
+        # Partial selection keeps this linear in the block size. It finds the
+        # k-th score but may keep any of the rows tied with it, so take every
+        # row scoring at least that much and keep the lowest rows among ties.
+        candidate_scores = scores[candidates]
+        kth = candidate_scores[np.argpartition(-candidate_scores, top_n - 1)[top_n - 1]]
+        candidates = candidates[candidate_scores >= kth]
+        order = np.lexsort((candidates, -scores[candidates]))[:top_n]
+        candidates = np.sort(candidates[order])
+    return candidates + offset, scores[candidates]
+
+
+def _merge(rows, scores, top_n):
+    """Highest scores first; ties keep index order, like a stable sort over the whole matrix."""
+    order = np.lexsort((rows, -scores))[:top_n]
+    return rows[order], scores[order]
+
+
+def search(matrix, query_vector, top_n, threshold, start=0, end=None, mask=None):
+    """
+    Find the rows most similar to a normalized query vector.
+
+    Args:
+        matrix (np.ndarray): Normalized document vectors, one per row
+        query_vector (np.ndarray): Normalized query vector
+        top_n (int): Number of results to return
+        threshold (float): Minimum similarity for a row to be returned
+        start (int): First row to scan
+        end (int, optional): Row after the last one to scan. Defaults to all rows.
+        mask (np.ndarray, optional): Boolean mask over all rows; False rows are skipped
+
+    Returns:
+        tuple: (rows, similarities) as numpy arrays, highest similarity first
+    """
+    end = matrix.shape[0] if end is None else end
+    total = end - start
+    shards = min(shard_count(), max(1, total // max(1, SEARCH_SHARD_MIN_ROWS)))
+
+    if top_n <= 0 or total <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    def score_shard(shard_start, shard_end):
+        # Row slices are views, so shards share the matrix without copying it
+        scores = matrix[shard_start:shard_end] @ query_vector
+        if mask is not None:
+            scores[~mask[shard_start:shard_end]] = -np.inf
+        return _top_k(scores, shard_start, top_n, threshold)
+
+    if shards <= 1:
+        rows, scores = score_shard(start, end)
+        return _merge(rows, scores, top_n)
+
+    bounds = np.linspace(start, end, shards + 1, dtype=np.int64)
+    results = list(_search_executor.map(score_shard, bounds[:-1], bounds[1:]))
+    rows = np.concatenate([shard_rows for shard_rows, _ in results])
+    scores = np.concatenate([shard_scores for _, shard_scores in results])
+    return _merge(rows, scores, top_n)
+
+
+def search_ranges(matrix, query_vector, top_n, threshold, ranges, mask=None):
+    """
+    Find the rows most similar to a query vector within several row ranges.
+
+    Args:
+        ranges (list): (start, end) row ranges to scan
+        Other arguments as for search.
+
+    Returns:
+        tuple: (rows, similarities) as numpy arrays, highest similarity first
+    """
+    results = [search(matrix, query_vector, top_n, threshold, start, end, mask) for start, end in ranges]
+    if not results:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    rows = np.concatenate([range_rows for range_rows, _ in results])
+    scores = np.concatenate([range_scores for _, range_scores in results])
+    return _merge(rows, scores, top_n)
+
+
+def mmr(matrix, rows, similarities, top_n, lambda_):
+    """
+    Re-rank search results by maximal marginal relevance.
+
+    Each pick maximizes lambda_ * similarity to the query minus
+    (1 - lambda_) * the highest similarity to any row already picked. The
+    candidates' pairwise similarities are computed once as one matrix
+    product, and each pick only updates a vector of running maxima.
+
+    Args:
+        matrix (np.ndarray): Normalized document vectors, one per row
+        rows (np.ndarray): Candidate rows, highest similarity first (from search)
+        similarities (np.ndarray): Their similarities to the query
+        top_n (int): Number of results to return
+        lambda_ (float): Weight of relevance against diversity, between 0 and 1
+
+    Returns:
+        tuple: (rows, similarities) of the picked candidates, in pick order
+    """
+    if len(rows) <= 1 or top_n <= 0:
+        return rows[:top_n], similarities[:top_n]
+
+    vectors = matrix[rows]
+    pairwise = vectors @ vectors.T
+    relevance = lambda_ * similarities.astype(np.float32)
+    redundancy = np.full(len(rows), -np.inf, dtype=np.float32)  # Max similarity to the picks so far
+    available = np.ones(len(rows), dtype=bool)
+    picked = []
+
+    for _ in range(min(top_n, len(rows))):
+        # Nothing is redundant before the first pick, and dissimilarity earns no bonus
+        scores = relevance - (1 - lambda_) * np.maximum(redundancy, 0)
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))  # Ties go to the more similar candidate
+        picked.append(pick)
+        available[pick] = False
+        np.maximum(redundancy, pairwise[pick], out=redundancy)
+
+    picked = np.asarray(picked, dtype=np.int64)
+    return rows[picked], similarities[picked]
@@ -0,0 +1,550 @@
+"""
+smartvote: command-line queries, benchmarks, stats and ingestion, served
+warm by a local daemon when one is running.
+
+Every run of main.py or retriever.py pays for importing openai, PyPDF2 and
+numpy and loading the index before it answers anything. `smartvote.py
+daemon` pays that once and keeps the index and caches in memory; the other
+commands attach to it over a Unix socket, and run in-process (with the
+same output, only a slower start) when no daemon is listening.
+
+    python smartvote.py daemon &
+    python smartvote.py query "housing plan" "child care"
+    python smartvote.py query --file questions.txt --json
+    python smartvote.py bench --repeat 5
+    python smartvote.py stats
+    python smartvote.py ingest platform.pdf --party green --year 2025
+    python smartvote.py stop
+
+The client only imports the standard library; the application modules are
+imported by whichever side runs the command. The protocol is one JSON
+object per line: the client sends {"command": ..., "args": {...}} and the
+daemon answers with any number of {"event": ...} lines (ingestion
+progress) followed by {"ok": true, "result": ...} or {"ok": false,
+"error": ...}. A connection can carry any number of commands.
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import signal
+import socket
+import socketserver
+import statistics
+import sys
+import threading
+import time
+
+from config import (
+    DAEMON_SOCKET_NAME, DAEMON_SOCKET_ENV, DAEMON_CONNECT_TIMEOUT, BENCH_REPEAT, DEFAULT_PARTY, TOP_N_DOCUMENTS,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEFAULT_QUESTIONS_FILE = os.path.join(DATA_DIR, "popular_questions.txt")
+
+# Fields of a ranked hit shown by `query`
+HIT_FIELDS = ("document", "party", "year", "section", "page_num", "page_label", "pages", "similarity")
+
+
+class CommandError(Exception):
+    """A command failed in a way worth reporting without a traceback."""
+
+
+def default_socket_path():
+    return os.environ.get(DAEMON_SOCKET_ENV) or os.path.join(DATA_DIR, DAEMON_SOCKET_NAME)
+
+
+# Commands. These run in the daemon, or in-process when there is none, and
+# import the application modules on first use.
+
+def run_query(args, emit):
+    """
+    Rank (and optionally analyze) each query.
+
+    Args:
+        args (dict): "queries", and optional "party", "year", "top_n" and "analyze"
+        emit (callable): Progress callback (unused)
+
+    Returns:
+        list: Per query: {"query", "version", "elapsed_ms", "documents"} and "analysis" if asked
+    """
+    from main import Party
+    from retriever import rank_documents
+    from answer_store import answer_store
+    from corpus import list_parties
+
+    party = args.get("party") or DEFAULT_PARTY
+    if party not in list_parties():
+        raise CommandError(f"Unknown party: {party}")
+    year = args.get("year")
+    top_n = args.get("top_n") or TOP_N_DOCUMENTS
+
+    results = []
+    for query in args["queries"]:
+        started = time.perf_counter()
+        result = {"query": query}
+        if args.get("analyze"):
+            # Same order as the API: precomputed answers first, then retrieval and analysis
+            precomputed = answer_store.lookup(query, party=party) if year is None else None
+            if precomputed is not None:
+                documents, analysis = precomputed["similar_documents"], precomputed["analysis"]
+            else:
+                platform = Party(party)
+                documents = platform.retrieve(query, year=year)
+                analysis = platform.analyze(query, documents)
+            result["analysis"] = analysis
+        else:
+            result["version"], documents = rank_documents(query, top_n=top_n, party=party, year=year)
+        result["documents"] = [{key: doc.get(key) for key in HIT_FIELDS} for doc in documents[:top_n]]
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        results.append(result)
+    return results
+
+
+def run_stats(args, emit):
+    """Index, cache, scheduler and process statistics of the process running the command."""
+    from runtime_stats import collect_stats
+    return collect_stats()
+
+
+def run_ingest(args, emit):
+    """
+    Add a platform PDF to the corpus and wait for its ingestion job.
+
+    The file is staged and ingested exactly as an upload to
+    PUT /documents/{file} would be, and copied into the data directory
+    when the new index version is committed.
+
+    Args:
+        args (dict): "path" and "party", and optional "year", "title" and "name"
+        emit (callable): Called with each progress event of the job
+
+    Returns:
+        dict: The finished job
+    """
+    from corpus import DOCUMENT_FILE_PATTERN, PARTY_ID_PATTERN
+    from ingestion import ingestion_manager, staging_path, FAILED
+
+    source = os.path.abspath(args["path"])
+    file_name = os.path.basename(source)
+    if not DOCUMENT_FILE_PATTERN.match(file_name):
+        raise CommandError("Document names must be plain file names ending in .pdf")
+    if not PARTY_ID_PATTERN.match(args["party"]):
+        raise CommandError("Party ids may only contain lowercase letters, digits, '-' and '_'")
+    try:
+        with open(source, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                raise CommandError(f"{source} is not a PDF document")
+    except OSError as e:
+        raise CommandError(f"Cannot read {source}: {e.strerror}")
+
+    # Ingested from a staged copy, as an upload is, even if the file is already in the data directory
+    staged_path = staging_path(file_name)
+    try:
+        shutil.copyfile(source, staged_path)
+    except OSError:
+        if os.path.exists(staged_path):
+            os.remove(staged_path)
+        raise
+
+    job = ingestion_manager.submit_document(
+        staged_path, file_name, args["party"], year=args.get("year"), title=args.get("title"), name=args.get("name"),
+    )
+    seen = 0
+    while True:
+        events = job.wait_for_events(seen, timeout=1.0)
+        for event in events:
+            emit(event)
+        seen += len(events)
+        if job.finished and seen == len(job.events):
+            break
+    if job.status == FAILED:
+        raise CommandError(f"Ingestion of {file_name} failed: {job.error}")
+    return job.to_dict()
+
+
+COMMANDS = {
+    "query": run_query,
+    "stats": run_stats,
+    "ingest": run_ingest,
+}
+
+
+def execute(command, args, emit):
+    """
+    Run a command and wrap its outcome in a response.
+
+    Returns:
+        dict: {"ok": True, "result": ...} or {"ok": False, "error": ...}
+    """
+    handler = COMMANDS.get(command)
+    if handler is None:
+        return {"ok": False, "error": f"Unknown command: {command}"}
+    try:
+        return {"ok": True, "result": handler(args, emit)}
+    except CommandError as e:
+        return {"ok": False, "error": str(e)}
+    except Exception as e:
+        print(f"Error running {command}: {str(e)}")
+        return {"ok": False, "error": f"{type(e).__name__}: {str(e)}"}
+
+
+# Daemon
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """Serve the JSON-lines commands of one client connection."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                command, args = request["command"], request.get("args") or {}
+            except (ValueError, KeyError, TypeError):
+                self._send({"ok": False, "error": "Requests are JSON objects with a \"command\""})
+                continue
+            if command == "stop":
+                self._send({"ok": True, "result": {"pid": os.getpid()}})
+                # shutdown() waits for serve_forever, so it can't run on this thread's behalf here
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            self._send(execute(command, args, lambda event: self._send({"event": event})))
+
+    def _send(self, message):
+        self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def daemon_running(socket_path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def serve(socket_path):
+    """
+    Load the index and serve commands on a Unix socket until stopped.
+
+    The socket is only accessible to the user running the daemon.
+    """
+    if daemon_running(socket_path):
+        print(f"A smartvote daemon is already listening on {socket_path}")
+        return 1
+    if os.path.exists(socket_path):
+        # Left behind by a daemon that did not exit cleanly
+        os.remove(socket_path)
+
+    # Import and load everything a query needs before accepting clients
+    from main import Party  # noqa: F401 (loads .env, the retriever, the analyzer and the caches)
+    from index_store import index_manager
+    with index_manager.acquire() as index:
+        version = index.version if index is not None else None
+
+    previous_umask = os.umask(0o177)
+    try:
+        server = DaemonServer(socket_path, DaemonHandler)
+    finally:
+        os.umask(previous_umask)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown, daemon=True).start())
+    print(f"smartvote daemon (pid {os.getpid()}) serving index version {version} on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        print("smartvote daemon stopped")
+    return 0
+
+
+# Client
+
+class DaemonClient:
+    """A connection to a running daemon."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+    @classmethod
+    def connect(cls, socket_path):
+        """
+        Connect to the daemon.
+
+        Returns:
+            DaemonClient: The connection, or None if no daemon is listening
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(DAEMON_CONNECT_TIMEOUT)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            return None
+        # Commands such as ingestion may take minutes
+        sock.settimeout(None)
+        return cls(sock)
+
+    def call(self, command, args=None, on_event=None):
+        """
+        Run a command in the daemon.
+
+        Returns:
+            dict: The response ({"ok", "result"} or {"ok", "error"})
+        """
+        self.sock.sendall(json.dumps({"command": command, "args": args or {}}).encode("utf-8") + b"\n")
+        for line in self.reader:
+            message = json.loads(line)
+            if "event" in message:
+                if on_event is not None:
+                    on_event(message["event"])
+                continue
+            return message
+        raise ConnectionError("The daemon closed the connection")
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class LocalRunner:
+    """Runs commands in this process when no daemon is listening."""
+
+    def call(self, command, args=None, on_event=None):
+        # Keep the modules' progress prints off stdout, which carries the results
+        with contextlib.redirect_stdout(sys.stderr):
+            return execute(command, args or {}, on_event or (lambda event: None))
+
+    def close(self):
+        pass
+
+
+def open_runner(options):
+    """
+    The daemon if one is listening (unless --local), otherwise this process.
+
+    Returns:
+        tuple: (runner, mode) with mode "daemon" or "in-process"
+    """
+    if not options.local:
+        client = DaemonClient.connect(options.socket)
+        if client is not None:
+            return client, "daemon"
+        print(f"smartvote: no daemon on {options.socket}; running in-process", file=sys.stderr)
+    return LocalRunner(), "in-process"
+
+
+def read_queries(path):
+    """
+    Read queries from a file ("-" for stdin): a JSON array of strings, or one per line.
+
+    Blank lines and # comments are skipped, as in the popular question list.
+    """
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, "r") as f:
+            text = f.read()
+    if text.lstrip().startswith("["):
+        return [str(query) for query in json.loads(text)]
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith("#")]
+
+
+def print_json(value):
+    print(json.dumps(value, ensure_ascii=False))
+
+
+def print_query_result(result):
+    version = f", index {result['version']}" if result.get("version") else ""
+    print(f"{result['query']}  ({result['elapsed_ms']:.1f} ms{version})")
+    if not result["documents"]:
+        print("  no matching pages")
+    for rank, doc in enumerate(result["documents"], 1):
+        page = doc.get("page_label") or doc.get("page_num")
+        section = f"  {doc['section']}" if doc.get("section") else ""
+        print(f"  {rank}. {doc['document']} p. {page}  {doc['similarity']:.3f}{section}")
+    analysis = result.get("analysis")
+    if analysis:
+        print()
+        print(analysis.get("response") if isinstance(analysis, dict) else analysis)
+    print()
+
+
+def command_query(options, runner, mode):
+    queries = list(options.queries)
+    if options.file:
+        queries += read_queries(options.file)
+    if not queries:
+        raise CommandError("No queries given")
+    response = runner.call("query", {
+        "queries": queries, "party": options.party, "year": options.year,
+        "top_n": options.top_n, "analyze": options.analyze,
+    })
+    if not response["ok"]:
+        raise CommandError(response["error"])
+    for result in response["result"]:
+        if options.json:
+            print_json(result)
+        else:
+            print_query_result(result)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def command_bench(options, runner, mode):
+    """Time each query round trip, as a script running one check at a time would see it."""
+    queries = read_queries(options.file)
+    if not queries:
+        raise CommandError(f"No queries in {options.file}")
+    args = {"party": options.party, "year": options.year, "top_n": options.top_n}
+
+    started = time.perf_counter()
+    timings = []
+    for _ in range(options.repeat):
+        for query in queries:
+            sent = time.perf_counter()
+            response = runner.call("query", {**args, "queries": [query]})
+            if not response["ok"]:
+                raise CommandError(response["error"])
+            timings.append((time.perf_counter() - sent) * 1000)
+    total = time.perf_counter() - started
+
+    report = {
+        "mode": mode,
+        "queries": len(queries),
+        "repeat": options.repeat,
+        "first_ms": round(timings[0], 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(percentile(timings, 0.5), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "max_ms": round(max(timings), 3),
+        "queries_per_second": round(len(timings) / total, 1),
+    }
+    if options.json:
+        print_json(report)
+        return
+    print(f"{len(timings)} queries ({len(queries)} x {options.repeat}) {mode}")
+    for key in ("first_ms", "mean_ms", "p50_ms", "p95_ms", "max_ms", "queries_per_second"):
+        print(f"  {key:<20}{report[key]}")
+
+
+def command_stats(options, runner, mode):
+    response = runner.call("stats")
+    if not response["ok"]:
+        raise CommandError(response["error"])
+    print(json.dumps({"mode": mode, **response["result"]}, indent=None if options.json else 2))
+
+
+def command_ingest(options, runner, mode):
+    def show(event):
+        fields = " ".join(f"{key}={value}" for key, value in event.items() if key != "stage")
+        print(f"  {event['stage']} {fields}", file=sys.stderr)
+
+    response = runner.call("ingest", {
+        "path": os.path.abspath(options.path), "party": options.party, "year": options.year,
+        "title": options.title, "name": options.name,
+    }, on_event=show)
+    if not response["ok"]:
+        raise CommandError(response["error"])
+    job = response["result"]
+    if options.json:
+        print_json(job)
+    else:
+        print(f"Ingested {job['document']} for {job['party']} as index version {job['version']}")
+
+
+def command_stop(options):
+    client = DaemonClient.connect(options.socket)
+    if client is None:
+        print(f"No daemon is listening on {options.socket}")
+        return 1
+    try:
+        response = client.call("stop")
+    finally:
+        client.close()
+    print(f"Stopped the daemon (pid {response['result']['pid']})")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="SmartVote from the command line, warm through a local daemon")
+    parser.add_argument("--socket", default=default_socket_path(),
+                        help=f"Daemon socket (default: ${DAEMON_SOCKET_ENV} or data/{DAEMON_SOCKET_NAME})")
+    parser.add_argument("--local", action="store_true",
+                        help="Run in this process even if a daemon is listening")
+    parser.add_argument("--json", action="store_true",
+                        help="Print results as JSON (one object per line)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_filters(subparser):
+        subparser.add_argument("--party", default=DEFAULT_PARTY, help="Party to search")
+        subparser.add_argument("--year", type=int, help="Only search platforms from this year")
+        subparser.add_argument("--top-n", type=int, default=TOP_N_DOCUMENTS, help="Pages per query")
+
+    query = commands.add_parser("query", help="Rank the pages matching each query")
+    query.add_argument("queries", nargs="*", help="Queries")
+    query.add_argument("--file", help="Read queries from a file (- for stdin), one per line or a JSON array")
+    query.add_argument("--analyze", action="store_true", help="Also generate the analysis (calls the model)")
+    add_filters(query)
+
+    bench = commands.add_parser("bench", help="Time query round trips")
+    bench.add_argument("file", nargs="?", default=DEFAULT_QUESTIONS_FILE,
+                       help="Queries, one per line or a JSON array (default: data/popular_questions.txt)")
+    bench.add_argument("--repeat", type=int, default=BENCH_REPEAT, help="Times each query is asked")
+    add_filters(bench)
+
+    commands.add_parser("stats", help="Index, cache and process statistics")
+
+    ingest = commands.add_parser("ingest", help="Add a platform PDF and wait for it to be indexed")
+    ingest.add_argument("path", help="PDF file")
+    ingest.add_argument("--party", required=True, help="Party id")
+    ingest.add_argument("--year", type=int, help="Platform year")
+    ingest.add_argument("--title", help="Platform title")
+    ingest.add_argument("--name", help="Display name of the party, if it is new")
+
+    commands.add_parser("daemon", help="Serve the other commands warm on the socket")
+    commands.add_parser("stop", help="Stop the daemon")
+    return parser
+
+
+CLIENT_COMMANDS = {
+    "query": command_query,
+    "bench": command_bench,
+    "stats": command_stats,
+    "ingest": command_ingest,
+}
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    if options.command == "daemon":
+        return serve(options.socket)
+    if options.command == "stop":
+        return command_stop(options)
+
+    runner, mode = open_runner(options)
+    try:
+        CLIENT_COMMANDS[options.command](options, runner, mode)
+    except CommandError as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        runner.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
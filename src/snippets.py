@@ -0,0 +1,91 @@
+"""
+Query-focused snippets with highlight offsets for compact responses.
+"""
+import re
+
+from config import SNIPPET_MAX_CHARS
+
+# Words too common to be worth highlighting
+STOP_WORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "your", "all", "any", "can",
+    "has", "have", "her", "his", "how", "its", "our", "out", "was", "what", "when",
+    "where", "which", "who", "why", "will", "with", "about", "does", "from", "that",
+    "their", "them", "they", "this", "would", "there", "into", "plan", "plans",
+}
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def query_terms(query):
+    """
+    Extract the distinct, meaningful terms of a query.
+
+    Args:
+        query (str): The user query
+
+    Returns:
+        list: Lowercase terms in query order
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(query.lower()):
+        if len(word) >= 3 and word not in STOP_WORDS and word not in terms:
+            terms.append(word)
+    return terms
+
+
+def _term_matches(text, terms):
+    """Find (start, end, term) for every word in text that starts with a query term."""
+    if not terms:
+        return []
+    pattern = re.compile(r"\b(" + "|".join(re.escape(term) for term in terms) + r")\w*", re.IGNORECASE)
+    return [(match.start(), match.end(), match.group(1).lower()) for match in pattern.finditer(text)]
+
+
+def build_snippet(text, query, max_chars=SNIPPET_MAX_CHARS):
+    """
+    Pick the passage of a page that best covers the query terms.
+
+    Args:
+        text (str): Full page text
+        query (str): The user query
+        max_chars (int): Maximum snippet length
+
+    Returns:
+        dict: snippet text, its character offset in the page, and highlight
+            ranges as [start, end] pairs relative to the snippet
+    """
+    text = text or ""
+    if len(text) <= max_chars:
+        start, end = 0, len(text)
+    else:
+        matches = _term_matches(text, query_terms(query))
+        start = 0
+        if matches:
+            # Slide a window across the matches and keep the one covering the most
+            # distinct terms (then the most occurrences)
+            best_score = (-1, -1)
+            right = 0
+            for left in range(len(matches)):
+                while right < len(matches) and matches[right][1] - matches[left][0] <= max_chars:
+                    right += 1
+                window = matches[left:right]
+                score = (len({term for _, _, term in window}), len(window))
+                if score > best_score:
+                    best_score = score
+                    # Center the covered span in the window
+                    span = window[-1][1] - window[0][0]
+                    start = max(0, window[0][0] - (max_chars - span) // 2)
+        start = min(start, len(text) - max_chars)
+        end = start + max_chars
+
+        # Snap to word boundaries so we never cut a word in half
+        if start > 0:
+            space = text.find(" ", start, start + 40)
+            start = space + 1 if space != -1 else start
+        if end < len(text):
+            space = text.rfind(" ", end - 40, end)
+            end = space if space > start else end
+
+    snippet = text[start:end]
+    highlights = [[match_start, match_end] for match_start, match_end, _ in _term_matches(snippet, query_terms(query))]
+    return {"snippet": snippet, "offset": start, "highlights": highlights}
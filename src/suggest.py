@@ -0,0 +1,288 @@
+"""
+Typeahead suggestions that steer users onto questions we can answer cheaply.
+
+Suggestions come from curated sources only, ranked in this order of
+preference:
+
+- questions with a precomputed answer (answered without any upstream call)
+- the popular question list (data/popular_questions.txt)
+- section titles of the platforms and key phrases extracted from their
+  pages at ingest time
+
+What users ask is never published as a suggestion: a question asked
+SUGGEST_MIN_QUERY_COUNT times only ranks the curated suggestion with the
+same canonical form higher, so repeated spam or personal text can't reach
+anyone's typeahead.
+
+Every suggestion is indexed under each of its words, so "hous" completes
+both "housing" and "affordable housing", in a sorted list of keys searched
+with bisect. A prefix that matches nothing as a whole is completed from its
+longest trailing run of words that does, so "what is your plan for hou"
+completes like "hou". The top suggestions for every one- and two-character prefix
+are precomputed, so a lookup never scans more than the keys sharing a
+longer prefix and takes well under a millisecond, without any embedding
+or model call.
+
+The index is rebuilt in the background when the index version, the
+precomputed answers or the set of frequently asked questions change;
+lookups keep using the previous one meanwhile.
+"""
+import bisect
+import heapq
+import re
+import threading
+from collections import Counter
+
+from canonical import canonicalize_query
+from index_store import index_manager
+from answer_store import answer_store, load_questions, DEFAULT_QUESTIONS_FILE
+from config import (
+    SUGGEST_LIMIT, SUGGEST_MIN_QUERY_COUNT, SUGGEST_MAX_TRACKED_QUERIES, KEY_PHRASES_PER_PAGE, DEFAULT_PARTY,
+)
+
+# Base score per source; key phrases add the number of pages they appear on
+SOURCE_WEIGHTS = {"answer": 1000.0, "question": 500.0, "section": 100.0, "phrase": 0.0}
+# Added to a suggestion users ask for often, plus the number of times it was asked
+ASKED_BOOST = 200.0
+# Matches on a later word of a suggestion rank below matches on its first word
+INNER_WORD_FACTOR = 0.5
+PRECOMPUTED_PREFIX_LENGTH = 2
+
+_NON_WORD = re.compile(r"[^\w']+")
+_PHRASE_BREAK = re.compile(r"[^\w\s'\-]+|\n")
+_WORD = re.compile(r"[a-z][a-z'\-]*[a-z]")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each every few for from further had has have
+having he her here hers him his how i if in into is it its itself just me more most my new no nor not now
+of off on once only or other our ours out over own same she should so some such than that the their theirs
+them then there these they this those through to too under until up very was we were what when where
+which while who whom why will with would you your yours canada canadians canadian government liberal
+liberals party re-elected elected ensure continue make made including since year years per cent like
+""".split())
+
+
+def normalize_text(text):
+    """Matching form of a suggestion or prefix: casefolded words separated by single spaces."""
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def extract_key_phrases(text, limit=KEY_PHRASES_PER_PAGE):
+    """
+    Pick the key phrases of a page: runs of two to four content words between
+    stopwords and punctuation, by how often they occur on the page.
+
+    Args:
+        text (str): Page text
+        limit (int): Maximum number of phrases
+
+    Returns:
+        list: Phrases, most frequent first
+    """
+    counts = Counter()
+    for chunk in _PHRASE_BREAK.split(text.lower()):
+        run = []
+        for token in chunk.split() + [""]:
+            word = token.strip("'-")
+            if word and _WORD.fullmatch(word) and word not in STOPWORDS and len(word) > 2:
+                run.append(word)
+                continue
+            if 2 <= len(run) <= 4:
+                counts[" ".join(run)] += 1
+            run = []
+    return [phrase for phrase, _ in sorted(counts.items(), key=lambda item: (-item[1] * len(item[0].split()), item[0]))[:limit]]
+
+
+class PrefixIndex:
+    """Ranked completions for word prefixes, over a fixed set of suggestions."""
+
+    def __init__(self, suggestions, limit=SUGGEST_LIMIT):
+        """
+        Args:
+            suggestions (list): Dicts with "text", "kind", "score" (and optional fields)
+            limit (int): Most completions ever returned per lookup
+        """
+        self.suggestions = suggestions
+        self.limit = limit
+        self.max_words = 0  # No key is longer than the longest suggestion
+        keys = []
+        for number, suggestion in enumerate(suggestions):
+            words = normalize_text(suggestion["text"]).split(" ")
+            self.max_words = max(self.max_words, len(words))
+            for position in range(len(words)):
+                factor = 1.0 if position == 0 else INNER_WORD_FACTOR
+                keys.append((" ".join(words[position:]), number, suggestion["score"] * factor))
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.entries = [(number, score) for _, number, score in keys]
+
+        # Short prefixes match many keys; rank those once up front
+        self.short_prefixes = {}
+        for key, number, score in keys:
+            for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+                if len(key) >= length:
+                    self.short_prefixes.setdefault(key[:length], []).append((number, score))
+        for prefix, entries in self.short_prefixes.items():
+            self.short_prefixes[prefix] = self._rank(entries, limit)
+
+    @staticmethod
+    def _rank(entries, limit):
+        best = {}
+        for number, score in entries:
+            if score > best.get(number, -1.0):
+                best[number] = score
+        return heapq.nlargest(limit, best.items(), key=lambda item: (item[1], -item[0]))
+
+    def complete(self, prefix, limit):
+        """
+        Suggestions with a word starting with the prefix, best first.
+
+        Args:
+            prefix (str): Normalized prefix
+            limit (int): Number of suggestions
+
+        Returns:
+            list: Suggestion dicts
+        """
+        if not prefix:
+            return []
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            ranked = self.short_prefixes.get(prefix, [])
+        else:
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + "\uffff", lo=start)
+            ranked = self._rank(self.entries[start:end], limit)
+        return [self.suggestions[number] for number, _ in ranked[:limit]]
+
+
+class SuggestionIndex:
+    """Per-party prefix indexes, rebuilt in the background as their sources change."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = {}  # party -> PrefixIndex
+        self._built_for = None
+        self._building = False
+        self._asked = Counter()  # canonical query -> times asked
+        self._promoted = frozenset()
+
+    def record_query(self, query):
+        """Count an asked question; frequent ones rank matching suggestions higher."""
+        canonical = canonicalize_query(query)
+        if not canonical:
+            return
+        with self._lock:
+            self._asked[canonical] += 1
+            if self._asked[canonical] == SUGGEST_MIN_QUERY_COUNT:
+                self._promoted = self._promoted | {canonical}
+            if len(self._asked) > SUGGEST_MAX_TRACKED_QUERIES:
+                # Forget the least asked half
+                kept = dict(self._asked.most_common(SUGGEST_MAX_TRACKED_QUERIES // 2))
+                self._asked = Counter(kept)
+                self._promoted = frozenset(key for key in self._promoted if key in kept)
+
+    def _sources_key(self):
+        answers = {party: len(answer_store.answers(party)) for party in self._parties()}
+        return (index_manager.version, tuple(sorted(answers.items())), self._promoted)
+
+    def _parties(self):
+        with index_manager.acquire() as index:
+            parties = index.parties() if index is not None else []
+        return parties or [DEFAULT_PARTY]
+
+    def _build(self, key):
+        try:
+            indexes = {}
+            with index_manager.acquire() as index:
+                sections = index.table_of_contents() if index is not None else []
+                pages = list(index.documents) if index is not None else []
+            try:
+                questions = load_questions(DEFAULT_QUESTIONS_FILE)
+            except OSError:
+                questions = []
+            with self._lock:
+                asked = {canonical: self._asked[canonical] for canonical in self._promoted}
+
+            for party in self._parties():
+                indexes[party] = PrefixIndex(self._suggestions(party, sections, pages, questions, asked))
+            with self._lock:
+                self._indexes = indexes
+                self._built_for = key
+        except Exception as e:
+            print(f"Error building suggestion index: {str(e)}")
+        finally:
+            with self._lock:
+                self._building = False
+
+    @staticmethod
+    def _suggestions(party, sections, pages, questions, asked):
+        """Every suggestion for one party, one per canonical text, with its best score."""
+        answered = answer_store.answers(party)
+        candidates = []
+        for canonical, entry in answered.items():
+            candidates.append((entry.get("query") or canonical, "answer", SOURCE_WEIGHTS["answer"]))
+        for question in questions:
+            candidates.append((question, "question", SOURCE_WEIGHTS["question"]))
+        for section in sections:
+            if section["party"] == party and section["title"]:
+                candidates.append((section["title"].strip(" —-"), "section", SOURCE_WEIGHTS["section"]))
+        phrase_pages = Counter(
+            phrase for page in pages if page["party"] == party for phrase in page.get("key_phrases", ())
+        )
+        for phrase, count in phrase_pages.items():
+            candidates.append((phrase, "phrase", SOURCE_WEIGHTS["phrase"] + count))
+
+        best = {}
+        for text, kind, score in candidates:
+            canonical = canonicalize_query(text)
+            if canonical and (canonical not in best or score > best[canonical]["score"]):
+                best[canonical] = {"text": text, "kind": kind, "score": score, "cached": canonical in answered}
+        # Frequently asked questions only promote curated suggestions, never their own text
+        for canonical, count in asked.items():
+            if canonical in best:
+                best[canonical]["score"] += ASKED_BOOST + count
+        return list(best.values())
+
+    def suggest(self, prefix, party=None, limit=SUGGEST_LIMIT):
+        """
+        Complete a partly typed question.
+
+        Args:
+            prefix (str): What the user has typed so far
+            party (str, optional): Party being asked about. Defaults to DEFAULT_PARTY.
+            limit (int): Number of suggestions
+
+        Returns:
+            list: {"text", "kind", "cached"} dicts, best first
+        """
+        key = self._sources_key()
+        with self._lock:
+            stale = key != self._built_for and not self._building
+            if stale:
+                self._building = True
+            first_build = not self._indexes
+        if stale:
+            if first_build:
+                self._build(key)
+            else:
+                threading.Thread(target=self._build, args=(key,), name="suggest-build", daemon=True).start()
+
+        index = self._indexes.get(party or DEFAULT_PARTY)
+        if index is None:
+            return []
+        limit = max(1, min(limit, SUGGEST_LIMIT))
+        words = normalize_text(prefix).split(" ")
+        results = index.complete(" ".join(words), limit)
+        # Keys start at a word of a suggestion, so a question typed around the topic
+        # completes from its longest trailing run of words that matches one:
+        # "What is your plan for hou" -> "hou"
+        for start in range(max(1, len(words) - index.max_words), len(words)):
+            if results:
+                break
+            results = index.complete(" ".join(words[start:]), limit)
+        return [{"text": item["text"], "kind": item["kind"], "cached": item["cached"]} for item in results]
+
+
+# Shared index for the process
+suggestion_index = SuggestionIndex()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Checks for the shared cache backends of cache_backends.py.
+
+Runs offline: the SQLite backend uses a temporary file and the Redis
+backend talks to a minimal Redis-protocol server started in this process.
+Each check uses two backend instances, standing in for two workers:
+
+    cd src/tests
+    python cache_backends_test.py
+"""
+import fnmatch
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+# Add the parent directory to the Python path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_backends import SQLiteBackend, RedisBackend, CacheGeneration, SharedCache, clear_regions
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    """Just the commands RedisBackend sends: GET, SET (with PX), DEL, INCR and SCAN."""
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    @staticmethod
+    def bulk(value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def live(self, key):
+        entry = self.server.store.get(key)
+        if entry is None or (entry[1] is not None and entry[1] < time.time()):
+            self.server.store.pop(key, None)
+            return None
+        return entry[0]
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            args = self.read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            with self.server.lock:
+                if command == b"GET":
+                    reply = self.bulk(self.live(args[1]))
+                elif command == b"SET":
+                    expires_at = time.time() + int(args[4]) / 1000 if len(args) > 4 and args[3].upper() == b"PX" else None
+                    store[args[1]] = (args[2], expires_at)
+                    reply = b"+OK\r\n"
+                elif command == b"DEL":
+                    reply = b":%d\r\n" % sum(store.pop(key, None) is not None for key in args[1:])
+                elif command == b"INCR":
+                    value = str(int(self.live(args[1]) or 0) + 1).encode()
+                    store[args[1]] = (value, None)
+                    reply = b":" + value + b"\r\n"
+                elif command == b"SCAN":
+                    # Everything in one page; the backend must still follow the cursor protocol
+                    pattern = args[3].decode()
+                    keys = [key for key in list(store) if self.live(key) is not None and fnmatch.fnmatchcase(key.decode(), pattern)]
+                    reply = b"*2\r\n" + self.bulk(b"0") + b"*%d\r\n" % len(keys) + b"".join(self.bulk(key) for key in keys)
+                else:
+                    reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+class RespServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RespHandler)
+        self.store = {}
+        self.lock = threading.Lock()
+
+
+def make_regions(backend, ttl=60):
+    """The embedding and results regions of one worker, checking the generation on every call."""
+    generation = CacheGeneration(backend, check_interval=0)
+    return SharedCache(backend, "embeddings", generation, ttl), SharedCache(backend, "results", generation, ttl)
+
+
+def check_shared(first, second):
+    """Run the get/set, TTL, drop and clear checks on two instances sharing one store."""
+    embeddings_a, results_a = make_regions(first)
+    embeddings_b, results_b = make_regions(second)
+
+    embeddings_a.set(("what about housing?",), [0.5, 0.25])
+    assert embeddings_b.get(("what about housing?",)) == [0.5, 0.25], "value not shared between workers"
+    assert embeddings_b.get(("what about transit?",)) is None, "miss returned a value"
+
+    short, _ = make_regions(first, ttl=1.0)
+    short.set(("expiring",), {"pages": [1]})
+    assert embeddings_b.get(("expiring",)) == {"pages": [1]}, "value missing before its TTL"
+    time.sleep(1.2)
+    assert embeddings_b.get(("expiring",)) is None, "value still served after its TTL"
+
+    results_a.set(("v1", "housing", 5), [[1, 0.9]])
+    results_a.set(("v1", "transit", 5), [[2, 0.8]])
+    results_a.set(("v10", "housing", 5), [[3, 0.7]])
+    results_a.set(("v2", "housing", 5), [[4, 0.6]])
+    results_b.drop("v1")
+    assert results_a.get(("v1", "housing", 5)) is None, "drop left a result of the old version"
+    assert results_a.get(("v1", "transit", 5)) is None, "drop left a result of the old version"
+    assert results_a.get(("v10", "housing", 5)) == [[3, 0.7]], "drop removed a version sharing its prefix"
+    assert results_a.get(("v2", "housing", 5)) == [[4, 0.6]], "drop removed another version"
+
+    clear_regions([embeddings_b, results_b])
+    assert embeddings_a.get(("what about housing?",)) is None, "clear did not reach the other worker"
+    assert results_a.get(("v2", "housing", 5)) is None, "clear did not reach the other worker"
+    embeddings_a.set(("what about housing?",), [0.75])
+    assert embeddings_b.get(("what about housing?",)) == [0.75], "workers disagree on the generation after a clear"
+
+
+def test_sqlite_shared():
+    """Two SQLite backends on one file share values, TTLs, drops and clears"""
+    print("Testing the SQLite backend across two workers...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "queries.sqlite")
+        check_shared(SQLiteBackend(path, 1000), SQLiteBackend(path, 1000))
+    print("✅ Values, TTLs, drops and clears are shared")
+
+
+def test_sqlite_max_entries():
+    """Writes from two workers never leave the SQLite table over max_entries"""
+    print("\nTesting the SQLite entry limit...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "queries.sqlite")
+        workers = [SQLiteBackend(path, 5), SQLiteBackend(path, 5)]
+        for i in range(20):
+            workers[i % 2].set(f"key:{i}", i)
+            (count,) = workers[0]._connection().execute("SELECT COUNT(*) FROM entries").fetchone()
+            assert count <= 5, f"{count} entries after write {i + 1}, limit is 5"
+        assert workers[1].get("key:19") == 19, "newest entry was evicted"
+        assert workers[1].get("key:0") is None, "oldest entry was kept"
+    print("✅ Table stays within max_entries on every write")
+
+
+def test_redis_shared():
+    """Two Redis backends on one server share values, TTLs, drops and clears"""
+    print("\nTesting the Redis backend across two workers...")
+    server = RespServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"redis://127.0.0.1:{server.server_address[1]}/0"
+        check_shared(RedisBackend(url), RedisBackend(url))
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("✅ Values, TTLs, drops and clears are shared")
+
+
+if __name__ == "__main__":
+    failures = 0
+    for check in (test_sqlite_shared, test_sqlite_max_entries, test_redis_shared):
+        try:
+            check()
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {check.__doc__}: {e}")
+    sys.exit(1 if failures else 0)
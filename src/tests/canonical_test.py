@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Checks for the query canonicalization of canonical.py.
+
+Runs offline against the configured stop-phrase lists:
+
+    cd src/tests
+    python canonical_test.py
+"""
+import sys
+import os
+
+# Add the parent directory to the Python path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from canonical import canonicalize_query, normalize_query
+from config import QUERY_STOP_PHRASES, QUERY_TRAILING_STOP_PHRASES
+
+
+def test_stop_phrases():
+    """Every configured stop phrase is stripped from its end of the query, and only there"""
+    print("Testing the stop-phrase lists...")
+    for phrase in QUERY_STOP_PHRASES:
+        for query in (f"{phrase} housing", f"{phrase.upper()} Housing?", f"{phrase}, housing"):
+            assert canonicalize_query(query) == "housing", f"{query!r} -> {canonicalize_query(query)!r}"
+    for phrase in QUERY_TRAILING_STOP_PHRASES:
+        for query in (f"housing {phrase}", f"Housing, {phrase.title()}!"):
+            assert canonicalize_query(query) == "housing", f"{query!r} -> {canonicalize_query(query)!r}"
+    assert canonicalize_query("Please, can you tell me about what is the housing plan? Thank you!") == "the housing plan"
+    # Filler inside the question, or inside a word, is content
+    assert canonicalize_query("housing: what is affordable") == "housing what is affordable"
+    assert canonicalize_query("explaining the deficit") == "explaining the deficit"
+    assert canonicalize_query("whatever happened to pharmacare") == "whatever happened to pharmacare"
+    print(f"✅ {len(QUERY_STOP_PHRASES)} leading and {len(QUERY_TRAILING_STOP_PHRASES)} trailing phrases stripped")
+
+
+def test_equivalent_spellings():
+    """Case, spacing, punctuation and quote style don't change the canonical form"""
+    print("\nTesting equivalent spellings...")
+    variants = ["What is the party's plan for U.S. trade?", "what is   the party’s plan for u.s. trade", "WHAT IS THE PARTY'S PLAN FOR U.S. TRADE!!"]
+    canonical = {canonicalize_query(query) for query in variants}
+    # The closing dot of "U.S." is punctuation, but the inner one keeps it apart from "us"
+    assert canonical == {"the party's plan for u.s trade"}, canonical
+    assert canonicalize_query("A 2.5% GST cut - good idea?") == "a 2.5 gst cut good idea", canonicalize_query("A 2.5% GST cut - good idea?")
+    assert canonicalize_query("pay-as-you-go") == "pay-as-you-go"
+    print(f"✅ {len(variants)} spellings -> {canonical.pop()!r}")
+
+
+def test_filler_only():
+    """A query made only of filler falls back to its normalized form, and the query itself is never rewritten"""
+    print("\nTesting filler-only queries...")
+    for query in ("Thank you!", "please", "What is"):
+        assert canonicalize_query(query) == query.lower().rstrip("!"), f"{query!r} -> {canonicalize_query(query)!r}"
+    assert canonicalize_query("") == "" and canonicalize_query(None) == ""
+    assert normalize_query("  Tell me about\tthe  U.S.  border, please ") == "Tell me about the U.S. border, please"
+    print("✅ Filler-only queries keep a non-empty key")
+
+
+if __name__ == "__main__":
+    failures = 0
+    for check in (test_stop_phrases, test_equivalent_spellings, test_filler_only):
+        try:
+            check()
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {check.__doc__}: {e}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Checks for the boilerplate and near-duplicate detection of dedup.py.
+
+Runs offline on synthetic pages:
+
+    cd src/tests
+    python dedup_test.py
+"""
+import sys
+import os
+
+# Add the parent directory to the Python path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import find_boilerplate, strip_boilerplate, collapse_near_duplicates
+
+TOPICS = [
+    "economy plan creates jobs in every region", "climate targets cut emissions by half",
+    "housing supply doubles over ten years", "child care costs fall to ten dollars a day",
+    "health care wait times come down", "pharmacare covers essential medicines",
+    "transit funding reaches smaller cities", "small businesses pay lower fees",
+    "seniors receive a higher pension", "students graduate with less debt",
+    "veterans get faster service", "farmers adapt to drought", "the north gets broadband",
+    "workers train for new trades", "rural hospitals stay open", "clean water reaches every community",
+    "wildfire crews get new equipment", "ports move goods faster", "artists tour more widely",
+    "tourism recovers after the pandemic",
+]
+OPENERS = ["The", "We will make sure the", "Our", "This means the", "The new", "We will"]
+
+
+def make_pages():
+    """Pages of ordinary prose that start with common words, under a running header and a page number."""
+    pages = []
+    for number, topic in enumerate(TOPICS, 3):
+        opener = OPENERS[number % len(OPENERS)]
+        pages.append("\n".join([
+            f"Forward. For Everyone. {number} {opener} {topic}, and we will report on progress.",
+            f"{OPENERS[(number + 1) % len(OPENERS)]} {TOPICS[(number + 5) % len(TOPICS)]} as well.",
+            "We will work with provinces and territories to deliver results.",
+            f"The plan for {topic.split()[0]} is funded in the budget.",
+            f"{OPENERS[(number + 2) % len(OPENERS)]} {topic} by the end of the mandate.",
+            f"Page {number}",
+        ]))
+    return pages
+
+
+def test_headers_detected():
+    """The running header and the page number footer are found, and nothing else"""
+    print("Testing boilerplate detection...")
+    boilerplate = find_boilerplate(make_pages())
+    assert boilerplate == ["forward. for everyone. #", "page #"], f"unexpected boilerplate: {boilerplate}"
+    print(f"✅ Found {boilerplate}")
+
+
+def test_prose_survives_stripping():
+    """Stripping removes the header and footer but no words of the prose around them"""
+    print("\nTesting that ordinary prose survives stripping...")
+    pages = make_pages()
+    boilerplate = find_boilerplate(pages)
+    for page in pages:
+        stripped = strip_boilerplate(page, boilerplate)
+        lines = page.splitlines()
+        expected = [lines[0].split(" ", 4)[4]] + lines[1:-1]
+        assert stripped.splitlines() == expected, f"prose changed:\n{stripped}\nexpected:\n" + "\n".join(expected)
+    print(f"✅ All {len(pages)} pages keep their prose")
+
+
+def test_common_openers_are_not_boilerplate():
+    """Sentences that merely start the same way ("The", "We will") are not headers"""
+    print("\nTesting that common sentence openers are kept...")
+    pages = [
+        f"The {topic} under this plan.\nThe {TOPICS[(i + 3) % len(TOPICS)]} next year.\n"
+        f"Costs for {topic.split()[0]} are set out in the fiscal plan.\nOur {TOPICS[(i + 7) % len(TOPICS)]}.\n"
+        f"We will {topic} soon.\nWe will {TOPICS[(i + 11) % len(TOPICS)]} as well."
+        for i, topic in enumerate(TOPICS)
+    ]
+    boilerplate = find_boilerplate(pages)
+    assert boilerplate == [], f"prose detected as boilerplate: {boilerplate}"
+    assert strip_boilerplate(pages[0], boilerplate) == pages[0]
+    print("✅ No boilerplate found in plain prose")
+
+
+def test_near_duplicates_collapsed():
+    """A repeated page is collapsed into the first copy; distinct pages are kept"""
+    print("\nTesting near-duplicate collapsing...")
+    pages = make_pages()
+    summary = "In summary, " + " ".join(TOPICS[:8]) + "."
+    numbered = [(1, pages[0]), (2, summary), (3, pages[1]), (4, summary + " "), (5, pages[2])]
+    groups = collapse_near_duplicates(numbered)
+    assert [page_nums for _, _, page_nums in groups] == [[1], [2, 4], [3], [5]], groups
+    print("✅ Duplicate summary pages collapsed into one entry")
+
+
+if __name__ == "__main__":
+    failures = 0
+    for check in (test_headers_detected, test_prose_survives_stripping, test_common_openers_are_not_boilerplate,
+                  test_near_duplicates_collapsed):
+        try:
+            check()
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {check.__doc__}: {e}")
+    sys.exit(1 if failures else 0)
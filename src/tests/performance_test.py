@@ -17,6 +17,7 @@ from embedding import get_embedding
 from retriever import retrieve_similar_documents, clear_cache
 from analyzer import generate_analysis
 from main import Party
+from index_store import read_current_version, INDEX_ROOT, EMBEDDINGS_FILENAME, LEGACY_EMBEDDINGS_FILE
 from config import TOP_N_DOCUMENTS
 
 # Set a timeout for each test function using threading.Timer
@@ -63,7 +64,11 @@ class PerformanceTest:
         self.script_dir = os.path.dirname(os.path.abspath(__file__))
         self.src_dir = os.path.dirname(self.script_dir)
         self.pdf_path = os.path.join(self.src_dir, "data", "Liberal.pdf")
-        self.embeddings_path = os.path.join(self.src_dir, "data", "document_embeddings.json")
+        current_version = read_current_version()
+        if current_version is not None:
+            self.embeddings_path = os.path.join(INDEX_ROOT, current_version, EMBEDDINGS_FILENAME)
+        else:
+            self.embeddings_path = LEGACY_EMBEDDINGS_FILE
         self.test_queries = [
             "housing crisis", 
             "climate change policy",
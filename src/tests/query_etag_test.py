@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Checks for the conditional requests of GET /query in app.py.
+
+Runs offline: the served index version and the query pipeline are replaced
+by stand-ins, so no index, embedding or model call is needed, and the
+startup hook that builds a missing index is never run:
+
+    cd src/tests
+    python query_etag_test.py
+"""
+import sys
+import os
+import types
+
+os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+# Add the parent directory to the Python path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import app as app_module
+from config import QUERY_MAX_AGE
+
+ANSWER = {
+    "analysis": {"response": "The platform commits to building more homes."},
+    "similar_documents": [{"page_num": 12, "similarity": 0.82}],
+}
+
+
+class Pipeline:
+    """Stands in for answer_query, counting the queries that reach it."""
+
+    def __init__(self, result=ANSWER):
+        self.result = result
+        self.calls = []
+
+    async def __call__(self, query_input, request):
+        self.calls.append(query_input.text)
+        return self.result
+
+
+def make_client(version="v1", result=ANSWER):
+    """A client for the app serving the given index version, and the pipeline behind it."""
+    served = types.SimpleNamespace(version=version)
+    pipeline = Pipeline(result)
+    app_module.index_manager = served
+    app_module.current_index_version = lambda: served.version
+    app_module.answer_query = pipeline
+    return TestClient(app_module.app), served, pipeline
+
+
+def test_not_modified():
+    """A matching If-None-Match is answered 304 without running the query"""
+    print("Testing 304 on a matching If-None-Match...")
+    client, _, pipeline = make_client()
+    response = client.get("/query", params={"q": "What is the housing plan?"})
+    assert response.status_code == 200 and response.json() == ANSWER, response.status_code
+    etag = response.headers.get("etag")
+    assert etag and etag.startswith('W/"'), f"no weak ETag: {etag}"
+    assert f"max-age={QUERY_MAX_AGE}" in response.headers["cache-control"], response.headers["cache-control"]
+    assert pipeline.calls == ["What is the housing plan?"]
+
+    for if_none_match in (etag, etag.removeprefix("W/"), f'"other", {etag}', "*"):
+        response = client.get("/query", params={"q": "What is the housing plan?"}, headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304, f"{if_none_match!r} -> {response.status_code}"
+        assert response.content == b"" and response.headers.get("etag") == etag, "304 without its ETag or with a body"
+    # Spellings with the same canonical form revalidate against the same tag
+    response = client.get("/query", params={"q": "  tell me about THE HOUSING PLAN please"}, headers={"If-None-Match": etag})
+    assert response.status_code == 304, f"canonical variant -> {response.status_code}"
+    assert len(pipeline.calls) == 1, f"304 ran the query: {pipeline.calls}"
+    print(f"✅ 304 for {etag} and its equivalent forms, with no query run")
+
+
+def test_modified():
+    """A different question, format or index version gets a fresh 200 with a new ETag"""
+    print("\nTesting that changes invalidate the ETag...")
+    client, served, pipeline = make_client()
+    etag = client.get("/query", params={"q": "housing"}).headers["etag"]
+    for params in ({"q": "transit"}, {"q": "housing", "compact": "true"}, {"q": "housing", "year": 2021}):
+        response = client.get("/query", params=params, headers={"If-None-Match": etag})
+        assert response.status_code == 200 and response.headers["etag"] != etag, f"{params} -> {response.status_code}"
+    served.version = "v2"
+    response = client.get("/query", params={"q": "housing"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag, "new index version kept the old ETag"
+    assert len(pipeline.calls) == 5, pipeline.calls
+    print("✅ Question, compact, year and index version each change the ETag")
+
+
+def test_degraded_not_cached():
+    """Degraded answers and answers from a swapped index are sent no-store without an ETag"""
+    print("\nTesting no-store answers...")
+    degraded = {"analysis": {"response": "Analysis unavailable", "degraded": True}, "similar_documents": ANSWER["similar_documents"]}
+    client, _, _ = make_client(result=degraded)
+    response = client.get("/query", params={"q": "housing"})
+    assert response.status_code == 200 and "etag" not in response.headers, "degraded answer got an ETag"
+    assert response.headers["cache-control"] == "no-store", response.headers["cache-control"]
+
+    client, served, pipeline = make_client()
+
+    async def swap_while_answering(query_input, request):
+        served.version = "v2"
+        return ANSWER
+
+    app_module.answer_query = swap_while_answering
+    response = client.get("/query", params={"q": "housing"})
+    assert "etag" not in response.headers and response.headers["cache-control"] == "no-store", "answer from a swapped index was cacheable"
+    print("✅ Degraded and swapped-index answers are never revalidated")
+
+
+if __name__ == "__main__":
+    failures = 0
+    for check in (test_not_modified, test_modified, test_degraded_not_cached):
+        try:
+            check()
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {check.__doc__}: {e}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Checks for the upstream call scheduler of scheduler.py.
+
+Runs offline: the "upstream calls" are local functions that hold their slot
+until the check releases them.
+
+    cd src/tests
+    python scheduler_test.py
+"""
+import sys
+import os
+import threading
+import time
+
+# Add the parent directory to the Python path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import LLMScheduler, SchedulerOverloaded, TokenBucket, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+
+
+def wait_for(condition, timeout=5.0):
+    """Poll until condition() holds, so a check never races the threads it started."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the scheduler"
+        time.sleep(0.01)
+
+
+def start_call(scheduler, priority, release, started=None, label=None, errors=None):
+    """Run a call on its own thread that records its label when it gets a slot and holds it until release is set."""
+    def call():
+        if started is not None:
+            started.append(label)
+        release.wait(5)
+
+    def worker():
+        try:
+            scheduler.run(call, priority=priority)
+        except Exception as e:
+            if errors is not None:
+                errors.append(e)
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_priority_order():
+    """Waiting interactive calls are served before batch calls that queued earlier"""
+    print("Testing priority order...")
+    scheduler = LLMScheduler("test", max_concurrency=1, requests_per_minute=60000, max_queue_depth=10)
+    release, started = threading.Event(), []
+    threads = [start_call(scheduler, PRIORITY_INTERACTIVE, release, started, "holder")]
+    wait_for(lambda: started == ["holder"])
+    # Queue in arrival order: batch work first, then interactive callers
+    for label, priority in (("batch-1", PRIORITY_BATCH), ("batch-2", PRIORITY_BATCH), ("interactive-1", PRIORITY_INTERACTIVE), ("interactive-2", PRIORITY_INTERACTIVE)):
+        threads.append(start_call(scheduler, priority, release, started, label))
+        wait_for(lambda: scheduler.stats()["queued"] == len(threads) - 1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert started == ["holder", "interactive-1", "interactive-2", "batch-1", "batch-2"], f"served out of order: {started}"
+    assert scheduler.stats()["completed"] == 5 and scheduler.stats()["running"] == 0, scheduler.stats()
+    print(f"✅ Served as {started[1:]}")
+
+
+def test_overload_rejection():
+    """A full queue rejects interactive calls with a Retry-After hint, while batch calls still queue"""
+    print("\nTesting overload rejection...")
+    scheduler = LLMScheduler("test", max_concurrency=1, requests_per_minute=60000, max_queue_depth=2)
+    release, errors = threading.Event(), []
+    threads = [start_call(scheduler, PRIORITY_INTERACTIVE, release, errors=errors)]
+    wait_for(lambda: scheduler.stats()["running"] == 1)
+    for queued in (1, 2):
+        threads.append(start_call(scheduler, PRIORITY_INTERACTIVE, release, errors=errors))
+        wait_for(lambda: scheduler.stats()["queued"] == queued)
+    assert scheduler.is_overloaded(), "full queue not reported as overloaded"
+    assert not scheduler.is_overloaded(PRIORITY_BATCH), "batch calls reported as overloaded"
+
+    try:
+        scheduler.run(lambda: None)
+        raise AssertionError("interactive call accepted with a full queue")
+    except SchedulerOverloaded as e:
+        assert e.retry_after >= 1.0 and e.retry_after == scheduler.retry_after(), f"retry_after {e.retry_after}"
+    assert scheduler.stats()["rejected"] == 1, scheduler.stats()
+
+    # Batch work waits its turn instead of failing, and everything drains once released
+    threads.append(start_call(scheduler, PRIORITY_BATCH, release, errors=errors))
+    wait_for(lambda: scheduler.stats()["queued"] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert not errors, f"queued calls failed: {errors}"
+    assert scheduler.stats()["completed"] == 4 and not scheduler.is_overloaded(), scheduler.stats()
+    print("✅ Interactive call rejected with a Retry-After hint; batch call queued and completed")
+
+
+def test_rate_limit():
+    """The token bucket paces calls to the configured rate, and a timed-out waiter leaves the queue"""
+    print("\nTesting rate limiting...")
+    bucket = TokenBucket(rate=2.0, capacity=1)
+    assert bucket.try_take() == 0.0, "first token not available"
+    wait = bucket.try_take()
+    assert 0.0 < wait <= 0.5, f"second token should be at most 0.5 s away, got {wait}"
+
+    # Bursts up to max_concurrency calls, then one call per second
+    scheduler = LLMScheduler("test", max_concurrency=1, requests_per_minute=60, max_queue_depth=10)
+    scheduler.run(lambda: None)
+    begin = time.monotonic()
+    try:
+        scheduler.run(lambda: None, wait_timeout=0.2)
+        raise AssertionError("second call ran before a token was available")
+    except TimeoutError:
+        pass
+    assert time.monotonic() - begin < 1.0, "timeout not honoured"
+    assert scheduler.stats()["queued"] == 0, "timed-out call left in the queue"
+    print("✅ Second call waits for a token and gives up at its timeout")
+
+
+if __name__ == "__main__":
+    failures = 0
+    for check in (test_priority_order, test_overload_rejection, test_rate_limit):
+        try:
+            check()
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {check.__doc__}: {e}")
+    sys.exit(1 if failures else 0)
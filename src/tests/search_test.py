@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Checks for the exact similarity search of search.py, and the party and
+year filters of index_store.DocumentIndex it is driven by, and the maximal
+marginal relevance re-ranking of its results.
+
+Runs offline on small synthetic matrices, with shards forced on:
+
+    cd src/tests
+    python search_test.py
+"""
+import sys
+import os
+
+import numpy as np
+
+# Add the parent directory to the Python path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import search
+from index_store import DocumentIndex
+
+
+def reference(matrix, query_vector, top_n, threshold, start=0, end=None, mask=None):
+    """Top rows of a stable sort over the whole matrix: highest score first, ties by row."""
+    end = matrix.shape[0] if end is None else end
+    scores = matrix @ query_vector
+    rows = np.arange(start, end)
+    rows = rows[scores[start:end] > threshold]
+    if mask is not None:
+        rows = rows[mask[rows]]
+    order = np.lexsort((rows, -scores[rows]))[:top_n]
+    return rows[order].tolist()
+
+
+def run(matrix, query_vector, top_n, threshold, shards, **filters):
+    """Search with the given number of shards (1 = a single pass)."""
+    saved = search.shard_count, search.SEARCH_SHARD_MIN_ROWS
+    search.shard_count, search.SEARCH_SHARD_MIN_ROWS = (lambda: shards), 1
+    try:
+        rows, _ = search.search(matrix, query_vector, top_n, threshold, **filters)
+        return rows.tolist()
+    finally:
+        search.shard_count, search.SEARCH_SHARD_MIN_ROWS = saved
+
+
+def test_sharded_ties():
+    """Sharded search returns the same rows in the same order as one pass, ties included"""
+    print("Testing sharded search against a single pass on ties...")
+    rng = np.random.default_rng(7)
+    checked = 0
+    for trial in range(200):
+        rows = int(rng.integers(20, 300))
+        # Few distinct values, so many rows tie at the top-k boundary of each shard
+        matrix = rng.integers(0, 3, (rows, 4)).astype(np.float32)
+        query_vector = np.ones(4, dtype=np.float32)
+        top_n = int(rng.integers(1, 25))
+        filters = {}
+        if trial % 3 == 1:
+            filters = {"start": rows // 4, "end": rows - rows // 5}
+        elif trial % 3 == 2:
+            filters = {"mask": rng.random(rows) < 0.6}
+        expected = reference(matrix, query_vector, top_n, 1.0, **filters)
+        for shards in (1, 2, 3, 7):
+            result = run(matrix, query_vector, top_n, 1.0, shards, **filters)
+            assert result == expected, f"{shards} shards, trial {trial}: {result} != {expected}"
+        checked += 1
+    print(f"✅ {checked} tie-heavy searches match across 1, 2, 3 and 7 shards")
+
+
+def make_document_index(rng):
+    """
+    A small multi-party corpus: Liberal and NDP pages are contiguous, while
+    Green pages sit at both ends, so that party needs a mask rather than a range.
+    """
+    layout = [("Green", 2021)] * 10 + [("Liberal", 2021)] * 40 + [("Liberal", 2025)] * 40 + [("NDP", 2025)] * 50 + [("Green", 2025)] * 10
+    entries = []
+    for row, (party, year) in enumerate(layout):
+        entries.append({
+            "page_num": row + 1,
+            "party": party,
+            "year": year,
+            "document": f"{party}-{year}.pdf",
+            "embedding": rng.integers(0, 3, 4).astype(np.float32).tolist(),
+        })
+    return DocumentIndex("test", entries, "platform.pdf")
+
+
+def test_filtered_search():
+    """Party and year filters only return matching pages, ranked as over the full matrix"""
+    print("\nTesting party and year filters...")
+    rng = np.random.default_rng(11)
+    index = make_document_index(rng)
+    assert "Green" in index.party_masks and "Liberal" in index.party_ranges, "unexpected row layout"
+    assert index.rows_for("Reform") == (0, 0, None) and index.rows_for(year=1999) == (0, 0, None), "unknown filter matched rows"
+
+    query_vector = rng.random(4).astype(np.float32)
+    query_vector /= np.linalg.norm(query_vector)
+    for party in (None, "Liberal", "NDP", "Green"):
+        for year in (None, 2021, 2025):
+            start, end, mask = index.rows_for(party, year)
+            expected = reference(index.matrix, query_vector, 15, -1.0, start, end, mask)
+            for shards in (1, 4):
+                rows = run(index.matrix, query_vector, 15, -1.0, shards, start=start, end=end, mask=mask)
+                assert rows == expected, f"{party}/{year}, {shards} shards: {rows} != {expected}"
+                for row in rows:
+                    doc = index.documents[row]
+                    assert party in (None, doc["party"]) and year in (None, doc["year"]), f"{party}/{year} returned {doc}"
+            matching = sum(party in (None, doc["party"]) and year in (None, doc["year"]) for doc in index.documents)
+            assert len(expected) == min(15, matching), f"{party}/{year}: {len(expected)} of {matching} matching pages"
+    print("✅ Every party/year combination returns only its own pages, in full-matrix order")
+
+
+def test_mmr():
+    """MMR skips a near-duplicate for a diverse page, and lambda 1 keeps similarity order"""
+    print("\nTesting maximal marginal relevance re-ranking...")
+    matrix = np.asarray([
+        [1.0, 0.2, 0.0],    # 0: best match
+        [0.99, 0.25, 0.0],  # 1: near-duplicate of row 0, nearly as similar
+        [0.5, 0.0, 0.8],    # 2: less similar, but says something else
+        [0.3, 0.9, 0.1],    # 3: barely relevant
+    ], dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    query_vector = np.asarray([1.0, 0.1, 0.4], dtype=np.float32)
+    query_vector /= np.linalg.norm(query_vector)
+    rows, similarities = search.search(matrix, query_vector, 4, -1.0)
+    assert rows.tolist() == [0, 1, 2, 3], f"unexpected similarity order: {rows.tolist()}"
+
+    picked, picked_similarities = search.mmr(matrix, rows, similarities, 3, 0.5)
+    assert picked.tolist()[:2] == [0, 2], f"near-duplicate not demoted: {picked.tolist()}"
+    assert np.allclose(picked_similarities, matrix[picked] @ query_vector), "similarities no longer match their rows"
+
+    picked, _ = search.mmr(matrix, rows, similarities, 4, 1.0)
+    assert picked.tolist() == rows.tolist(), f"lambda 1 changed the order: {picked.tolist()}"
+    picked, _ = search.mmr(matrix, rows, similarities, 10, 0.5)
+    assert sorted(picked.tolist()) == rows.tolist(), f"picks lost or repeated rows: {picked.tolist()}"
+    assert search.mmr(matrix, rows, similarities, 0, 0.5)[0].tolist() == [], "top_n 0 returned rows"
+    print(f"✅ Similarity order {rows.tolist()} re-ranked to {search.mmr(matrix, rows, similarities, 3, 0.5)[0].tolist()}")
+
+
+if __name__ == "__main__":
+    failures = 0
+    for check in (test_sharded_ties, test_filtered_search, test_mmr):
+        try:
+            check()
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {check.__doc__}: {e}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Checks for the typeahead suggestions of suggest.py.
+
+Runs offline on a small set of curated suggestions, without an index or
+precomputed answers:
+
+    cd src/tests
+    python suggest_test.py
+"""
+import sys
+import os
+
+# Add the parent directory to the Python path so we can import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from suggest import SuggestionIndex, PrefixIndex
+from config import DEFAULT_PARTY, SUGGEST_MIN_QUERY_COUNT
+
+QUESTIONS = [
+    "What is the plan for child care?",
+    "How will you fix the housing crisis?",
+]
+SECTIONS = [
+    {"party": DEFAULT_PARTY, "title": "Affordable housing"},
+    {"party": DEFAULT_PARTY, "title": "Climate action"},
+]
+PAGES = [
+    {"party": DEFAULT_PARTY, "key_phrases": ["housing supply", "clean energy"]},
+    {"party": DEFAULT_PARTY, "key_phrases": ["housing supply"]},
+]
+
+
+def make_index(asked=()):
+    """A suggestion index over the curated sources above, after the given questions were asked."""
+    index = SuggestionIndex()
+    for query in asked:
+        for _ in range(SUGGEST_MIN_QUERY_COUNT):
+            index.record_query(query)
+    counts = {canonical: index._asked[canonical] for canonical in index._promoted}
+    suggestions = SuggestionIndex._suggestions(DEFAULT_PARTY, SECTIONS, PAGES, QUESTIONS, counts)
+    index._indexes = {DEFAULT_PARTY: PrefixIndex(suggestions)}
+    # Serve this index as built; nothing in it depends on the published index
+    index._sources_key = lambda: None
+    return index
+
+
+def texts(index, prefix):
+    return [item["text"] for item in index.suggest(prefix)]
+
+
+def test_word_completion():
+    """A prefix completes any word of a suggestion, curated questions ranking first"""
+    print("Testing word completion...")
+    index = make_index()
+    results = texts(index, "hous")
+    assert "Affordable housing" in results, f"inner word not completed: {results}"
+    assert results == ["How will you fix the housing crisis?", "Affordable housing", "housing supply"], f"unexpected order: {results}"
+    assert texts(index, "Clim") == ["Climate action"], texts(index, "Clim")
+    print(f"✅ \"hous\" -> {results}")
+
+
+def test_question_shaped_prefix():
+    """A question typed around the topic completes from its last words"""
+    print("\nTesting question-shaped prefixes...")
+    index = make_index()
+    results = texts(index, "What is your plan for hou")
+    assert results == texts(index, "hou") and "Affordable housing" in results, f"no fallback: {results}"
+    results = texts(index, "tell me about affordable hous")
+    assert results[0] == "Affordable housing", f"longest trailing run not preferred: {results}"
+    assert texts(index, "What is the plan for chi") == ["What is the plan for child care?"]
+    assert texts(index, "What is your plan for xyzzy") == [], "unrelated prefix got suggestions"
+    print(f"✅ \"What is your plan for hou\" -> {texts(index, 'What is your plan for hou')}")
+
+
+def test_asked_queries_not_published():
+    """Frequently asked questions rank matching curated suggestions but never appear themselves"""
+    print("\nTesting that asked questions stay private...")
+    private = "my neighbour housing complaint at 12 elm street"
+    index = make_index(asked=[private, "climate action"])
+    for prefix in ("my neigh", "housing compl", "12 elm", "hous", "elm"):
+        assert private not in [text.lower() for text in texts(index, prefix)], f"asked query published for {prefix!r}"
+    assert texts(index, "c")[0] == "Climate action", f"asked curated suggestion not promoted: {texts(index, 'c')}"
+    print("✅ Asked questions only promote curated suggestions")
+
+
+if __name__ == "__main__":
+    failures = 0
+    for check in (test_word_completion, test_question_shaped_prefix, test_asked_queries_not_published):
+        try:
+            check()
+        except AssertionError as e:
+            failures += 1
+            print(f"❌ {check.__doc__}: {e}")
+    sys.exit(1 if failures else 0)
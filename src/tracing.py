@@ -0,0 +1,230 @@
+"""
+Per-request tracing and opt-in profiling.
+
+Every HTTP request gets a Trace, held in a context variable, with a trace
+ID and the timed spans of its stages (embedding, search, page text,
+analysis). The middleware returns the ID in X-Trace-Id and the span
+durations in a Server-Timing header, streaming endpoints add the timings
+to each event, and the log filter prefixes log lines with the ID.
+
+A request can also be profiled, either sampled (PROFILE_SAMPLE_RATE) or on
+request with an "X-Profile: 1" header when PROFILE_HEADER_ENABLED is set.
+A background thread samples the stacks of the threads working on the
+request and writes them in collapsed-stack format (one "frame;frame;frame
+count" line per stack), ready for flamegraph.pl or speedscope, to
+data/.profiles/<trace id>.folded.
+"""
+import contextvars
+import functools
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from index_store import DATA_DIR
+from config import PROFILE_SAMPLE_RATE, PROFILE_HEADER_ENABLED, PROFILE_INTERVAL
+
+PROFILE_DIR = os.path.join(DATA_DIR, ".profiles")
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    """Timed spans of one request."""
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.spans = []  # (name, start offset, duration) in seconds
+        self.active_threads = Counter()  # thread id -> number of open spans
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def record(self, name, start, duration):
+        with self._lock:
+            self.spans.append((name, start - self.start, duration))
+
+    def summary(self):
+        """Total milliseconds per span name, in order of first appearance."""
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for name, _, duration in spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return {name: round(total * 1000, 1) for name, total in totals.items()}
+
+    def server_timing(self):
+        """Value for the Server-Timing header."""
+        metrics = [f"{name};dur={ms}" for name, ms in self.summary().items()]
+        metrics.append(f"total;dur={round(self.elapsed() * 1000, 1)}")
+        return ", ".join(metrics)
+
+
+def current_trace():
+    """The trace of the request being handled, or None outside a request."""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name):
+    """Time a block of work as a span of the current trace (no-op outside a request)."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    thread_id = threading.get_ident()
+    with trace._lock:
+        trace.active_threads[thread_id] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.record(name, start, time.perf_counter() - start)
+        with trace._lock:
+            trace.active_threads[thread_id] -= 1
+            if trace.active_threads[thread_id] <= 0:
+                del trace.active_threads[thread_id]
+
+
+def traced(name):
+    """Decorator timing every call of a function as a span."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timing_fields():
+    """
+    Timing fields added to streamed events.
+
+    Returns:
+        dict: {"elapsed_ms", "spans"} for the current trace, or {} outside a request
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return {}
+    return {"elapsed_ms": round(trace.elapsed() * 1000, 1), "spans": trace.summary()}
+
+
+def run_in_context(executor, func, *args):
+    """Submit work to an executor so that its spans are recorded on the current trace."""
+    return executor.submit(contextvars.copy_context().run, func, *args)
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace ID (or "-") to log records as %(trace_id)s."""
+
+    def filter(self, record):
+        trace = _current_trace.get()
+        record.trace_id = trace.trace_id if trace is not None else "-"
+        return True
+
+
+class SamplingProfiler:
+    """Samples the stacks of the threads working on one trace."""
+
+    def __init__(self, trace, interval=PROFILE_INTERVAL):
+        self.trace = trace
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{trace.trace_id}", daemon=True)
+
+    def start(self):
+        # The thread running the request's event loop is always sampled
+        self._loop_thread = threading.get_ident()
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.trace._lock:
+                threads = set(self.trace.active_threads) | {self._loop_thread}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in threads:
+                    self.stacks[_collapse(frame)] += 1
+
+    def stop(self):
+        """Stop sampling and write the profile; returns its path, or None if nothing was sampled."""
+        self._stop.set()
+        self._thread.join()
+        if not self.stacks:
+            return None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{self.trace.trace_id}.folded")
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def _collapse(frame):
+    """One stack as "outer;...;inner" function names."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _should_profile(headers):
+    if PROFILE_HEADER_ENABLED and headers.get(b"x-profile", b"") in (b"1", b"true"):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware starting a Trace per HTTP request.
+
+    Adds X-Trace-Id to every response, and Server-Timing to responses whose
+    headers are sent after the work is done (everything but streams, which
+    carry timings in their events instead).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        incoming_id = headers.get(b"x-trace-id", b"").decode("latin-1")
+        trace = Trace(incoming_id if incoming_id.isalnum() and len(incoming_id) <= 64 else None)
+        token = _current_trace.set(trace)
+        profiler = SamplingProfiler(trace) if _should_profile(headers) else None
+        if profiler is not None:
+            profiler.start()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                response_headers = list(message.get("headers", []))
+                response_headers.append((b"x-trace-id", trace.trace_id.encode("latin-1")))
+                content_type = dict(response_headers).get(b"content-type", b"")
+                if not content_type.startswith(b"application/x-ndjson"):
+                    response_headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = dict(message, headers=response_headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            if profiler is not None:
+                path = profiler.stop()
+                if path:
+                    logging.getLogger(__name__).info(f"Profile for trace {trace.trace_id} written to {path}")